@@ -1,134 +1,545 @@
 """
 Azure OpenAI Client Utility
 Centralized module for all Azure OpenAI API calls with system role only.
+
+One AsyncAzureOpenAI client (with a shared httpx connection pool) is reused by
+every caller, and the AAD access token is cached until shortly before expiry.
+Identical concurrent requests share one in-flight call (SingleFlight).
+The transport is pluggable (see llm_backends): Azure, record or offline replay.
 """
 
 import os
+import time
+import asyncio
 import logging
-from typing import Optional, Dict, Any
-from azure.identity import CertificateCredential
-from openai import AzureOpenAI
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple, List, AsyncIterator, Union
+
+import httpx
+from azure.identity.aio import CertificateCredential
+from openai import AsyncAzureOpenAI
+
+import config
+from llm_cache import llm_cache, make_cache_key
+import llm_ledger
+from llm_ledger import LLMCall
+from llm_backends import (
+    LLMBackend, Completion, RecordingBackend, ReplayBackend, estimate_prompt_tokens, estimate_tokens
+)
 
 logger = logging.getLogger(__name__)
 
+TOKEN_SCOPE = "https://cognitiveservices.azure.com/.default"
+# Refresh the cached token this many seconds before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = int(os.environ.get("AZURE_TOKEN_REFRESH_MARGIN_SECONDS", "300"))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("AZURE_OPENAI_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("AZURE_OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+HTTP_TIMEOUT_SECONDS = float(os.environ.get("AZURE_OPENAI_TIMEOUT_SECONDS", "300"))
+
+
+class CachedTokenProvider:
+    """
+    Holds one certificate credential for the process and reuses its access
+    token until it is within the refresh margin of expiring.
+    """
+
+    def __init__(self, scope: str = TOKEN_SCOPE, refresh_margin: int = TOKEN_REFRESH_MARGIN_SECONDS):
+        self.scope = scope
+        self.refresh_margin = refresh_margin
+        self._credential: Optional[CertificateCredential] = None
+        self._token = None
+        self._lock = asyncio.Lock()
+
+    def _get_credential(self) -> CertificateCredential:
+        if self._credential is None:
+            dir_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+            cert_path = os.path.join(dir_path, "JPMC1||certs", "uatagent.azure.jpmchase.new.pem")
+            self._credential = CertificateCredential(
+                client_id=os.environ.get("AZURE_CLIENT_ID"),
+                certificate_path=cert_path,
+                tenant_id=os.environ.get("AZURE_TENANT_ID"),
+                logging_enable=False
+            )
+        return self._credential
+
+    def _is_fresh(self) -> bool:
+        return self._token is not None and self._token.expires_on - self.refresh_margin > time.time()
+
+    async def get_token(self) -> str:
+        if self._is_fresh():
+            return self._token.token
+        async with self._lock:
+            if not self._is_fresh():
+                self._token = await self._get_credential().get_token(self.scope)
+                logger.info("Azure access token retrieved successfully")
+            return self._token.token
+
+    async def close(self):
+        if self._credential is not None:
+            await self._credential.close()
+            self._credential = None
+        self._token = None
+
+
+class LLMConcurrencyLimiter:
+    """
+    Global gate on in-flight Azure OpenAI calls (MADL_MAX_CONCURRENT_AI_CALLS).
+    Callers beyond the limit queue here instead of piling onto Azure; the
+    queue depth and wait times are kept for the metrics endpoint.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = max(1, limit)
+        self._semaphore = asyncio.Semaphore(self.limit)
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.total_calls = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    @asynccontextmanager
+    async def slot(self):
+        """Hold one call slot; yields the time spent queued in milliseconds."""
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        queued_at = time.monotonic()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        wait_ms = (time.monotonic() - queued_at) * 1000
+        self.total_calls += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        self.in_flight += 1
+        try:
+            yield wait_ms
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.waiting,
+            "max_queue_depth": self.max_waiting,
+            "total_calls": self.total_calls,
+            "avg_queue_wait_ms": round(self.total_wait_ms / self.total_calls, 2) if self.total_calls else 0.0,
+            "max_queue_wait_ms": round(self.max_wait_ms, 2)
+        }
+
+
+class StreamFeed:
+    """
+    Text deltas of one shared streamed call. The call only collects them;
+    every caller replays them to its own sink with follow(), so a sink that
+    fails (client gone) affects that caller alone.
+    """
+
+    def __init__(self):
+        self.deltas: List[str] = []
+        self.closed = False
+        self._changed = asyncio.Condition()
+
+    async def push(self, delta: str):
+        self.deltas.append(delta)
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def close(self):
+        self.closed = True
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def follow(self, on_chunk: Callable[[str], Awaitable[None]]):
+        """Forward the deltas to on_chunk, one call per completed line, until the feed is closed"""
+        sent, pending = 0, ""
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: sent < len(self.deltas) or self.closed)
+            available = len(self.deltas)
+            pending += "".join(self.deltas[sent:available])
+            sent = available
+            if "\n" in pending:
+                flushed, pending = pending.rsplit("\n", 1)
+                await on_chunk(flushed + "\n")
+            if self.closed and sent == len(self.deltas):
+                break
+        if pending:
+            await on_chunk(pending)
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent requests: the first caller starts the
+    Azure call, later callers with the same key await the same task.
+    Callers only ever await the task through a shield, so one caller
+    disconnecting does not cancel it for the others. Per-caller output of a
+    streamed call goes through its StreamFeed, never through the task.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self._feeds: Dict[str, StreamFeed] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def is_in_flight(self, key: str) -> bool:
+        return key in self._calls
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            self._feeds.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every awaiter has gone
+
+    def join(
+        self,
+        key: str,
+        request: Callable[[], Awaitable[Any]],
+        feed: Optional[StreamFeed] = None
+    ) -> Tuple[asyncio.Task, Optional[StreamFeed], bool]:
+        """
+        Start the request (with feed, when it streams) or join the identical
+        one in flight. Returns its task, its feed and whether it was joined.
+        Synchronous, so no other caller can start a duplicate in between.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task, self._feeds.get(key), True
+        task = asyncio.ensure_future(request())
+        self._calls[key] = task
+        if feed is not None:
+            self._feeds[key] = feed
+        task.add_done_callback(lambda t: self._forget(key, t))
+        self.started += 1
+        return task, feed, False
+
+    async def do(self, key: str, request: Callable[[], Awaitable[Any]]) -> Any:
+        task, _, _ = self.join(key, request)
+        return await asyncio.shield(task)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "in_flight": len(self._calls),
+            "started": self.started,
+            "coalesced": self.coalesced
+        }
+
 
-def get_access_token() -> str:
+_token_provider = CachedTokenProvider()
+llm_limiter = LLMConcurrencyLimiter(config.MADL_MAX_CONCURRENT_AI_CALLS)
+single_flight = SingleFlight()
+_client: Optional[AsyncAzureOpenAI] = None
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+async def get_access_token() -> str:
     """
     Fetch Azure access token using certificate credentials.
-    Uses local certificate file for authentication.
+    Served from cache while the current token is still valid.
     """
     try:
-        dir_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
-        cert_path = os.path.join(dir_path, "JPMC1||certs", "uatagent.azure.jpmchase.new.pem")
-        
-        scope = "https://cognitiveservices.azure.com/.default"
-        credential = CertificateCredential(
-            client_id=os.environ.get("AZURE_CLIENT_ID"),
-            certificate_path=cert_path,
-            tenant_id=os.environ.get("AZURE_TENANT_ID"),
-            logging_enable=False
-        )
-        
-        access_token = credential.get_token(scope).token
-        logger.info("Azure access token retrieved successfully")
-        return access_token
+        return await _token_provider.get_token()
     except Exception as e:
         logger.error(f"Failed to get access token: {str(e)}")
         raise
 
 
-def get_azure_openai_client() -> AzureOpenAI:
+def get_azure_openai_client() -> AsyncAzureOpenAI:
     """
-    Initialize and return Azure OpenAI client with certificate-based authentication.
+    Return the process-wide Azure OpenAI client, creating it on first use.
+    The bearer token is attached per request (see _auth_headers).
     """
-    try:
-        access_token = get_access_token()
-        
-        client = AzureOpenAI(
-            api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
-            azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
-            api_version=os.environ.get("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
-            default_headers={
-                "Authorization": f"Bearer {access_token}",
-                "user_sid": "REPLACE"
-            }
+    global _client, _http_client
+    if _client is None:
+        try:
+            _http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_MAX_CONNECTIONS,
+                    max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS
+                ),
+                timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=30.0)
+            )
+            _client = AsyncAzureOpenAI(
+                api_key=os.environ.get("AZURE_OPENAI_API_KEY"),
+                azure_endpoint=os.environ.get("AZURE_OPENAI_ENDPOINT"),
+                api_version=os.environ.get("AZURE_OPENAI_API_VERSION", "2024-02-15-preview"),
+                default_headers={"user_sid": "REPLACE"},
+                http_client=_http_client
+            )
+            logger.info("Azure OpenAI client initialized")
+        except Exception as e:
+            logger.error(f"Failed to initialize Azure OpenAI client: {str(e)}")
+            raise
+    return _client
+
+
+async def close_azure_openai_client():
+    """Close the shared client, its connection pool and the credential (app shutdown)."""
+    global _client, _http_client
+    if _client is not None:
+        await _client.close()
+        _client = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+    await _token_provider.close()
+
+
+def get_llm_metrics() -> Dict[str, Any]:
+    """Snapshot of the LLM call limiter, response cache and request coalescing."""
+    return {
+        "backend": get_llm_backend().name,
+        "concurrency": llm_limiter.metrics(),
+        "cache": llm_cache.metrics(),
+        "single_flight": single_flight.metrics(),
+        "endpoints": llm_ledger.get_endpoint_totals()
+    }
+
+
+async def _auth_headers() -> Dict[str, str]:
+    return {"Authorization": f"Bearer {await get_access_token()}"}
+
+
+def _usage_tokens(usage) -> Tuple[int, int]:
+    if usage is None:
+        return 0, 0
+    return usage.prompt_tokens or 0, usage.completion_tokens or 0
+
+
+class AzureOpenAIBackend(LLMBackend):
+    """Chat completions against the shared Azure OpenAI client"""
+
+    name = "azure"
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: Optional[float] = None
+    ) -> Completion:
+        params = {"temperature": temperature} if temperature is not None else {}
+        response = await get_azure_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            extra_headers=await _auth_headers(),
+            **params
         )
-        return client
-    except Exception as e:
-        logger.error(f"Failed to initialize Azure OpenAI client: {str(e)}")
-        raise
+        prompt_tokens, completion_tokens = _usage_tokens(getattr(response, "usage", None))
+        return Completion(
+            text=response.choices[0].message.content,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens
+        )
+
+    async def stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: Optional[float] = None
+    ) -> AsyncIterator[Union[str, Completion]]:
+        params = {"temperature": temperature} if temperature is not None else {}
+        if config.LLM_STREAM_USAGE:
+            # Sent as raw body: the pinned SDK predates the stream_options argument
+            params["extra_body"] = {"stream_options": {"include_usage": True}}
+        stream = await get_azure_openai_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            stream=True,
+            extra_headers=await _auth_headers(),
+            **params
+        )
+        async for event in stream:
+            # Azure sends a leading event with only prompt filter results
+            if event.choices and event.choices[0].delta.content:
+                yield event.choices[0].delta.content
+            # With include_usage the last event has no choices, only the usage of the whole response
+            usage = getattr(event, "usage", None)
+            if usage:
+                prompt_tokens, completion_tokens = _usage_tokens(usage)
+                yield Completion(text="", prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+_backend: Optional[LLMBackend] = None
+
+
+def get_llm_backend() -> LLMBackend:
+    """Backend selected by LLM_BACKEND (azure, record or replay), created on first use"""
+    global _backend
+    if _backend is None:
+        mode = config.LLM_BACKEND.lower()
+        if mode == "replay":
+            _backend = ReplayBackend(
+                config.LLM_FIXTURES_DIR,
+                latency_ms=config.LLM_REPLAY_LATENCY_MS,
+                jitter_ms=config.LLM_REPLAY_JITTER_MS
+            )
+        elif mode == "record":
+            _backend = RecordingBackend(AzureOpenAIBackend(), config.LLM_FIXTURES_DIR)
+        else:
+            _backend = AzureOpenAIBackend()
+        logger.info(f"LLM backend: {_backend.name}")
+    return _backend
+
 
+def set_llm_backend(backend: Optional[LLMBackend]):
+    """Swap the backend at runtime (benchmarks); None re-reads LLM_BACKEND"""
+    global _backend
+    _backend = backend
 
-def call_openai_api(
+
+async def _complete(
+    key: str,
+    cache: Optional[str],
+    endpoint: Optional[str],
+    model: str,
+    request: Callable[[], Awaitable[Tuple[str, LLMCall]]],
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+    feed: Optional[StreamFeed] = None
+) -> str:
+    """
+    Serve from the opt-in cache, otherwise run the request once for all
+    concurrent callers with the same key. Every caller's outcome is recorded
+    in the LLM ledger. A streamed request pushes its deltas to feed; every
+    caller of a streamed call, leader or not, replays them to its own
+    on_chunk. Callers without a feed to follow (cache hit, or joining a call
+    that does not stream) get the whole text as one chunk.
+    """
+    label = endpoint or cache or "unlabelled"
+    started = time.monotonic()
+
+    if cache:
+        cached = await llm_cache.get(key, cache)
+        if cached is not None:
+            await llm_ledger.record_llm_call(LLMCall(
+                endpoint=label, model=model, cache_hit=True,
+                latency_ms=round((time.monotonic() - started) * 1000, 2)
+            ))
+            if on_chunk:
+                await on_chunk(cached)
+            return cached
+
+    async def request_and_store() -> Tuple[str, LLMCall]:
+        content, call = await request()
+        if cache and content:
+            await llm_cache.put(key, content)
+        return content, call
+
+    task, shared_feed, joined = single_flight.join(key, request_and_store, feed)
+    if on_chunk and shared_feed:
+        # Runs in this caller only: a failing sink leaves the shared call to the others
+        await shared_feed.follow(on_chunk)
+    content, call = await asyncio.shield(task)
+    if joined:
+        call = LLMCall(
+            endpoint=label, model=model, coalesced=True,
+            latency_ms=round((time.monotonic() - started) * 1000, 2)
+        )
+        if on_chunk and not shared_feed:
+            await on_chunk(content)
+    else:
+        call.endpoint = label
+    await llm_ledger.record_llm_call(call)
+    return content
+
+
+def _system_message(system_message: Optional[str]) -> str:
+    return system_message or "You are a helpful assistant. Respond with only valid output, no explanations."
+
+
+async def call_openai_api(
     prompt: str,
     max_tokens: int = 2000,
     temperature: float = 0.7,
-    system_message: Optional[str] = None
+    system_message: Optional[str] = None,
+    cache: Optional[str] = None,
+    endpoint: Optional[str] = None
 ) -> str:
     """
     Call Azure OpenAI API with system role only.
-    
+
     Args:
         prompt: The user prompt/question
         max_tokens: Maximum tokens in response
         temperature: Temperature for response generation
         system_message: System role message (optional)
-    
+        cache: Endpoint name to cache the response under (opt-in, None = no caching)
+        endpoint: Label for the usage ledger (defaults to the cache name)
+
     Returns:
         Text response from the model
     """
     try:
-        client = get_azure_openai_client()
-        
         messages = [
             {
                 "role": "system",
-                "content": system_message or "You are a helpful assistant. Respond with only valid output, no explanations."
+                "content": _system_message(system_message)
             },
             {
                 "role": "user",
                 "content": prompt
             }
         ]
-        
-        response = client.chat.completions.create(
-            model=os.environ.get("AZURE_OPENAI_MODEL", "gpt-4"),
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature
-        )
-        
-        return response.choices[0].message.content.strip()
+
+        model = os.environ.get("AZURE_OPENAI_MODEL", "gpt-4")
+
+        async def request() -> Tuple[str, LLMCall]:
+            async with llm_limiter.slot() as wait_ms:
+                started = time.monotonic()
+                completion = await get_llm_backend().complete(model, messages, max_tokens, temperature)
+                latency_ms = (time.monotonic() - started) * 1000
+            return completion.text.strip(), LLMCall(
+                endpoint="", model=model,
+                prompt_tokens=completion.prompt_tokens, completion_tokens=completion.completion_tokens,
+                queue_wait_ms=round(wait_ms, 2), latency_ms=round(latency_ms, 2)
+            )
+
+        key = make_cache_key(model, messages[0]["content"], prompt, temperature, max_tokens)
+        return await _complete(key, cache, endpoint, model, request)
     except Exception as e:
         logger.error(f"Azure OpenAI API call failed: {str(e)}")
         raise
 
 
-def call_openai_with_images(
+async def call_openai_with_images(
     prompt: str,
     image_b64: Optional[str] = None,
     max_tokens: int = 2000,
-    system_message: Optional[str] = None
+    system_message: Optional[str] = None,
+    cache: Optional[str] = None,
+    image_mime: str = "image/png",
+    endpoint: Optional[str] = None
 ) -> str:
     """
     Call Azure OpenAI API with image support (Vision).
-    
+
     Args:
         prompt: The user prompt
         image_b64: Base64 encoded image data
         max_tokens: Maximum tokens in response
         system_message: System role message
-    
+        cache: Endpoint name to cache the response under (opt-in, None = no caching)
+        image_mime: MIME type of image_b64 (e.g. image/jpeg after preprocessing)
+        endpoint: Label for the usage ledger (defaults to the cache name)
+
     Returns:
         Text response from the model
     """
     try:
-        client = get_azure_openai_client()
-        
         messages = [
             {
                 "role": "system",
-                "content": system_message or "You are a helpful assistant. Respond with only valid output, no explanations."
+                "content": _system_message(system_message)
             },
             {
                 "role": "user",
@@ -137,23 +548,97 @@ def call_openai_with_images(
                 ]
             }
         ]
-        
+
         # Add image if provided
         if image_b64:
             messages[1]["content"].append({
                 "type": "image_url",
                 "image_url": {
-                    "url": f"data:image/png;base64,{image_b64}"
+                    "url": f"data:{image_mime};base64,{image_b64}"
                 }
             })
-        
-        response = client.chat.completions.create(
-            model=os.environ.get("AZURE_OPENAI_MODEL", "gpt-4-vision"),
-            messages=messages,
-            max_tokens=max_tokens
-        )
-        
-        return response.choices[0].message.content.strip()
+
+        model = os.environ.get("AZURE_OPENAI_MODEL", "gpt-4-vision")
+
+        async def request() -> Tuple[str, LLMCall]:
+            async with llm_limiter.slot() as wait_ms:
+                started = time.monotonic()
+                completion = await get_llm_backend().complete(model, messages, max_tokens)
+                latency_ms = (time.monotonic() - started) * 1000
+            return completion.text.strip(), LLMCall(
+                endpoint="", model=model,
+                prompt_tokens=completion.prompt_tokens, completion_tokens=completion.completion_tokens,
+                queue_wait_ms=round(wait_ms, 2), latency_ms=round(latency_ms, 2)
+            )
+
+        key = make_cache_key(model, messages[0]["content"], prompt, None, max_tokens, image_b64)
+        return await _complete(key, cache, endpoint, model, request)
     except Exception as e:
         logger.error(f"Azure OpenAI API call with images failed: {str(e)}")
         raise
+
+
+async def stream_openai_api(
+    prompt: str,
+    on_chunk: Callable[[str], Awaitable[None]],
+    max_tokens: int = 2000,
+    temperature: float = 0.7,
+    system_message: Optional[str] = None,
+    cache: Optional[str] = None,
+    endpoint: Optional[str] = None
+) -> str:
+    """
+    Same as call_openai_api, but requests a streamed completion and forwards
+    the partial text to on_chunk (one call per completed line) as it arrives.
+    Callers joining an identical streamed request in flight receive the same
+    lines from the start; cache hits receive the whole text as one chunk.
+
+    Returns:
+        The full text response, stripped
+    """
+    try:
+        messages = [
+            {
+                "role": "system",
+                "content": _system_message(system_message)
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+
+        model = os.environ.get("AZURE_OPENAI_MODEL", "gpt-4")
+
+        feed = StreamFeed()
+
+        async def request() -> Tuple[str, LLMCall]:
+            usage = None
+            try:
+                async with llm_limiter.slot() as wait_ms:
+                    started = time.monotonic()
+                    async for delta in get_llm_backend().stream(model, messages, max_tokens, temperature):
+                        if isinstance(delta, Completion):
+                            usage = delta
+                        else:
+                            await feed.push(delta)
+                    latency_ms = (time.monotonic() - started) * 1000
+            finally:
+                await feed.close()
+            text = "".join(feed.deltas)
+            if usage is None:
+                # API version without stream usage: count the tokens ourselves
+                usage = Completion(
+                    text="", prompt_tokens=estimate_prompt_tokens(messages), completion_tokens=estimate_tokens(text)
+                )
+            return text.strip(), LLMCall(
+                endpoint="", model=model,
+                prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens,
+                queue_wait_ms=round(wait_ms, 2), latency_ms=round(latency_ms, 2)
+            )
+
+        key = make_cache_key(model, messages[0]["content"], prompt, temperature, max_tokens)
+        return await _complete(key, cache, endpoint, model, request, on_chunk=on_chunk, feed=feed)
+    except Exception as e:
+        logger.error(f"Azure OpenAI streaming call failed: {str(e)}")
+        raise
@@ -1,6 +1,7 @@
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import tempfile
 
 # Load .env from project root/app folder
 env_path = Path(__file__).resolve().parent / ".env"
@@ -51,6 +52,16 @@ QDRANT_SIMILARITY_THRESHOLD = 0.6
 # MADL Configuration
 MADL_ENABLE_FILE_WRITING = os.getenv("MADL_ENABLE_FILE_WRITING", "true").lower() == "true"
 MADL_AI_CACHE_SIZE = int(os.getenv("MADL_AI_CACHE_SIZE", "1000"))
+# Optional SQLite file backing the LLM response cache (empty = memory only)
+LLM_CACHE_DB_PATH = os.getenv("LLM_CACHE_DB_PATH", "")
+
+# LLM backend: azure | record (azure + save fixtures) | replay (fixtures only, offline)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "azure")
+LLM_FIXTURES_DIR = os.getenv("LLM_FIXTURES_DIR", str(Path(__file__).resolve().parent / "llm_fixtures"))
+LLM_REPLAY_LATENCY_MS = int(os.getenv("LLM_REPLAY_LATENCY_MS", "0"))
+LLM_REPLAY_JITTER_MS = int(os.getenv("LLM_REPLAY_JITTER_MS", "0"))
+# Ask for a usage block on streamed completions (API versions without it fall back to an estimate)
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "true").lower() == "true"
 MADL_MAX_CONCURRENT_FILES = int(os.getenv("MADL_MAX_CONCURRENT_FILES", "5"))
 MADL_MAX_CONCURRENT_AI_CALLS = int(os.getenv("MADL_MAX_CONCURRENT_AI_CALLS", "3"))
 MADL_MAX_FILE_SIZE_MB = int(os.getenv("MADL_MAX_FILE_SIZE_MB", "5"))
@@ -67,5 +78,62 @@ MADL_TIMEOUT = 30
 MADL_ENABLED = os.getenv("MADL_ENABLED", "true").lower() == "true"
 
 # Execution Configuration
-EXECUTION_TIMEOUT = 300
+# Websocket log frames: script output lines are coalesced per interval / line count
+LOG_FRAME_INTERVAL_MS = int(os.getenv("LOG_FRAME_INTERVAL_MS", "100"))
+LOG_FRAME_MAX_LINES = int(os.getenv("LOG_FRAME_MAX_LINES", "200"))
+LOG_FRAME_MAX_PENDING = int(os.getenv("LOG_FRAME_MAX_PENDING", "5000"))  # lines buffered before the script is held back
+EXECUTION_TIMEOUT = int(os.getenv("EXECUTION_TIMEOUT", "300"))  # wall-clock seconds per script run; 0 disables
+# rlimits of script processes and the browsers they start (per process); 0 disables
+EXECUTION_CPU_LIMIT_SECONDS = int(os.getenv("EXECUTION_CPU_LIMIT_SECONDS", "300"))
+# Off by default: Chromium reserves far more address space than it uses
+EXECUTION_MEMORY_LIMIT_MB = int(os.getenv("EXECUTION_MEMORY_LIMIT_MB", "0"))
+# Per-execution working directories; the files a run leaves there go to the artifact store
+EXECUTION_WORKDIR_ROOT = os.getenv("EXECUTION_WORKDIR_ROOT", os.path.join(tempfile.gettempdir(), "executions"))
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(20 * 1024 * 1024)))  # larger files are not kept
+ARTIFACT_RETENTION_DAYS = int(os.getenv("ARTIFACT_RETENTION_DAYS", "30"))
+ARTIFACT_GC_INTERVAL_HOURS = float(os.getenv("ARTIFACT_GC_INTERVAL_HOURS", "6"))
+ARTIFACT_GC_GRACE_HOURS = int(os.getenv("ARTIFACT_GC_GRACE_HOURS", "24"))  # unlinked blobs kept this long
+RUN_PLANNER_MAX_WORKERS = int(os.getenv("RUN_PLANNER_MAX_WORKERS", "4"))
+# POST /runs: test cases executing at once across all suite runs, and per project
+RUNS_MAX_CONCURRENCY = int(os.getenv("RUNS_MAX_CONCURRENCY", "8"))
+RUNS_PROJECT_CONCURRENCY = int(os.getenv("RUNS_PROJECT_CONCURRENCY", "4"))
+# A run whose API instance stops renewing it for this long is marked interrupted
+RUNS_LEASE_SECONDS = int(os.getenv("RUNS_LEASE_SECONDS", "60"))
+# Warm worker processes (Playwright imported, Chromium launched) that run scripts; 0 disables
+WORKER_POOL_SIZE = int(os.getenv("WORKER_POOL_SIZE", "2"))
+WORKER_MAX_JOBS = int(os.getenv("WORKER_MAX_JOBS", "50"))  # scripts per worker before it is replaced
+WORKER_HEADLESS = os.getenv("WORKER_HEADLESS", "true").lower() == "true"
+# Keyword-driven runs share one browser as isolated contexts
+CONTEXT_HOST_ENABLED = os.getenv("CONTEXT_HOST_ENABLED", "true").lower() == "true"
+CONTEXT_HOST_MAX_CONTEXTS = int(os.getenv("CONTEXT_HOST_MAX_CONTEXTS", "10"))  # open contexts per browser
+CONTEXT_HOST_RECYCLE_RUNS = int(os.getenv("CONTEXT_HOST_RECYCLE_RUNS", "100"))  # runs before a fresh browser
+# Durable execution queue: scripts run on separate worker nodes (python -m app.worker)
+EXECUTION_QUEUE_ENABLED = os.getenv("EXECUTION_QUEUE_ENABLED", "false").lower() == "true"
+EXECUTION_QUEUE_LEASE_SECONDS = int(os.getenv("EXECUTION_QUEUE_LEASE_SECONDS", "30"))
+EXECUTION_QUEUE_MAX_ATTEMPTS = int(os.getenv("EXECUTION_QUEUE_MAX_ATTEMPTS", "3"))  # claims before a job fails
+EXECUTION_QUEUE_POLL_SECONDS = float(os.getenv("EXECUTION_QUEUE_POLL_SECONDS", "2"))
+EXECUTION_QUEUE_CLAIM_TIMEOUT = int(os.getenv("EXECUTION_QUEUE_CLAIM_TIMEOUT", "300"))  # wait for a worker node
+# Finished queue jobs and their log lines are deleted by the artifact GC after this long
+EXECUTION_JOB_RETENTION_HOURS = int(os.getenv("EXECUTION_JOB_RETENTION_HOURS", "24"))
+WORKER_NODE_ID = os.getenv("WORKER_NODE_ID", "")  # default: hostname-pid
+WORKER_NODE_CONCURRENCY = int(os.getenv("WORKER_NODE_CONCURRENCY", "2"))
+# Assemble scripts from cached per-step snippets (LLM only for unseen steps)
+STEP_ASSEMBLY_ENABLED = os.getenv("STEP_ASSEMBLY_ENABLED", "true").lower() == "true"
+# Minimum MADL similarity for reusing another step's snippet (same normalized text always matches)
+STEP_SEMANTIC_MIN_SCORE = float(os.getenv("STEP_SEMANTIC_MIN_SCORE", "0.92"))
+# Run Playwright plans through registered step actions (LLM only for unmapped steps)
+KEYWORD_EXECUTOR_ENABLED = os.getenv("KEYWORD_EXECUTOR_ENABLED", "true").lower() == "true"
+
+# Prompt budget (input tokens) per batched normalization chunk
+NORMALIZE_CHUNK_TOKENS = int(os.getenv("NORMALIZE_CHUNK_TOKENS", "1500"))
+
+# Self-healing prompt budget for the distilled DOM snapshot
+DOM_DISTILL_MAX_TOKENS = int(os.getenv("DOM_DISTILL_MAX_TOKENS", "3000"))
+
+# Screenshot preprocessing for vision healing calls
+SCREENSHOT_MAX_EDGE = int(os.getenv("SCREENSHOT_MAX_EDGE", "1280"))
+SCREENSHOT_FORMAT = os.getenv("SCREENSHOT_FORMAT", "JPEG")  # JPEG or WEBP
+SCREENSHOT_QUALITY = int(os.getenv("SCREENSHOT_QUALITY", "70"))
+SCREENSHOT_CROP_PADDING = int(os.getenv("SCREENSHOT_CROP_PADDING", "200"))
+SCREENSHOT_DEDUPE_DISTANCE = int(os.getenv("SCREENSHOT_DEDUPE_DISTANCE", "4"))
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
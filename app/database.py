@@ -20,3 +20,149 @@ async def get_db_connection():
 async def release_db_connection(conn):
     if pool and conn:
         await pool.release(conn)
+
+# Idempotent DDL for tables/columns added after the original schema (see README)
+SCHEMA_STATEMENTS = [
+    """
+    CREATE TABLE IF NOT EXISTS llm_call (
+        id BIGSERIAL PRIMARY KEY,
+        exeid TEXT,
+        testcaseid TEXT,
+        endpoint TEXT NOT NULL,
+        model TEXT,
+        prompt_tokens INTEGER DEFAULT 0,
+        completion_tokens INTEGER DEFAULT 0,
+        queue_wait_ms DOUBLE PRECISION DEFAULT 0,
+        latency_ms DOUBLE PRECISION DEFAULT 0,
+        cache_hit BOOLEAN DEFAULT FALSE,
+        coalesced BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_llm_call_testcaseid ON llm_call (testcaseid)",
+    "CREATE INDEX IF NOT EXISTS idx_llm_call_exeid ON llm_call (exeid)",
+    "ALTER TABLE execution ADD COLUMN IF NOT EXISTS llm_calls INTEGER DEFAULT 0",
+    "ALTER TABLE execution ADD COLUMN IF NOT EXISTS llm_prompt_tokens INTEGER DEFAULT 0",
+    "ALTER TABLE execution ADD COLUMN IF NOT EXISTS llm_completion_tokens INTEGER DEFAULT 0",
+    "ALTER TABLE execution ADD COLUMN IF NOT EXISTS llm_latency_ms DOUBLE PRECISION DEFAULT 0",
+    """
+    CREATE TABLE IF NOT EXISTS generated_script (
+        scriptid SERIAL PRIMARY KEY,
+        plan_hash TEXT NOT NULL,
+        testcaseid TEXT,
+        scripttype TEXT,
+        prompt_version TEXT,
+        script TEXT NOT NULL,
+        healed_from INTEGER,
+        last_status TEXT,
+        pass_count INTEGER DEFAULT 0,
+        fail_count INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT NOW(),
+        last_used_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_generated_script_hash ON generated_script (plan_hash, scriptid DESC)",
+    "ALTER TABLE execution ADD COLUMN IF NOT EXISTS scriptid INTEGER",
+    "ALTER TABLE execution ADD COLUMN IF NOT EXISTS script_reused BOOLEAN DEFAULT FALSE",
+    """
+    CREATE TABLE IF NOT EXISTS step_snippet (
+        step_key TEXT PRIMARY KEY,
+        scripttype TEXT NOT NULL,
+        step_text TEXT NOT NULL,
+        arg TEXT,
+        snippet_code TEXT NOT NULL,
+        testcaseid TEXT,
+        hits INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT NOW(),
+        updated_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS suite_run (
+        runid TEXT PRIMARY KEY,
+        userid TEXT,
+        scripttype TEXT,
+        selector JSONB,
+        status TEXT NOT NULL,
+        total INTEGER DEFAULT 0,
+        passed INTEGER DEFAULT 0,
+        failed INTEGER DEFAULT 0,
+        skipped INTEGER DEFAULT 0,
+        summary JSONB,
+        created_at TIMESTAMP DEFAULT NOW(),
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS suite_run_case (
+        runid TEXT NOT NULL,
+        testcaseid TEXT NOT NULL,
+        projectid TEXT,
+        status TEXT NOT NULL,
+        message TEXT,
+        exeid TEXT,
+        duration_ms DOUBLE PRECISION,
+        PRIMARY KEY (runid, testcaseid)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS execution_job (
+        jobid TEXT PRIMARY KEY,
+        script TEXT NOT NULL,
+        status TEXT NOT NULL,
+        workerid TEXT,
+        attempts INTEGER DEFAULT 0,
+        lease_until TIMESTAMP,
+        return_code INTEGER,
+        output TEXT,
+        stdout TEXT,
+        stderr TEXT,
+        created_at TIMESTAMP DEFAULT NOW(),
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_execution_job_claim ON execution_job (status, created_at)",
+    """
+    CREATE TABLE IF NOT EXISTS execution_job_log (
+        seq BIGSERIAL PRIMARY KEY,
+        jobid TEXT NOT NULL,
+        line TEXT NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_execution_job_log_jobid ON execution_job_log (jobid, seq)",
+    "ALTER TABLE execution ADD COLUMN IF NOT EXISTS termination TEXT",
+    "ALTER TABLE execution_job ADD COLUMN IF NOT EXISTS termination TEXT",
+    """
+    CREATE TABLE IF NOT EXISTS artifact_blob (
+        digest TEXT PRIMARY KEY,
+        media_type TEXT NOT NULL,
+        size_bytes BIGINT NOT NULL,
+        stored_bytes BIGINT NOT NULL,
+        compressed BOOLEAN NOT NULL,
+        content BYTEA NOT NULL,
+        created_at TIMESTAMP DEFAULT NOW(),
+        last_seen_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS execution_artifact (
+        id BIGSERIAL PRIMARY KEY,
+        exeid TEXT,
+        name TEXT NOT NULL,
+        digest TEXT NOT NULL REFERENCES artifact_blob (digest),
+        created_at TIMESTAMP DEFAULT NOW()
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_execution_artifact_exeid ON execution_artifact (exeid)",
+    "CREATE INDEX IF NOT EXISTS idx_execution_artifact_digest ON execution_artifact (digest)",
+    "ALTER TABLE execution_job ADD COLUMN IF NOT EXISTS artifacts JSONB",
+    "ALTER TABLE suite_run ADD COLUMN IF NOT EXISTS owner TEXT",
+    "ALTER TABLE suite_run ADD COLUMN IF NOT EXISTS lease_until TIMESTAMP",
+]
+
+async def ensure_schema():
+    async with pool.acquire() as conn:
+        for statement in SCHEMA_STATEMENTS:
+            await conn.execute(statement)
@@ -0,0 +1,223 @@
+"""
+LLM Backends
+The transport behind azure_openai_client. Besides Azure OpenAI, a local
+stand-in records completions to fixture files keyed by a hash of the request
+and replays them with configurable synthetic latency, so the execution,
+normalization and healing pipelines can be exercised and load-tested
+without an Azure endpoint or certificate.
+
+LLM_BACKEND=azure   -> Azure OpenAI (default)
+LLM_BACKEND=record  -> Azure OpenAI, every completion saved under LLM_FIXTURES_DIR
+LLM_BACKEND=replay  -> fixtures only, no network
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Dict, List, Optional, Union
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken missing: token counts are estimated from the text length
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Used by the replay backend when no fixture matches the request
+DEFAULT_FIXTURE_NAME = "default.json"
+# Replayed streams are emitted in this many pieces
+REPLAY_STREAM_PIECES = 20
+CHARS_PER_TOKEN = 4  # rough ratio when tiktoken is not available
+
+
+@dataclass
+class Completion:
+    """Text plus token usage of one chat completion"""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+_encoding = None
+
+
+def estimate_tokens(text: str) -> int:
+    """Token count of text with the cl100k_base encoding, or a length-based estimate"""
+    global _encoding
+    if not text:
+        return 0
+    if tiktoken is not None:
+        try:
+            if _encoding is None:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+            return len(_encoding.encode(text))
+        except Exception as e:  # encoding files unavailable (offline)
+            logger.debug(f"tiktoken unavailable, estimating tokens: {str(e)}")
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def estimate_prompt_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Estimated prompt tokens of the text parts of messages (images are not counted)"""
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if part.get("type") == "text")
+        total += estimate_tokens(content or "")
+    return total
+
+
+class LLMBackend:
+    """
+    Interface: one chat completion, whole or streamed. A stream yields text
+    deltas, optionally followed by one Completion (empty text) carrying the
+    token usage of the whole response.
+    """
+
+    name = "base"
+
+    async def complete(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: Optional[float] = None
+    ) -> Completion:
+        raise NotImplementedError
+
+    async def stream(
+        self,
+        model: str,
+        messages: List[Dict[str, Any]],
+        max_tokens: int,
+        temperature: Optional[float] = None
+    ) -> AsyncIterator[Union[str, Completion]]:
+        raise NotImplementedError
+        yield  # pragma: no cover - makes this an async generator
+
+    async def close(self):
+        pass
+
+
+def fixture_key(
+    model: str,
+    messages: List[Dict[str, Any]],
+    max_tokens: int,
+    temperature: Optional[float]
+) -> str:
+    """sha256 of the request; also the fixture file name"""
+    payload = {"model": model, "messages": messages, "max_tokens": max_tokens, "temperature": temperature}
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def _fixture_path(fixtures_dir: str, key: str) -> str:
+    return os.path.join(fixtures_dir, f"{key}.json")
+
+
+class RecordingBackend(LLMBackend):
+    """Delegates to another backend and saves each completion as a fixture"""
+
+    name = "record"
+
+    def __init__(self, inner: LLMBackend, fixtures_dir: str):
+        self.inner = inner
+        self.fixtures_dir = fixtures_dir
+
+    def _write(self, key: str, model: str, messages, completion: Completion):
+        os.makedirs(self.fixtures_dir, exist_ok=True)
+        with open(_fixture_path(self.fixtures_dir, key), "w", encoding="utf-8") as f:
+            json.dump({
+                "model": model,
+                "messages": messages,
+                "response": completion.text,
+                "prompt_tokens": completion.prompt_tokens,
+                "completion_tokens": completion.completion_tokens
+            }, f, indent=2)
+
+    async def _save(self, model, messages, max_tokens, temperature, completion: Completion):
+        key = fixture_key(model, messages, max_tokens, temperature)
+        try:
+            await asyncio.to_thread(self._write, key, model, messages, completion)
+        except Exception as e:
+            logger.warning(f"Failed to record LLM fixture {key}: {str(e)}")
+
+    async def complete(self, model, messages, max_tokens, temperature=None) -> Completion:
+        completion = await self.inner.complete(model, messages, max_tokens, temperature)
+        await self._save(model, messages, max_tokens, temperature, completion)
+        return completion
+
+    async def stream(self, model, messages, max_tokens, temperature=None) -> AsyncIterator[Union[str, Completion]]:
+        parts = []
+        usage = None
+        async for delta in self.inner.stream(model, messages, max_tokens, temperature):
+            if isinstance(delta, Completion):
+                usage = delta
+            else:
+                parts.append(delta)
+            yield delta
+        text = "".join(parts)
+        await self._save(model, messages, max_tokens, temperature, Completion(
+            text=text,
+            prompt_tokens=usage.prompt_tokens if usage else estimate_prompt_tokens(messages),
+            completion_tokens=usage.completion_tokens if usage else estimate_tokens(text)
+        ))
+
+    async def close(self):
+        await self.inner.close()
+
+
+class ReplayBackend(LLMBackend):
+    """
+    Serves completions from fixture files, never touching the network.
+    Latency is latency_ms plus a jitter derived from the request hash, so
+    runs are reproducible.
+    """
+
+    name = "replay"
+
+    def __init__(self, fixtures_dir: str, latency_ms: int = 0, jitter_ms: int = 0):
+        self.fixtures_dir = fixtures_dir
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+
+    def _read(self, key: str) -> Dict[str, Any]:
+        for path in (_fixture_path(self.fixtures_dir, key), os.path.join(self.fixtures_dir, DEFAULT_FIXTURE_NAME)):
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    return json.load(f)
+        raise LookupError(f"No LLM fixture for request {key} in {self.fixtures_dir}")
+
+    def _delay_seconds(self, key: str) -> float:
+        jitter = int(key[:8], 16) % (self.jitter_ms + 1) if self.jitter_ms else 0
+        return (self.latency_ms + jitter) / 1000
+
+    async def _load(self, model, messages, max_tokens, temperature):
+        key = fixture_key(model, messages, max_tokens, temperature)
+        return key, await asyncio.to_thread(self._read, key)
+
+    async def complete(self, model, messages, max_tokens, temperature=None) -> Completion:
+        key, fixture = await self._load(model, messages, max_tokens, temperature)
+        await asyncio.sleep(self._delay_seconds(key))
+        return Completion(
+            text=fixture["response"],
+            prompt_tokens=fixture.get("prompt_tokens", 0),
+            completion_tokens=fixture.get("completion_tokens", 0)
+        )
+
+    async def stream(self, model, messages, max_tokens, temperature=None) -> AsyncIterator[Union[str, Completion]]:
+        key, fixture = await self._load(model, messages, max_tokens, temperature)
+        text = fixture["response"]
+        piece = max(1, -(-len(text) // REPLAY_STREAM_PIECES))
+        pause = self._delay_seconds(key) / REPLAY_STREAM_PIECES
+        for start in range(0, len(text), piece):
+            await asyncio.sleep(pause)
+            yield text[start:start + piece]
+        if fixture.get("prompt_tokens") or fixture.get("completion_tokens"):
+            yield Completion(
+                text="",
+                prompt_tokens=fixture.get("prompt_tokens", 0),
+                completion_tokens=fixture.get("completion_tokens", 0)
+            )
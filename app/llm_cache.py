@@ -0,0 +1,152 @@
+"""
+LLM Response Cache
+Answers repeated prompts (same plan regenerated, same steps re-normalized)
+without calling Azure. Entries live in an in-memory LRU bounded by
+MADL_AI_CACHE_SIZE, optionally backed by a SQLite file (LLM_CACHE_DB_PATH)
+so they survive restarts.
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import config
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    model: str,
+    system_message: Optional[str],
+    prompt: str,
+    temperature: Optional[float],
+    max_tokens: int,
+    image_b64: Optional[str] = None
+) -> str:
+    """sha256 over everything that changes the completion"""
+    payload = {
+        "model": model,
+        "system": system_message,
+        "prompt": prompt,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "image": hashlib.sha256(image_b64.encode("utf-8")).hexdigest() if image_b64 else None
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Two-tier cache: OrderedDict LRU in front of an optional SQLite table.
+    Hit/miss counters are kept overall and per endpoint name.
+    """
+
+    def __init__(self, max_entries: int, db_path: Optional[str] = None):
+        self.max_entries = max(0, max_entries)
+        self.db_path = db_path or None
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.endpoints: Dict[str, Dict[str, int]] = {}
+
+    # ---------- SQLite tier (runs in a worker thread) ----------
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.commit()
+        return self._db
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        with self._db_lock:
+            row = self._connect().execute("SELECT response FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _disk_put(self, key: str, response: str):
+        with self._db_lock:
+            db = self._connect()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, created_at) VALUES (?, ?, ?)",
+                (key, response, time.time())
+            )
+            db.commit()
+
+    # ---------- Public API ----------
+
+    def _remember(self, key: str, response: str):
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _count(self, endpoint: str, outcome: str):
+        counters = self.endpoints.setdefault(endpoint, {"hits": 0, "misses": 0})
+        counters[outcome] += 1
+
+    async def get(self, key: str, endpoint: str) -> Optional[str]:
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.memory_hits += 1
+            self._count(endpoint, "hits")
+            return self._entries[key]
+
+        if self.db_path:
+            try:
+                response = await asyncio.to_thread(self._disk_get, key)
+            except Exception as e:
+                logger.warning(f"LLM cache read failed: {str(e)}")
+                response = None
+            if response is not None:
+                self._remember(key, response)
+                self.disk_hits += 1
+                self._count(endpoint, "hits")
+                return response
+
+        self.misses += 1
+        self._count(endpoint, "misses")
+        return None
+
+    async def put(self, key: str, response: str):
+        self._remember(key, response)
+        if self.db_path:
+            try:
+                await asyncio.to_thread(self._disk_put, key, response)
+            except Exception as e:
+                logger.warning(f"LLM cache write failed: {str(e)}")
+
+    def metrics(self) -> Dict[str, Any]:
+        hits = self.memory_hits + self.disk_hits
+        lookups = hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "persistent": bool(self.db_path),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "endpoints": {
+                name: {
+                    **counters,
+                    "hit_rate": round(counters["hits"] / (counters["hits"] + counters["misses"]), 4)
+                    if counters["hits"] + counters["misses"] else 0.0
+                }
+                for name, counters in self.endpoints.items()
+            }
+        }
+
+
+llm_cache = LLMResponseCache(config.MADL_AI_CACHE_SIZE, config.LLM_CACHE_DB_PATH)
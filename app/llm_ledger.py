@@ -0,0 +1,144 @@
+"""
+LLM Usage Ledger
+Records endpoint, model, tokens, queue wait, latency and cache/coalescing
+outcome for every Azure OpenAI call. Calls made while an execution is being
+produced are buffered in a context variable and written with that execution
+(plus totals on the execution row); other calls are written immediately.
+"""
+
+import logging
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import database as db
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class LLMCall:
+    """One call as seen by one caller"""
+    endpoint: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    queue_wait_ms: float = 0.0
+    latency_ms: float = 0.0
+    cache_hit: bool = False
+    coalesced: bool = False
+
+
+@dataclass
+class LLMUsage:
+    """Calls made on behalf of one test case since its last saved execution"""
+    testcase_id: Optional[str] = None
+    calls: List[LLMCall] = field(default_factory=list)
+
+    def totals(self) -> Dict[str, Any]:
+        return {
+            "llm_calls": len(self.calls),
+            "llm_prompt_tokens": sum(c.prompt_tokens for c in self.calls),
+            "llm_completion_tokens": sum(c.completion_tokens for c in self.calls),
+            "llm_latency_ms": round(sum(c.latency_ms for c in self.calls), 2)
+        }
+
+
+_current_usage: ContextVar[Optional[LLMUsage]] = ContextVar("llm_usage", default=None)
+
+# Process-wide per-endpoint totals for /llm/metrics
+_endpoint_totals: Dict[str, Dict[str, float]] = {}
+
+
+def start_llm_usage(testcase_id: Optional[str] = None) -> LLMUsage:
+    """
+    Attribute LLM calls made from the current task (and tasks it spawns
+    afterwards) to testcase_id until the next save_llm_usage.
+    """
+    usage = LLMUsage(testcase_id=testcase_id)
+    _current_usage.set(usage)
+    return usage
+
+
+async def _insert_calls(conn, calls: List[LLMCall], exeid: Optional[str], testcase_id: Optional[str]):
+    await conn.executemany(
+        """
+        INSERT INTO llm_call (exeid, testcaseid, endpoint, model, prompt_tokens, completion_tokens,
+                              queue_wait_ms, latency_ms, cache_hit, coalesced)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)
+        """,
+        [
+            (exeid, testcase_id, c.endpoint, c.model, c.prompt_tokens, c.completion_tokens,
+             c.queue_wait_ms, c.latency_ms, c.cache_hit, c.coalesced)
+            for c in calls
+        ]
+    )
+
+
+async def record_llm_call(call: LLMCall):
+    """Buffer the call for the current execution, or write it straight away"""
+    totals = _endpoint_totals.setdefault(call.endpoint, {
+        "calls": 0, "prompt_tokens": 0, "completion_tokens": 0,
+        "latency_ms": 0.0, "queue_wait_ms": 0.0, "cache_hits": 0, "coalesced": 0
+    })
+    totals["calls"] += 1
+    totals["prompt_tokens"] += call.prompt_tokens
+    totals["completion_tokens"] += call.completion_tokens
+    totals["latency_ms"] += call.latency_ms
+    totals["queue_wait_ms"] += call.queue_wait_ms
+    totals["cache_hits"] += int(call.cache_hit)
+    totals["coalesced"] += int(call.coalesced)
+
+    usage = _current_usage.get()
+    if usage is not None:
+        usage.calls.append(call)
+        return
+
+    if db.pool is None:
+        return
+    conn = None
+    try:
+        conn = await db.get_db_connection()
+        await _insert_calls(conn, [call], None, None)
+    except Exception as e:
+        logger.warning(f"Failed to record LLM call: {str(e)}")
+    finally:
+        if conn:
+            await db.release_db_connection(conn)
+
+
+async def save_llm_usage(conn, exeid: str, testcase_id: Optional[str] = None):
+    """
+    Write the buffered calls against exeid and store their totals on the
+    execution row. Never raises: the ledger must not fail an execution.
+    """
+    usage = _current_usage.get()
+    if usage is None or not usage.calls:
+        return
+    pending = LLMUsage(testcase_id=testcase_id or usage.testcase_id, calls=usage.calls)
+    usage.calls = []
+    try:
+        await _insert_calls(conn, pending.calls, exeid, pending.testcase_id)
+        totals = pending.totals()
+        await conn.execute(
+            """
+            UPDATE execution
+            SET llm_calls = $2, llm_prompt_tokens = $3, llm_completion_tokens = $4, llm_latency_ms = $5
+            WHERE exeid = $1
+            """,
+            exeid, totals["llm_calls"], totals["llm_prompt_tokens"],
+            totals["llm_completion_tokens"], totals["llm_latency_ms"]
+        )
+    except Exception as e:
+        logger.warning(f"Failed to save LLM usage for {exeid}: {str(e)}")
+
+
+def get_endpoint_totals() -> Dict[str, Dict[str, float]]:
+    """In-process per-endpoint totals since startup"""
+    return {
+        endpoint: {
+            **totals,
+            "avg_latency_ms": round(totals["latency_ms"] / totals["calls"], 2) if totals["calls"] else 0.0
+        }
+        for endpoint, totals in _endpoint_totals.items()
+    }
@@ -1,5 +1,6 @@
 import sys
 import os
+import asyncio
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from fastapi import FastAPI
@@ -7,6 +8,8 @@ from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 import database   # ← FIXED
+import azure_openai_client
+import config
 
 import routers.users as users
 import routers.projects as projects
@@ -15,18 +18,47 @@ import routers.executions as executions
 import routers.testplans as testplans
 import routers.scripts as scripts
 import routers.madl_integration as madl_integration
+from routers.madl_module import madl_module
+from routers.context_pool import context_pool
+from routers.worker_pool import worker_pool
+from routers.job_queue import job_queue
 import routers.method_selection as method_selection
+import routers.shared_prereq as shared_prereq
+import routers.run_planner as run_planner
+import routers.llm_metrics as llm_metrics
+import routers.normalize as normalize
+import routers.suite_runs as suite_runs
+import routers.artifacts as artifacts
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     print("🚀 Initializing DB Pool...")
     await database.connect_db()
+    await database.ensure_schema()
     print("✅ DB Pool initialized.")
+    await suite_runs.reconcile_interrupted_runs(at_startup=True)
 
     await madl_integration.initialize_madl()
+    if config.MADL_ENABLED and config.STEP_ASSEMBLY_ENABLED:
+        await madl_module.initialize()
+    if config.WORKER_POOL_SIZE > 0:
+        await worker_pool.start(config.WORKER_POOL_SIZE, config.WORKER_MAX_JOBS)
+    if config.CONTEXT_HOST_ENABLED:
+        await context_pool.start()
+    if config.EXECUTION_QUEUE_ENABLED:
+        await job_queue.start()
+    artifact_gc = asyncio.create_task(artifacts.run_garbage_collector())
+    run_leases = asyncio.create_task(suite_runs.run_lease_keeper())
 
     yield
 
+    artifact_gc.cancel()
+    run_leases.cancel()
+    await job_queue.stop()
+    await context_pool.stop()
+    await worker_pool.stop()
+    await azure_openai_client.close_azure_openai_client()
+
     print("🛑 Closing DB Pool...")
     await database.disconnect_db()
     print("✅ DB Closed.")
@@ -54,6 +86,12 @@ app.include_router(executions.router, prefix="")
 app.include_router(testplans.router, prefix="")
 app.include_router(scripts.router, prefix="")
 app.include_router(method_selection.router, prefix="")
+app.include_router(shared_prereq.router, prefix="")
+app.include_router(run_planner.router, prefix="")
+app.include_router(llm_metrics.router, prefix="")
+app.include_router(normalize.batch_router, prefix="")
+app.include_router(suite_runs.router, prefix="")
+app.include_router(artifacts.router, prefix="")
 
 if __name__ == "__main__":
     import uvicorn
@@ -374,6 +374,26 @@ class NormalizedStepsUpdate(BaseModel):
     normalized_steps: List[NormalizedStep]
 
 
+class BatchNormalizeRequest(BaseModel):
+    """
+    Request body for /normalize/batch: uploaded scenarios and/or stored test cases.
+    Each scenario looks like an entry of the upload JSON's "Scenarios" list.
+    """
+    scenarios: List[Dict[str, Any]] = []
+    testcase_ids: List[str] = []
+
+
+class RunRequest(BaseModel):
+    """
+    Request body for POST /runs: explicit test cases, or every test case of a
+    project carrying a tag (project_id is required with tag).
+    """
+    testcase_ids: List[str] = []
+    project_id: Optional[str] = None
+    tag: Optional[str] = None
+    script_type: str = "playwright"
+
+
 class ExcelUploadTestCase(BaseModel):
     """
     One row group from Excel after preprocessing.
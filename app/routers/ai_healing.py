@@ -1,19 +1,62 @@
 from fastapi import APIRouter, Form, UploadFile, File, HTTPException
 from fastapi.responses import PlainTextResponse, Response
 
-import base64
 import json
-import subprocess
 import tempfile
-import os
-import uuid
 from datetime import datetime
 
 from azure_openai_client import call_openai_api, call_openai_with_images
+from routers.artifacts import keep_artifacts, workdir
+from routers.dom_distiller import distill_dom
+from routers.screenshot_preprocess import prepare_screenshot
+from routers.script_preflight import preflight_script
+from routers.script_runner import ScriptResult, run_script_file, store_artifacts
 
 
 router = APIRouter()
 
+ARTIFACT_LABELS = {"error_screenshot.png": "Screenshot", "page_dom_dump.txt": "DOM snapshot"}
+
+
+async def _run_in_workdir(script: str, testplan_output: str, on_line, on_stderr_line):
+    """
+    Pre-flight a script and run it in a working directory of its own; returns
+    the script that ran, its result and one log line per artifact. A script
+    that fails pre-flight is healed once with the report, as in the execution
+    websockets, and is not launched if the healed one fails too.
+    """
+    preflight = preflight_script(script)
+    if not preflight.ok:
+        for line in preflight.report().splitlines():
+            await on_stderr_line(line)
+        try:
+            healed = await self_heal(
+                testplan_output=testplan_output,
+                generated_script=script,
+                execution_logs=preflight.report(),
+                screenshot=None,
+                dom_snapshot=None
+            )
+            preflight = preflight_script(healed.body.decode("utf-8"))
+        except HTTPException as e:
+            await on_stderr_line(str(e.detail))
+            return script, ScriptResult(return_code=1, output=preflight.report() + "\n"), []
+        if not preflight.ok:
+            for line in preflight.report().splitlines():
+                await on_stderr_line(line)
+            return preflight.script, ScriptResult(return_code=1, output=preflight.report() + "\n"), []
+        await on_line("Pre-flight check failed; running the healed script")
+
+    with workdir(prefix="ai_exec_") as path:
+        result = await run_script_file(preflight.script, path, on_line=on_line, on_stderr_line=on_stderr_line)
+        refs = await store_artifacts(path)
+    await keep_artifacts(refs)
+    artifact_logs = [
+        f"{ARTIFACT_LABELS.get(ref.name, ref.name)} stored as artifact {ref.digest} (GET /artifacts/{ref.digest})"
+        for ref in refs
+    ]
+    return preflight.script, result, artifact_logs
+
 
 @router.post("/self-heal")
 async def self_heal(
@@ -29,13 +72,17 @@ async def self_heal(
     """
     try:
         screenshot_b64 = None
+        screenshot_mime = "image/png"
         if screenshot:
-            screenshot_bytes = await screenshot.read()
-            screenshot_b64 = base64.b64encode(screenshot_bytes).decode("utf-8")
+            prepared = await prepare_screenshot(await screenshot.read(), execution_logs)
+            screenshot_b64, screenshot_mime = prepared.image_b64, prepared.mime_type
 
         dom_html = None
         if dom_snapshot:
-            dom_html = (await dom_snapshot.read()).decode("utf-8")
+            dom_html = distill_dom(
+                (await dom_snapshot.read()).decode("utf-8", errors="replace"),
+                execution_logs
+            )
 
         prompt = f"""
 You are an expert test automation engineer.
@@ -79,17 +126,20 @@ RULES:
 """
 
         if screenshot_b64:
-            healed_code = call_openai_with_images(
+            healed_code = await call_openai_with_images(
                 prompt=prompt,
                 image_b64=screenshot_b64,
                 max_tokens=4000,
-                system_message="You are an expert test automation engineer. Return only valid Python code."
+                system_message="You are an expert test automation engineer. Return only valid Python code.",
+                image_mime=screenshot_mime,
+                endpoint="self_heal"
             )
         else:
-            healed_code = call_openai_api(
+            healed_code = await call_openai_api(
                 prompt=prompt,
                 max_tokens=4000,
-                system_message="You are an expert test automation engineer. Return only valid Python code."
+                system_message="You are an expert test automation engineer. Return only valid Python code.",
+                endpoint="self_heal"
             )
 
         cleaned = (
@@ -164,62 +214,34 @@ async def ai_execution(
         - Output ONLY raw Python code
         """
 
-        script = call_openai_api(
+        script = await call_openai_api(
             prompt=prompt,
             max_tokens=4000,
-            system_message="You are a test automation expert. Generate only executable Python code with no markdown or explanations."
+            system_message="You are a test automation expert. Generate only executable Python code with no markdown or explanations.",
+            # The script is run right away: a cached one would replay the same failure
+            endpoint="generate_script"
         )
 
         if not script:
             raise HTTPException(status_code=500, detail="Azure OpenAI returned empty script.")
 
-        temp_path = f"temp_{uuid.uuid4().hex}.py"
-        with open(temp_path, "w", encoding="utf-8") as f:
-            f.write(script)
-
-        os.makedirs("artifacts", exist_ok=True)
         logs, status = [], "PASSED"
 
         def now(): 
             return datetime.now().strftime("%H:%M:%S")
 
-        process = subprocess.Popen(
-            ["python", temp_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1
-        )
-
-        for line in iter(process.stdout.readline, ""):
-            if line:
-                logs.append(f"[{now()}] {line.strip()}")
+        async def log_output(line: str):
+            logs.append(f"[{now()}] {line.strip()}")
 
-        for line in iter(process.stderr.readline, ""):
-            if line:
-                logs.append(f"[{now()}] ERROR: {line.strip()}")
+        async def log_error(line: str):
+            logs.append(f"[{now()}] ERROR: {line.strip()}")
 
-        process.wait()
+        script, result, artifact_logs = await _run_in_workdir(script, testplan_output, log_output, log_error)
 
-        if process.returncode != 0:
+        if result.return_code != 0:
             status = "FAILED"
 
-        ss_log, dom_log = "", ""
-        if os.path.exists("error_screenshot.png"):
-            ss_path = f"artifacts/screenshot_{uuid.uuid4().hex}.png"
-            os.replace("error_screenshot.png", ss_path)
-            ss_log = f"Screenshot saved at {ss_path}"
-
-        if os.path.exists("page_dom_dump.txt"):
-            dom_path = f"artifacts/dom_{uuid.uuid4().hex}.html"
-            os.replace("page_dom_dump.txt", dom_path)
-            dom_log = f"DOM snapshot saved at {dom_path}"
-
-        if ss_log: logs.append(ss_log)
-        if dom_log: logs.append(dom_log)
-
-        # Clean up
-        os.unlink(temp_path)
+        logs.extend(artifact_logs)
 
         output = (
             "================ TEST PLAN ================\n"
@@ -252,12 +274,17 @@ async def self_healing_execution(
     """
     try:
         screenshot_b64 = None
+        screenshot_mime = "image/png"
         if screenshot:
-            screenshot_b64 = base64.b64encode(await screenshot.read()).decode("utf-8")
+            prepared = await prepare_screenshot(await screenshot.read(), execution_logs)
+            screenshot_b64, screenshot_mime = prepared.image_b64, prepared.mime_type
 
         dom_html = None
         if dom_snapshot:
-            dom_html = (await dom_snapshot.read()).decode("utf-8")
+            dom_html = distill_dom(
+                (await dom_snapshot.read()).decode("utf-8", errors="replace"),
+                execution_logs
+            )
 
         prompt = f"""
         You are an expert test automation engineer.
@@ -285,17 +312,20 @@ async def self_healing_execution(
         """
 
         if screenshot_b64:
-            healed_code = call_openai_with_images(
+            healed_code = await call_openai_with_images(
                 prompt=prompt,
                 image_b64=screenshot_b64,
                 max_tokens=4000,
-                system_message="You are an expert test automation engineer. Return only valid Python code."
+                system_message="You are an expert test automation engineer. Return only valid Python code.",
+                image_mime=screenshot_mime,
+                endpoint="self_healing_execution"
             )
         else:
-            healed_code = call_openai_api(
+            healed_code = await call_openai_api(
                 prompt=prompt,
                 max_tokens=4000,
-                system_message="You are an expert test automation engineer. Return only valid Python code."
+                system_message="You are an expert test automation engineer. Return only valid Python code.",
+                endpoint="self_healing_execution"
             )
 
         cleaned = healed_code.replace("```python", "").replace("```", "").strip()
@@ -303,53 +333,23 @@ async def self_healing_execution(
         if not cleaned:
             raise HTTPException(status_code=500, detail="Azure OpenAI returned empty healed script.")
 
-        temp_path = f"temp_healed_{uuid.uuid4().hex}.py"
-        with open(temp_path, "w", encoding="utf-8") as f:
-            f.write(cleaned)
-
-        os.makedirs("artifacts", exist_ok=True)
         logs, status = [], "PASSED"
 
         def now(): 
             return datetime.now().strftime("%H:%M:%S")
 
-        process = subprocess.Popen(
-            ["python", temp_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1
-        )
-
-        for line in iter(process.stdout.readline, ""):
-            if line:
-                logs.append(f"[{now()}] {line.strip()}")
+        async def log_output(line: str):
+            logs.append(f"[{now()}] {line.strip()}")
 
-        for line in iter(process.stderr.readline, ""):
-            if line:
-                logs.append(f"[{now()}] ERROR: {line.strip()}")
+        async def log_error(line: str):
+            logs.append(f"[{now()}] ERROR: {line.strip()}")
 
-        process.wait()
+        cleaned, result, artifact_logs = await _run_in_workdir(cleaned, testplan_output, log_output, log_error)
 
-        if process.returncode != 0:
+        if result.return_code != 0:
             status = "FAILED"
 
-        ss_log, dom_log = "", ""
-        if os.path.exists("error_screenshot.png"):
-            ss_path = f"artifacts/screenshot_{uuid.uuid4().hex}.png"
-            os.replace("error_screenshot.png", ss_path)
-            ss_log = f"Screenshot saved at {ss_path}"
-
-        if os.path.exists("page_dom_dump.txt"):
-            dom_path = f"artifacts/dom_{uuid.uuid4().hex}.html"
-            os.replace("page_dom_dump.txt", dom_path)
-            dom_log = f"DOM snapshot saved at {dom_path}"
-
-        if ss_log: logs.append(ss_log)
-        if dom_log: logs.append(dom_log)
-
-        # Clean up
-        os.unlink(temp_path)
+        logs.extend(artifact_logs)
 
         output = (
             "================ TEST PLAN ================\n"
@@ -0,0 +1,287 @@
+"""
+Execution Artifacts
+Each script run gets its own working directory (workdir()), so the
+error_screenshot.png / page_dom_dump.txt files of concurrent runs no longer
+overwrite each other. Whatever a run leaves there goes into a content-
+addressed store, artifact_blob, keyed by sha256: an identical screenshot or
+DOM is stored once, and text artifacts are gzip-compressed. Blobs live in
+Postgres, so runs on worker nodes and the API see the same store.
+execution_artifact links blobs to the exeid that produced them (NULL for
+ad-hoc runs such as /ai-execution). collect_garbage() drops links older than
+ARTIFACT_RETENTION_DAYS or of deleted executions, then blobs that nothing
+links to any more, and prunes finished execution queue jobs (with their log
+lines) after EXECUTION_JOB_RETENTION_HOURS.
+GET /executions/{exeid}/artifacts lists an execution's artifacts and
+GET /artifacts/{digest} returns one (decompressed).
+"""
+
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, Response
+
+import config
+import database as db
+import utils
+from routers.users import get_current_any_user
+
+router = APIRouter()
+
+# Already compressed formats are stored as they are
+UNCOMPRESSED_TYPES = ("image/", "video/", "application/zip", "application/gzip")
+GC_LOCK_ID = 4_915_001  # pg advisory lock: one collector at a time across API instances
+
+
+@dataclass
+class ArtifactRef:
+    """One file a run left behind, already in the store"""
+    name: str
+    digest: str
+    media_type: str
+    size_bytes: int
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@contextmanager
+def workdir(prefix: str = "exec_"):
+    """Private working directory for one script run, removed afterwards"""
+    os.makedirs(config.EXECUTION_WORKDIR_ROOT, exist_ok=True)
+    path = tempfile.mkdtemp(prefix=prefix, dir=config.EXECUTION_WORKDIR_ROOT)
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+async def _store_blob(conn, data: bytes, media_type: str) -> str:
+    # Hashing and compressing multi-MB DOM dumps would stall the event loop
+    digest = await asyncio.to_thread(lambda: hashlib.sha256(data).hexdigest())
+    # Known content: only mark it as seen so the collector keeps it until it is linked
+    if await conn.fetchval(
+        "UPDATE artifact_blob SET last_seen_at = NOW() WHERE digest = $1 RETURNING digest", digest
+    ):
+        return digest
+    compressed = not media_type.startswith(UNCOMPRESSED_TYPES)
+    content = await asyncio.to_thread(gzip.compress, data, 6) if compressed else data
+    await conn.execute(
+        """
+        INSERT INTO artifact_blob (digest, media_type, size_bytes, stored_bytes, compressed, content)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (digest) DO UPDATE SET last_seen_at = NOW()
+        """,
+        digest, media_type, len(data), len(content), compressed, content
+    )
+    return digest
+
+
+def _list_files(path: str, skip: set) -> List[Tuple[str, str]]:
+    """(relative name, full path) of the files to store; files over ARTIFACT_MAX_BYTES are left out"""
+    files = []
+    for root, _, names in os.walk(path):
+        for name in sorted(names):
+            full = os.path.join(root, name)
+            rel = os.path.relpath(full, path).replace(os.sep, "/")
+            if rel in skip or not os.path.isfile(full):
+                continue
+            size = os.path.getsize(full)
+            if size > config.ARTIFACT_MAX_BYTES:
+                utils.logger.warning(f"[ARTIFACTS] Skipping {rel}: {size} bytes exceeds ARTIFACT_MAX_BYTES")
+                continue
+            files.append((rel, full))
+    return files
+
+
+def _read_file(full: str) -> bytes:
+    with open(full, "rb") as f:
+        return f.read()
+
+
+async def store_directory(path: str, exclude: Iterable[str] = ()) -> List[ArtifactRef]:
+    """Store every file under path (except the excluded names) and return their refs"""
+    files = await asyncio.to_thread(_list_files, path, set(exclude))
+    if not files:
+        return []
+
+    refs = []
+    conn = await db.get_db_connection()
+    try:
+        for rel, full in files:
+            data = await asyncio.to_thread(_read_file, full)
+            media_type = mimetypes.guess_type(rel)[0] or "application/octet-stream"
+            digest = await _store_blob(conn, data, media_type)
+            refs.append(ArtifactRef(name=rel, digest=digest, media_type=media_type, size_bytes=len(data)))
+    finally:
+        await db.release_db_connection(conn)
+    return refs
+
+
+async def link_artifacts(conn, exeid: Optional[str], refs: Iterable[ArtifactRef]):
+    """Attach stored artifacts to an execution (exeid None: runs without an execution row)"""
+    rows = [(exeid, ref.name, ref.digest) for ref in refs]
+    if rows:
+        await conn.executemany(
+            "INSERT INTO execution_artifact (exeid, name, digest) VALUES ($1, $2, $3)",
+            rows
+        )
+
+
+async def keep_artifacts(refs: Iterable[ArtifactRef]):
+    """Link the artifacts of an ad-hoc run (no execution row) so they are kept for the retention period"""
+    conn = await db.get_db_connection()
+    try:
+        await link_artifacts(conn, None, refs)
+    finally:
+        await db.release_db_connection(conn)
+
+
+async def collect_garbage() -> Dict[str, int]:
+    """
+    Apply the retention to links, then drop blobs nothing links to (after a
+    grace period) and finished queue jobs with their log lines
+    """
+    conn = await db.get_db_connection()
+    try:
+        async with conn.transaction():
+            if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", GC_LOCK_ID):
+                return {"links": 0, "blobs": 0, "jobs": 0}
+            links = await conn.fetchval(
+                """
+                WITH gone AS (
+                    DELETE FROM execution_artifact a
+                    WHERE a.created_at < NOW() - make_interval(days => $1)
+                       OR (a.exeid IS NOT NULL AND NOT EXISTS (SELECT 1 FROM execution e WHERE e.exeid = a.exeid))
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM gone
+                """,
+                config.ARTIFACT_RETENTION_DAYS
+            )
+            # The grace period covers runs whose execution row is not written yet
+            blobs = await conn.fetchval(
+                """
+                WITH gone AS (
+                    DELETE FROM artifact_blob b
+                    WHERE b.last_seen_at < NOW() - make_interval(hours => $1)
+                      AND NOT EXISTS (SELECT 1 FROM execution_artifact a WHERE a.digest = b.digest)
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM gone
+                """,
+                config.ARTIFACT_GC_GRACE_HOURS
+            )
+            # The result has been handed to the submitter long before the retention ends
+            jobs = await conn.fetchval(
+                """
+                WITH gone AS (
+                    DELETE FROM execution_job
+                    WHERE status NOT IN ('QUEUED', 'RUNNING')
+                      AND finished_at < NOW() - make_interval(hours => $1)
+                    RETURNING jobid
+                ), gone_logs AS (
+                    DELETE FROM execution_job_log l USING gone WHERE l.jobid = gone.jobid
+                )
+                SELECT COUNT(*) FROM gone
+                """,
+                config.EXECUTION_JOB_RETENTION_HOURS
+            )
+        return {"links": links, "blobs": blobs, "jobs": jobs}
+    finally:
+        await db.release_db_connection(conn)
+
+
+async def run_garbage_collector():
+    """Background task of the API: collect every ARTIFACT_GC_INTERVAL_HOURS"""
+    while True:
+        try:
+            removed = await collect_garbage()
+            if any(removed.values()):
+                utils.logger.info(
+                    f"[ARTIFACTS] Removed {removed['links']} links, {removed['blobs']} blobs "
+                    f"and {removed['jobs']} finished queue jobs"
+                )
+        except Exception as e:
+            utils.logger.warning(f"[ARTIFACTS] Garbage collection failed: {str(e)}")
+        await asyncio.sleep(config.ARTIFACT_GC_INTERVAL_HOURS * 3600)
+
+
+async def _check_execution_access(conn, exeid: str, userid: str):
+    allowed = await conn.fetchval(
+        """
+        SELECT 1 FROM execution e
+        JOIN testcase t ON t.testcaseid = e.testcaseid
+        JOIN projectuser pu ON pu.userid = $2 AND t.projectid && pu.projectid
+        WHERE e.exeid = $1
+        LIMIT 1
+        """,
+        exeid, userid
+    )
+    if not allowed:
+        raise HTTPException(status_code=404, detail="Execution not found")
+
+
+@router.get("/executions/{exeid}/artifacts")
+async def list_execution_artifacts(exeid: str, current_user: dict = Depends(get_current_any_user)):
+    """Artifacts (screenshots, DOM dumps, ...) an execution left behind"""
+    conn = None
+    try:
+        conn = await db.get_db_connection()
+        await _check_execution_access(conn, exeid, current_user["userid"])
+        rows = await conn.fetch(
+            """
+            SELECT a.name, a.digest, b.media_type, b.size_bytes, b.stored_bytes
+            FROM execution_artifact a JOIN artifact_blob b ON b.digest = a.digest
+            WHERE a.exeid = $1
+            ORDER BY a.id
+            """,
+            exeid
+        )
+        return [dict(row) for row in rows]
+    finally:
+        if conn:
+            await db.release_db_connection(conn)
+
+
+@router.get("/artifacts/{digest}")
+async def get_artifact(digest: str, current_user: dict = Depends(get_current_any_user)):
+    """Content of an artifact of an execution the user can see, or of an ad-hoc run (no exeid)"""
+    conn = None
+    try:
+        conn = await db.get_db_connection()
+        row = await conn.fetchrow(
+            """
+            SELECT b.media_type, b.compressed, b.content,
+                   (SELECT a.name FROM execution_artifact a WHERE a.digest = b.digest LIMIT 1) AS name
+            FROM artifact_blob b
+            WHERE b.digest = $1 AND EXISTS (
+                SELECT 1 FROM execution_artifact a
+                LEFT JOIN execution e ON e.exeid = a.exeid
+                LEFT JOIN testcase t ON t.testcaseid = e.testcaseid
+                WHERE a.digest = b.digest
+                  AND (a.exeid IS NULL OR EXISTS (
+                      SELECT 1 FROM projectuser pu WHERE pu.userid = $2 AND t.projectid && pu.projectid
+                  ))
+            )
+            """,
+            digest, current_user["userid"]
+        )
+        if not row:
+            raise HTTPException(status_code=404, detail="Artifact not found")
+        content = gzip.decompress(row["content"]) if row["compressed"] else row["content"]
+        return Response(
+            content=content,
+            media_type=row["media_type"],
+            headers={"Content-Disposition": f'inline; filename="{os.path.basename(row["name"] or digest)}"'}
+        )
+    finally:
+        if conn:
+            await db.release_db_connection(conn)
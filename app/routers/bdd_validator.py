@@ -25,15 +25,16 @@ router = APIRouter()
 # ==============================
 # Azure OpenAI Helper Function
 # ==============================
-def call_gemini(prompt: str) -> str:
+async def call_gemini(prompt: str) -> str:
     """
     Sends a prompt to Azure OpenAI model and returns text response.
     """
     try:
-        response = call_openai_api(
+        response = await call_openai_api(
             prompt=prompt,
             max_tokens=500,
-            system_message="You are a QA automation expert. Provide concise, practical suggestions."
+            system_message="You are a QA automation expert. Provide concise, practical suggestions.",
+            cache="bdd_validation"
         )
         return response
     except Exception as e:
@@ -82,14 +83,14 @@ def rule_prefix_validation(scenario, issues):
             issues["errors"].append(f"Step {s_no} must start with Given/When/Then/And → '{text}'.")
 
 
-def rule_missing_input_data(scenario, issues):
+async def rule_missing_input_data(scenario, issues):
     """Identify input-related steps missing test data and use Azure OpenAI to suggest data."""
     for step in scenario.get("Steps", []):
         s_text = step.get("Step", "")
         s_no = step.get("Index")
         t_data = step.get("TestData", {})
         if is_input_step(s_text) and not t_data:
-            suggestion = call_gemini(f"Suggest key:value test data for this step: {s_text}")
+            suggestion = await call_gemini(f"Suggest key:value test data for this step: {s_text}")
             issues["errors"].append(
                 f"Step {s_no} has input action but missing TestData. Suggestion: {suggestion}"
             )
@@ -121,7 +122,7 @@ def rule_duplicate_titles(all_titles, scenario, issues):
 # ==============================
 # Core Validation Logic
 # ==============================
-def run_validations(data: Dict) -> Dict:
+async def run_validations(data: Dict) -> Dict:
     """
     Executes all validation rules and returns structured results.
     """
@@ -149,7 +150,7 @@ def run_validations(data: Dict) -> Dict:
         rule_step_sequence(sc, results[sid])
         rule_blank_steps(sc, results[sid])
         rule_prefix_validation(sc, results[sid])
-        rule_missing_input_data(sc, results[sid])
+        await rule_missing_input_data(sc, results[sid])
         rule_prerequisite_check(all_ids, sc, results[sid])
 
     # Mark duplicates
@@ -185,7 +186,7 @@ async def validate_bdd_json(
         raise HTTPException(status_code=400, detail=f"File read error: {str(e)}")
 
     try:
-        results = run_validations(data)
+        results = await run_validations(data)
         return JSONResponse({
             "status": "completed",
             "results": results,
@@ -215,7 +216,7 @@ async def validate_and_download_bdd(
         raise HTTPException(status_code=400, detail=f"File read error: {str(e)}")
 
     try:
-        results = run_validations(data)
+        results = await run_validations(data)
         
         # Create temporary file for download
         with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as temp_file:
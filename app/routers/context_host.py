@@ -0,0 +1,140 @@
+"""
+Browser Context Host
+Long-lived child process of context_pool. One Chromium process hosts many
+keyword-driven runs at once, each in its own isolated BrowserContext
+(step_actions.run_plan). At most MAX_CONTEXTS contexts are open at a time;
+after RECYCLE_RUNS runs new contexts go to a freshly launched browser and
+the old one is closed once its last context finishes.
+
+Protocol (one JSON object per line):
+  parent -> host: {"id": ..., "steps": [...]} to start a run,
+                  {"cancel": <id>} to stop one
+  host -> parent: {"ready": true} once the first browser is up,
+                  {"id": ..., "line": ...} per log line,
+                  {"id": ..., "exit": <code>} when a run ends
+
+Imports nothing from the app; run as `python context_host.py`.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import traceback
+from typing import Dict
+
+import step_actions
+
+MAX_CONTEXTS = int(os.environ.get("CONTEXT_HOST_MAX_CONTEXTS", "10"))
+RECYCLE_RUNS = int(os.environ.get("CONTEXT_HOST_RECYCLE_RUNS", "100"))
+HEADLESS = os.environ.get("CONTEXT_HOST_HEADLESS", "true").lower() == "true"
+FRAME_LINE_LIMIT = 4 * 1024 * 1024
+
+
+# Frames go to a private copy of the original stdout; stray prints in step
+# snippets end up on stderr instead of corrupting the protocol
+_proto = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+os.dup2(2, 1)
+
+
+def send(frame: dict):
+    _proto.write(json.dumps(frame) + "\n")
+    _proto.flush()
+
+
+class BrowserSlot:
+    """A launched browser with its open-context and lifetime run counts"""
+
+    def __init__(self, browser):
+        self.browser = browser
+        self.active = 0
+        self.runs = 0
+        self.retired = False
+
+    async def release(self):
+        self.active -= 1
+        if self.retired and self.active == 0 and self.browser.is_connected():
+            await self.browser.close()
+
+
+class ContextHost:
+    def __init__(self, playwright):
+        self.playwright = playwright
+        self.slot: BrowserSlot = None
+        self.capacity = asyncio.Semaphore(MAX_CONTEXTS)
+        self.recycle_lock = asyncio.Lock()
+        self.tasks: Dict[object, asyncio.Task] = {}
+
+    async def launch(self):
+        self.slot = BrowserSlot(await self.playwright.chromium.launch(headless=HEADLESS))
+
+    async def acquire(self) -> BrowserSlot:
+        await self.capacity.acquire()
+        try:
+            async with self.recycle_lock:
+                if self.slot.runs >= RECYCLE_RUNS or not self.slot.browser.is_connected():
+                    old = self.slot
+                    await self.launch()
+                    old.retired = True
+                    if old.active == 0 and old.browser.is_connected():
+                        await old.browser.close()
+        except BaseException:
+            self.capacity.release()
+            raise
+        self.slot.active += 1
+        self.slot.runs += 1
+        return self.slot
+
+    async def run(self, job_id, steps):
+        exit_code = 1
+        try:
+            slot = await self.acquire()
+            try:
+                exit_code = await step_actions.run_plan(
+                    slot.browser, steps, log=lambda line: send({"id": job_id, "line": line})
+                )
+            finally:
+                await slot.release()
+                self.capacity.release()
+        except asyncio.CancelledError:
+            send({"id": job_id, "line": "Run cancelled"})
+        except Exception:
+            for line in traceback.format_exc().splitlines():
+                send({"id": job_id, "line": line})
+        finally:
+            self.tasks.pop(job_id, None)
+            send({"id": job_id, "exit": exit_code})
+
+    def handle(self, frame: dict):
+        if "cancel" in frame:
+            task = self.tasks.get(frame["cancel"])
+            if task:
+                task.cancel()
+            return
+        self.tasks[frame["id"]] = asyncio.create_task(self.run(frame["id"], frame.get("steps") or []))
+
+
+async def main():
+    from playwright.async_api import async_playwright
+
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=FRAME_LINE_LIMIT)
+    await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), sys.stdin)
+
+    async with async_playwright() as playwright:
+        host = ContextHost(playwright)
+        await host.launch()
+        send({"ready": True})
+        while True:
+            raw = await reader.readline()
+            if not raw:
+                break
+            if raw.strip():
+                host.handle(json.loads(raw))
+        for task in list(host.tasks.values()):
+            task.cancel()
+        await asyncio.gather(*host.tasks.values(), return_exceptions=True)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,188 @@
+"""
+Browser Context Pool
+Parent side of context_host: runs keyword-driven plans concurrently as
+isolated BrowserContexts of one shared Chromium process, instead of one
+interpreter and one browser per test. Many runs are multiplexed over the
+host's stdin/stdout pipe and told apart by job id. A cancelled run the host
+does not end within CANCEL_ACK_TIMEOUT (a snippet blocking its event loop,
+which stalls every other context as well) gets the host killed and restarted.
+script_runner.run_script sends unmodified keyword_executor runner scripts
+here when the host is up; every other script runs as before.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+import config
+import utils
+from routers import keyword_executor
+from routers.script_runner import ScriptResult, kill_process_tree, limited_args
+
+HOST_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "context_host.py")
+HOST_START_TIMEOUT = 60
+CANCEL_ACK_TIMEOUT = 10  # seconds for the host to end a cancelled run
+FRAME_LINE_LIMIT = 4 * 1024 * 1024
+
+
+class ContextPool:
+    def __init__(self):
+        self.is_ready = False
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._jobs: Dict[int, asyncio.Queue] = {}
+        self._job_ids = itertools.count(1)
+        self._write_lock: Optional[asyncio.Lock] = None
+        self._tasks: List[asyncio.Task] = []
+        self._watchdogs: Set[asyncio.Task] = set()
+
+    async def start(self):
+        self._write_lock = asyncio.Lock()
+        try:
+            await self._spawn()
+            self.is_ready = True
+            utils.logger.info(
+                f"[CONTEXT-POOL] Browser context host ready "
+                f"(max {config.CONTEXT_HOST_MAX_CONTEXTS} contexts, recycle after {config.CONTEXT_HOST_RECYCLE_RUNS} runs)"
+            )
+        except Exception as e:
+            utils.logger.warning(f"[CONTEXT-POOL] Context host failed to start: {str(e)}")
+
+    async def stop(self):
+        self.is_ready = False
+        for task in self._tasks + list(self._watchdogs):
+            task.cancel()
+        if self._process and self._process.returncode is None:
+            kill_process_tree(self._process.pid)
+            await self._process.wait()
+
+    async def _spawn(self):
+        # Memory limit as for scripts; no CPU limit, it adds up over the host's lifetime
+        self._process = await asyncio.create_subprocess_exec(
+            *limited_args([sys.executable, HOST_SCRIPT], cpu_seconds=0),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={
+                **os.environ,
+                "CONTEXT_HOST_MAX_CONTEXTS": str(config.CONTEXT_HOST_MAX_CONTEXTS),
+                "CONTEXT_HOST_RECYCLE_RUNS": str(config.CONTEXT_HOST_RECYCLE_RUNS),
+                "CONTEXT_HOST_HEADLESS": str(config.WORKER_HEADLESS).lower(),
+            },
+            limit=FRAME_LINE_LIMIT,
+            # Own process group: kill_process_tree takes the browsers along
+            start_new_session=os.name == "posix"
+        )
+        try:
+            raw = await asyncio.wait_for(self._process.stdout.readline(), timeout=HOST_START_TIMEOUT)
+            if not raw or not json.loads(raw).get("ready"):
+                raise RuntimeError("context host exited during start-up")
+        except BaseException:
+            if self._process.returncode is None:
+                self._process.kill()
+                await self._process.wait()
+            raise
+        self._tasks = [
+            asyncio.create_task(self._dispatch(self._process)),
+            asyncio.create_task(self._drain_stderr(self._process)),
+        ]
+
+    async def _drain_stderr(self, process: asyncio.subprocess.Process):
+        while True:
+            raw = await process.stderr.readline()
+            if not raw:
+                break
+            utils.logger.debug(f"[CONTEXT-HOST] {raw.decode('utf-8', errors='replace').rstrip()}")
+
+    async def _dispatch(self, process: asyncio.subprocess.Process):
+        """Route host frames to their job queues; fail every open job if the host dies"""
+        while True:
+            raw = await process.stdout.readline()
+            if not raw:
+                break
+            frame = json.loads(raw)
+            queue = self._jobs.get(frame.get("id"))
+            if queue:
+                queue.put_nowait(frame)
+
+        return_code = await process.wait()
+        utils.logger.warning(f"[CONTEXT-POOL] Context host exited with code {return_code}")
+        for job_id, queue in list(self._jobs.items()):
+            queue.put_nowait({"id": job_id, "line": "Browser context host exited", "exit": 1})
+        if self.is_ready:
+            try:
+                await self._spawn()
+            except Exception as e:
+                self.is_ready = False
+                utils.logger.warning(f"[CONTEXT-POOL] Context host restart failed: {str(e)}")
+
+    async def _send(self, frame: dict):
+        async with self._write_lock:
+            self._process.stdin.write((json.dumps(frame) + "\n").encode("utf-8"))
+            await self._process.stdin.drain()
+
+    async def _watch_cancel(self, job_id: int, queue: asyncio.Queue, process: asyncio.subprocess.Process):
+        """Wait for the host to end a cancelled run; kill the host if it does not"""
+        async def until_exit():
+            while "exit" not in await queue.get():
+                pass
+
+        try:
+            await asyncio.wait_for(until_exit(), timeout=CANCEL_ACK_TIMEOUT)
+        except asyncio.TimeoutError:
+            if process.returncode is None:
+                utils.logger.warning(
+                    f"[CONTEXT-POOL] Run {job_id} not ended {CANCEL_ACK_TIMEOUT}s after its cancel; restarting the context host"
+                )
+                # _dispatch sees the host exit, fails its open runs and starts a new one
+                kill_process_tree(process.pid)
+        finally:
+            self._jobs.pop(job_id, None)
+
+    def steps_for(self, script_content: str) -> Optional[List[Dict[str, str]]]:
+        """Steps to run here, or None when the script has to run as a process"""
+        if not self.is_ready:
+            return None
+        return keyword_executor.runner_steps(script_content)
+
+    async def run(
+        self,
+        steps: List[Dict[str, str]],
+        on_line: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> ScriptResult:
+        """Run one plan in its own browser context"""
+        job_id = next(self._job_ids)
+        queue: asyncio.Queue = asyncio.Queue()
+        self._jobs[job_id] = queue
+        lines: List[str] = []
+        finished = False
+        try:
+            await self._send({"id": job_id, "steps": steps})
+            while True:
+                frame = await queue.get()
+                if frame.get("line", "").strip():
+                    lines.append(frame["line"])
+                    if on_line:
+                        await on_line(frame["line"])
+                if "exit" in frame:
+                    finished = True
+                    output = "".join(line + "\n" for line in lines)
+                    return ScriptResult(return_code=frame["exit"], output=output, stdout=output)
+        finally:
+            process = self._process
+            if finished or not process or process.returncode is not None:
+                self._jobs.pop(job_id, None)
+            else:
+                try:
+                    await self._send({"cancel": job_id})
+                except Exception:
+                    pass
+                # The job stays registered until the host acknowledges with its exit frame
+                watchdog = asyncio.create_task(self._watch_cancel(job_id, queue, process))
+                self._watchdogs.add(watchdog)
+                watchdog.add_done_callback(self._watchdogs.discard)
+
+
+context_pool = ContextPool()
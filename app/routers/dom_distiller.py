@@ -0,0 +1,284 @@
+"""
+DOM Distiller
+Shrinks an uploaded DOM snapshot before it goes into a self-healing prompt:
+drops scripts/styles/hidden nodes, keeps interactive elements (prioritising
+the ones matching the failing selector in the logs) plus their ancestors,
+and stops at a token budget.
+"""
+
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Set
+
+import config
+
+# Rough chars-per-token ratio for budgeting (no tokenizer dependency)
+CHARS_PER_TOKEN = 4
+
+SKIP_CONTENT_TAGS = {"script", "style", "noscript", "template", "svg", "head"}
+VOID_TAGS = {
+    "area", "base", "br", "col", "embed", "hr", "img", "input",
+    "link", "meta", "param", "source", "track", "wbr"
+}
+INTERACTIVE_TAGS = {"a", "button", "input", "select", "textarea", "option", "label", "summary", "iframe"}
+LANDMARK_TAGS = {"form", "h1", "h2", "h3", "h4", "dialog", "table", "th", "nav"}
+INTERACTIVE_ROLES = {
+    "button", "link", "checkbox", "radio", "tab", "menuitem", "option",
+    "combobox", "textbox", "switch", "listbox", "gridcell", "row"
+}
+KEPT_ATTRS = (
+    "id", "name", "type", "role", "aria-label", "placeholder", "value", "href",
+    "for", "title", "alt", "data-testid", "data-test", "class"
+)
+# Containers worth printing as ancestors even without distinguishing attributes
+STRUCTURAL_TAGS = {"form", "table", "tr", "ul", "ol", "li", "nav", "dialog", "section", "main", "iframe", "fieldset"}
+# Elements sharing one of these with the failing element count as "near" it
+NEAR_CONTAINER_TAGS = {"form", "dialog", "table", "fieldset", "nav"}
+
+MAX_TEXT_CHARS = 80
+MAX_ATTR_CHARS = 60
+
+SELECTOR_PATTERNS = [
+    # locator("..."), wait_for_selector('...'), get_by_role("...", name="...")
+    re.compile(r"(?:locator|selector|get_by_\w+|find_element\w*|By\.\w+\s*,)\s*\(?\s*[\"']([^\"']{1,200})[\"']"),
+    # bare quoted CSS / XPath / Playwright text selectors
+    re.compile(r"[\"']((?:[#.\[]|//|text=|xpath=)[^\"']{1,200})[\"']"),
+    # name="..." keyword arguments in get_by_* calls
+    re.compile(r"name\s*=\s*[\"']([^\"']{1,100})[\"']"),
+]
+HINT_STOPWORDS = {
+    "div", "span", "input", "button", "text", "xpath", "contains", "normalize",
+    "space", "class", "name", "type", "role", "nth", "child", "first", "last",
+    "css", "has", "not", "visible", "true", "false"
+}
+
+
+class _Node:
+    __slots__ = ("tag", "attrs", "text", "children", "parent", "hidden")
+
+    def __init__(self, tag: str, attrs: Dict[str, str], parent: Optional["_Node"], hidden: bool):
+        self.tag = tag
+        self.attrs = attrs
+        self.text = ""
+        self.children: List["_Node"] = []
+        self.parent = parent
+        self.hidden = hidden
+
+
+def _is_hidden(attrs: Dict[str, str]) -> bool:
+    style = attrs.get("style", "").replace(" ", "").lower()
+    return (
+        "hidden" in attrs
+        or attrs.get("type", "").lower() == "hidden"
+        or attrs.get("aria-hidden", "").lower() == "true"
+        or "display:none" in style
+        or "visibility:hidden" in style
+    )
+
+
+class _TreeBuilder(HTMLParser):
+    """Tolerant HTML -> light node tree, skipping non-visual content"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = _Node("document", {}, None, False)
+        self.nodes: List[_Node] = []
+        self._stack: List[_Node] = [self.root]
+        self._skip_tag: Optional[str] = None
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth += 1
+            return
+        if tag in SKIP_CONTENT_TAGS:
+            self._skip_tag, self._skip_depth = tag, 1
+            return
+
+        attr_map = {k.lower(): (v or "") for k, v in attrs}
+        parent = self._stack[-1]
+        node = _Node(tag, attr_map, parent, parent.hidden or _is_hidden(attr_map))
+        parent.children.append(node)
+        self.nodes.append(node)
+        if tag not in VOID_TAGS:
+            self._stack.append(node)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if not self._skip_tag and tag not in VOID_TAGS and self._stack[-1].tag == tag:
+            self._stack.pop()
+
+    def handle_endtag(self, tag):
+        if self._skip_tag:
+            if tag == self._skip_tag:
+                self._skip_depth -= 1
+                if self._skip_depth == 0:
+                    self._skip_tag = None
+            return
+        # Pop to the matching open tag; ignore stray end tags
+        for i in range(len(self._stack) - 1, 0, -1):
+            if self._stack[i].tag == tag:
+                del self._stack[i:]
+                break
+
+    def handle_data(self, data):
+        if self._skip_tag:
+            return
+        text = " ".join(data.split())
+        if text:
+            node = self._stack[-1]
+            node.text = f"{node.text} {text}".strip() if node.text else text
+
+
+def extract_selector_hints(logs: str) -> Set[str]:
+    """Lower-cased identifiers taken from the selectors mentioned in the failure logs"""
+    hints: Set[str] = set()
+    for pattern in SELECTOR_PATTERNS:
+        for selector in pattern.findall(logs or ""):
+            for term in re.findall(r"[A-Za-z][\w-]{2,}", selector):
+                term = term.lower()
+                if term not in HINT_STOPWORDS:
+                    hints.add(term)
+    return hints
+
+
+def _is_interactive(node: _Node) -> bool:
+    attrs = node.attrs
+    return (
+        node.tag in INTERACTIVE_TAGS
+        or node.tag in LANDMARK_TAGS
+        or attrs.get("role", "").lower() in INTERACTIVE_ROLES
+        or "onclick" in attrs
+        or "contenteditable" in attrs
+        or "tabindex" in attrs
+    )
+
+
+def _hint_score(node: _Node, hints: Set[str]) -> int:
+    if not hints:
+        return 0
+    haystack = " ".join(
+        [node.attrs.get(a, "") for a in ("id", "name", "class", "aria-label", "placeholder", "data-testid", "title", "value")]
+        + [node.text[:200]]
+    ).lower()
+    return sum(1 for hint in hints if hint in haystack)
+
+
+def _render_line(node: _Node, depth: int) -> str:
+    parts = [node.tag]
+    for attr in KEPT_ATTRS:
+        if attr in node.attrs:
+            value = node.attrs[attr]
+            if attr == "class":
+                value = " ".join(value.split()[:3])
+            if len(value) > MAX_ATTR_CHARS:
+                value = value[:MAX_ATTR_CHARS] + "..."
+            parts.append(f'{attr}="{value}"' if value else attr)
+    line = "  " * depth + "<" + " ".join(parts) + ">"
+    if node.text:
+        text = node.text if len(node.text) <= MAX_TEXT_CHARS else node.text[:MAX_TEXT_CHARS] + "..."
+        line += " " + text
+    return line
+
+
+def _is_printable_ancestor(node: _Node) -> bool:
+    return node.tag in STRUCTURAL_TAGS or any(a in node.attrs for a in ("id", "role", "name", "data-testid"))
+
+
+def _ancestors(node: _Node, root: _Node) -> List[_Node]:
+    chain = []
+    parent = node.parent
+    while parent is not None and parent is not root:
+        chain.append(parent)
+        parent = parent.parent
+    return chain
+
+
+def _render(node: _Node, kept: Set[int], depth: int, lines: List[str]):
+    for child in node.children:
+        if id(child) in kept:
+            lines.append(_render_line(child, depth))
+            _render(child, kept, depth + 1, lines)
+        else:
+            _render(child, kept, depth, lines)
+
+
+def distill_dom(html: str, logs: str = "", max_tokens: Optional[int] = None) -> str:
+    """
+    Return a compact, indented outline of the page for the heal prompt.
+    Elements matching the failing selector come first, then interactive
+    elements near them, then the rest, until the token budget is used.
+    """
+    if not html:
+        return ""
+    budget_chars = (max_tokens or config.DOM_DISTILL_MAX_TOKENS) * CHARS_PER_TOKEN
+
+    builder = _TreeBuilder()
+    try:
+        builder.feed(html)
+        builder.close()
+    except Exception:
+        # html.parser is tolerant, but never let a bad snapshot break healing
+        return html[:budget_chars]
+
+    visible = [n for n in builder.nodes if not n.hidden]
+    hints = extract_selector_hints(logs)
+    matched = [n for n in visible if _hint_score(n, hints) > 0]
+    matched.sort(key=lambda n: -_hint_score(n, hints))
+
+    # Interactive elements sharing a container with a matched element
+    near: List[_Node] = []
+    containers = set()
+    for node in matched:
+        # Climb at most two levels, stopping at the enclosing form/dialog/table
+        container = node
+        for _ in range(2):
+            if container.parent is None or container.parent is builder.root:
+                break
+            container = container.parent
+            if container.tag in NEAR_CONTAINER_TAGS:
+                break
+        containers.add(id(container))
+    interactive = [n for n in visible if _is_interactive(n)]
+    if containers:
+        for node in interactive:
+            ancestor = node.parent
+            while ancestor is not None:
+                if id(ancestor) in containers:
+                    near.append(node)
+                    break
+                ancestor = ancestor.parent
+
+    kept: Set[int] = set()
+    considered: Set[int] = set()
+    used_chars = 0
+    omitted = 0
+    for node in matched + near + interactive:
+        if id(node) in considered:
+            continue
+        considered.add(id(node))
+        if id(node) in kept:
+            continue
+        new_lines = [node] + [
+            a for a in _ancestors(node, builder.root)
+            if id(a) not in kept and _is_printable_ancestor(a)
+        ]
+        cost = sum(len(_render_line(n, 0)) + 1 for n in new_lines)
+        if used_chars + cost > budget_chars:
+            omitted += 1
+            continue
+        used_chars += cost
+        kept.update(id(n) for n in new_lines)
+
+    lines: List[str] = []
+    _render(builder.root, kept, 0, lines)
+    total_interactive = len(interactive)
+    header = (
+        f"<!-- distilled DOM: {len(kept)} of {len(builder.nodes)} elements kept, "
+        f"{total_interactive} interactive, {omitted} omitted over budget"
+        + (f", matched selector terms: {', '.join(sorted(hints))}" if hints else "")
+        + " -->"
+    )
+    return "\n".join([header] + lines)
+
@@ -4,25 +4,24 @@ Incorporates MADL search, method selection, enhanced logging, and error context.
 """
 
 from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect, Depends, Form
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Awaitable
 import json
-import subprocess
-import tempfile
-import os
 import asyncio
-import sys
 from datetime import datetime
-from azure_openai_client import call_openai_api
+from azure_openai_client import call_openai_api, stream_openai_api
 
 import models as models
 import utils
 import database as db
+import llm_ledger
 import config
 from routers.users import get_current_any_user
 from routers.madl_integration import madl_client, search_for_reusable_methods
 from routers.madl_storage import store_successful_execution_to_madl
 from routers.structured_logging import StructuredLogger, LogLevel, LogCategory, extract_madl_from_logs
 from routers import ai_healing
+from routers.log_frames import LogFrames
+from routers.script_runner import run_script
 
 router = APIRouter()
 
@@ -32,7 +31,8 @@ async def generate_script_with_madl(
     script_lang: str,
     testplan: dict,
     selected_madl_methods: Optional[List[dict]] = None,
-    logger: Optional[StructuredLogger] = None
+    logger: Optional[StructuredLogger] = None,
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None
 ):
     """
     Generate test script using Azure OpenAI API with MADL method integration.
@@ -40,6 +40,7 @@ async def generate_script_with_madl(
     Enhanced to:
     - Include selected MADL methods in prompt
     - Strip markdown code fences (\`\`\`python ... \`\`\`) from the model output
+    - Stream the raw completion to on_chunk while it is generated (optional)
     """
     try:
         if logger:
@@ -73,11 +74,21 @@ async def generate_script_with_madl(
         - Output ONLY the code, no additional explanations or markdown
         """
 
-        raw_text = call_openai_api(
-            prompt=prompt,
-            max_tokens=4000,
-            system_message="You are a test automation expert. Generate only executable Python code with no markdown."
-        ).strip()
+        if on_chunk:
+            raw_text = (await stream_openai_api(
+                prompt=prompt,
+                on_chunk=on_chunk,
+                max_tokens=4000,
+                system_message="You are a test automation expert. Generate only executable Python code with no markdown.",
+                endpoint="generate_script_madl"
+            )).strip()
+        else:
+            raw_text = (await call_openai_api(
+                prompt=prompt,
+                max_tokens=4000,
+                system_message="You are a test automation expert. Generate only executable Python code with no markdown.",
+                endpoint="generate_script_madl"
+            )).strip()
 
         if not raw_text:
             raise ValueError("Azure OpenAI returned empty script content")
@@ -172,6 +183,8 @@ async def execute_testcase_with_madl(
     7. On success: extract MADL data and push to vector DB
     """
     await websocket.accept()
+    frames = LogFrames.for_websocket(websocket)
+    llm_ledger.start_llm_usage(testcase_id)
     utils.logger.debug(f"[MADL-EXEC] WebSocket opened for {testcase_id}, {script_type}")
     
     # Extract token
@@ -183,7 +196,7 @@ async def execute_testcase_with_madl(
             token = auth_header.decode().split("Bearer ")[1].strip()
     
     if not token:
-        await websocket.send_text(json.dumps({"error": "Authorization token missing", "status": "FAILED"}))
+        await frames.send({"error": "Authorization token missing", "status": "FAILED"})
         await websocket.close()
         return
     
@@ -196,7 +209,7 @@ async def execute_testcase_with_madl(
         role = payload.get("role")
         current_user = {"userid": userid, "role": role}
     except JWTError:
-        await websocket.send_text(json.dumps({"error": "Invalid token", "status": "FAILED"}))
+        await frames.send({"error": "Invalid token", "status": "FAILED"})
         await websocket.close()
         return
     
@@ -214,7 +227,7 @@ async def execute_testcase_with_madl(
         tc_project = await conn.fetchrow("SELECT projectid FROM testcase WHERE testcaseid = $1", testcase_id)
         if not tc_project:
             error_msg = {"error": "Test case not found", "status": "FAILED"}
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             return
         
@@ -225,12 +238,12 @@ async def execute_testcase_with_madl(
         )
         if not access:
             error_msg = {"error": "Unauthorized", "status": "FAILED"}
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             return
         
         # Build test plan
-        await websocket.send_text(json.dumps({"status": "BUILDING_PLAN", "log": "Building test plan..."}))
+        await frames.send({"status": "BUILDING_PLAN", "log": "Building test plan..."})
         logger.info(LogCategory.PLAN_BUILDING, "Building test plan from prerequisites and steps")
         
         prereq_chain = await utils.get_prereq_chain(conn, testcase_id)
@@ -251,11 +264,11 @@ async def execute_testcase_with_madl(
             testplan_dict["current - bdd steps"] = dict(zip(current_steps["steps"], current_steps["args"]))
         
         testplan_json = json.dumps(testplan_dict)
-        await websocket.send_text(json.dumps({"status": "PLAN_READY", "log": "Test plan built"}))
+        await frames.send({"status": "PLAN_READY", "log": "Test plan built"})
         logger.success(LogCategory.PLAN_BUILDING, "Test plan built successfully")
         
         # Search MADL for reusable methods
-        await websocket.send_text(json.dumps({"status": "SEARCHING_MADL", "log": "Searching for reusable methods..."}))
+        await frames.send({"status": "SEARCHING_MADL", "log": "Searching for reusable methods..."})
         logger.info(LogCategory.SEARCH, "Searching MADL for reusable methods")
         
         reusable_methods = await search_for_reusable_methods(testplan_dict)
@@ -274,11 +287,11 @@ async def execute_testcase_with_madl(
             logger.success(LogCategory.SEARCH, f"Found {len(methods_data)} reusable methods")
             
             # Send methods to client for user selection
-            await websocket.send_text(json.dumps({
+            await frames.send({
                 "status": "METHODS_FOUND",
                 "methods": methods_data,
                 "message": f"Found {len(methods_data)} reusable methods. Select which to use:"
-            }))
+            })
             
             # Wait for user selection (timeout after 60 seconds)
             selected_methods = []
@@ -291,27 +304,27 @@ async def execute_testcase_with_madl(
                     selected_methods = [m for m in methods_data if m["signature"] in selected_signatures]
                     logger.info(LogCategory.SEARCH, f"User selected {len(selected_methods)} methods")
                     
-                    await websocket.send_text(json.dumps({
+                    await frames.send({
                         "status": "SELECTION_CONFIRMED",
                         "count": len(selected_methods)
-                    }))
+                    })
             
             except asyncio.TimeoutError:
                 logger.warning(LogCategory.SEARCH, "Method selection timeout")
-                await websocket.send_text(json.dumps({
+                await frames.send({
                     "status": "SELECTION_TIMEOUT",
                     "log": "No selection received, proceeding without MADL methods"
-                }))
+                })
         
         else:
             logger.info(LogCategory.SEARCH, "No reusable methods found")
-            await websocket.send_text(json.dumps({
+            await frames.send({
                 "status": "NO_MADL_METHODS",
                 "log": "No reusable methods found in MADL"
-            }))
+            })
         
         # Generate script (with selected MADL methods if any)
-        await websocket.send_text(json.dumps({"status": "GENERATING", "log": "Generating script..."}))
+        await frames.send({"status": "GENERATING", "log": "Generating script..."})
         
         try:
             generated_script = await generate_script_with_madl(
@@ -325,144 +338,89 @@ async def execute_testcase_with_madl(
         
         except Exception as e:
             error_msg = {"error": f"Generation failed: {str(e)}", "status": "FAILED"}
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             return
         
         # Execute script with structured logging
-        await websocket.send_text(json.dumps({"status": "EXECUTING", "log": "Starting execution..."}))
+        await frames.send({"status": "EXECUTING", "log": "Starting execution..."})
         
-        execution_output = ""
-        temp_file_path = None
+        logger.info(LogCategory.EXECUTION, "Executing generated script")
+
+        async def stream_line(line: str):
+            await frames.line(line)
+
+        script_result = await run_script(generated_script, on_line=stream_line)
+        execution_output = script_result.output
+        return_code = script_result.return_code
+        termination = script_result.termination
+        artifacts = list(script_result.artifacts)
         
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as temp_file:
-                temp_file.write(generated_script)
-                temp_file_path = temp_file.name
-            
-            logger.info(LogCategory.EXECUTION, f"Executing script from {temp_file_path}")
-            
-            process = subprocess.Popen(
-                [sys.executable, temp_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                encoding='utf-8',
-                errors='replace',
-                bufsize=1
+        if return_code == 0:
+            logger.success(LogCategory.EXECUTION, "Script executed successfully")
+            execution_status = "SUCCESS"
+            execution_message = "Script executed successfully"
+        
+        else:
+            # Collect error context for healing
+            logger.error(LogCategory.EXECUTION, "Script execution failed")
+            error_context = await collect_enhanced_error_context(
+                logs=execution_output,
+                testplan=testplan_json,
+                generated_script=generated_script
             )
             
-            for line in process.stdout:
-                line = line.rstrip('\n')
-                if line.strip():
-                    execution_output += line + "\n"
-                    
-                    # Stream log to client
-                    await websocket.send_text(json.dumps({
-                        "status": "RUNNING",
-                        "log": line
-                    }))
-                    await asyncio.sleep(0.02)
-            
-            return_code = process.wait()
+            # Trigger self-healing
+            await frames.send({
+                "status": "AUTO_HEALING",
+                "log": "Execution failed. Starting auto-healing with context..."
+            })
+            logger.info(LogCategory.HEALING, "Initiating auto-healing")
             
-            if return_code == 0:
-                logger.success(LogCategory.EXECUTION, "Script executed successfully")
-                execution_status = "SUCCESS"
-                execution_message = "Script executed successfully"
-            
-            else:
-                # Collect error context for healing
-                logger.error(LogCategory.EXECUTION, "Script execution failed")
-                error_context = await collect_enhanced_error_context(
-                    logs=execution_output,
-                    testplan=testplan_json,
-                    generated_script=generated_script
+            try:
+                healed_response = await ai_healing.self_heal(
+                    testplan_output=testplan_json,
+                    generated_script=generated_script,
+                    execution_logs=execution_output,
+                    screenshot=None,
+                    dom_snapshot=None
                 )
                 
-                # Trigger self-healing
-                await websocket.send_text(json.dumps({
-                    "status": "AUTO_HEALING",
-                    "log": "Execution failed. Starting auto-healing with context..."
-                }))
-                logger.info(LogCategory.HEALING, "Initiating auto-healing")
+                healed_code = healed_response.body.decode('utf-8') if hasattr(healed_response, 'body') else str(healed_response)
                 
-                try:
-                    healed_response = await ai_healing.self_heal(
-                        testplan_output=testplan_json,
-                        generated_script=generated_script,
-                        execution_logs=execution_output,
-                        screenshot=None,
-                        dom_snapshot=None
-                    )
-                    
-                    healed_code = healed_response.body.decode('utf-8') if hasattr(healed_response, 'body') else str(healed_response)
-                    
-                    # Execute healed script
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as healed_file:
-                        healed_file.write(healed_code)
-                        healed_temp_path = healed_file.name
-                    
-                    logger.info(LogCategory.HEALING, "Executing healed script")
-                    
-                    healed_process = subprocess.Popen(
-                        [sys.executable, healed_temp_path],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        encoding='utf-8',
-                        errors='replace',
-                        bufsize=1
-                    )
-                    
-                    healed_output = ""
-                    for line in healed_process.stdout:
-                        line = line.rstrip('\n')
-                        if line.strip():
-                            healed_output += line + "\n"
-                            await websocket.send_text(json.dumps({
-                                "status": "RUNNING",
-                                "log": f"[AUTO-HEALED] {line}"
-                            }))
-                            await asyncio.sleep(0.02)
-                    
-                    healed_return_code = healed_process.wait()
-                    
-                    if healed_return_code == 0:
-                        logger.success(LogCategory.HEALING, "Healed script executed successfully")
-                        execution_status = "SUCCESS"
-                        execution_message = "[AUTO-HEALED] Script executed successfully"
-                        execution_output = healed_output
-                    
-                    else:
-                        logger.error(LogCategory.HEALING, "Healed script still failed")
-                        execution_status = "FAILED"
-                        execution_message = "[AUTO-HEALED] Script failed even after healing"
-                        execution_output = healed_output
-                    
-                    if 'healed_temp_path' in locals() and os.path.exists(healed_temp_path):
-                        os.unlink(healed_temp_path)
+                # Execute healed script
+                logger.info(LogCategory.HEALING, "Executing healed script")
+
+                async def stream_healed_line(line: str):
+                    await frames.line(f"[AUTO-HEALED] {line}")
+
+                healed_result = await run_script(healed_code, on_line=stream_healed_line)
+                healed_output = healed_result.output
+                healed_return_code = healed_result.return_code
+                termination = healed_result.termination
+                artifacts += healed_result.artifacts
                 
-                except Exception as healing_error:
-                    logger.error(LogCategory.HEALING, f"Healing failed: {str(healing_error)}")
+                if healed_return_code == 0:
+                    logger.success(LogCategory.HEALING, "Healed script executed successfully")
+                    execution_status = "SUCCESS"
+                    execution_message = "[AUTO-HEALED] Script executed successfully"
+                    execution_output = healed_output
+                
+                else:
+                    logger.error(LogCategory.HEALING, "Healed script still failed")
                     execution_status = "FAILED"
-                    execution_message = f"Healing failed: {str(healing_error)}"
-        
-        finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
+                    execution_message = "[AUTO-HEALED] Script failed even after healing"
+                    execution_output = healed_output
+
+            except Exception as healing_error:
+                logger.error(LogCategory.HEALING, f"Healing failed: {str(healing_error)}")
+                execution_status = "FAILED"
+                execution_message = f"Healing failed: {str(healing_error)}"
         
         # Store execution
-        exeid = await utils.get_next_exeid(conn)
-        datestamp = datetime.now().date()
-        exetime = datetime.now().time()
-        
-        await conn.execute(
-            """
-            INSERT INTO execution (exeid, testcaseid, scripttype, datestamp, exetime, message, output, status)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            """,
-            exeid, testcase_id, script_type, datestamp, exetime, execution_message, execution_output, execution_status
+        await utils.save_execution(
+            conn, testcase_id, script_type, execution_message, execution_output, execution_status,
+            termination, artifacts
         )
         
         # If successful, extract MADL data and push to vector DB
@@ -481,10 +439,10 @@ async def execute_testcase_with_madl(
                 
                 if storage_success:
                     logger.success(LogCategory.STORAGE, "Successfully stored to MADL vector DB")
-                    await websocket.send_text(json.dumps({
+                    await frames.send({
                         "status": "STORAGE_SUCCESS",
                         "log": "Script stored to MADL for future reuse"
-                    }))
+                    })
                 else:
                     logger.warning(LogCategory.STORAGE, "Failed to store to MADL")
             
@@ -492,12 +450,12 @@ async def execute_testcase_with_madl(
                 logger.error(LogCategory.STORAGE, f"MADL storage error: {str(e)}")
         
         # Send final status
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "COMPLETED",
             "log": execution_message,
             "final_status": execution_status,
             "summary": logger.get_summary()
-        }))
+        })
         
         logger.success(LogCategory.INITIALIZATION, "Execution completed")
     
@@ -506,7 +464,7 @@ async def execute_testcase_with_madl(
     except Exception as e:
         logger.error(LogCategory.INITIALIZATION, f"Unexpected error: {str(e)}")
         try:
-            await websocket.send_text(json.dumps({"error": str(e), "status": "FAILED"}))
+            await frames.send({"error": str(e), "status": "FAILED"})
         except:
             pass
     
@@ -8,10 +8,9 @@ from fastapi import (
     File               # (optional – if you use File(...))
 )
 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Callable, Awaitable
 from fastapi.responses import StreamingResponse
 import json
-import subprocess
 import logging
 import os
 import tempfile
@@ -20,16 +19,16 @@ from datetime import datetime
 import models
 import utils
 import database as db
+import llm_ledger
 from routers.users import get_current_any_user
 
 from concurrent.futures import ThreadPoolExecutor
 import asyncio
-import sys
 import io
 import traceback
 
 from selenium import webdriver
-from azure_openai_client import call_openai_api
+from azure_openai_client import call_openai_api, stream_openai_api
 import config
 
 # MADL Imports
@@ -38,14 +37,32 @@ from routers.madl_integration import madl_client, search_for_reusable_methods
 from routers.madl_storage import store_successful_execution_to_madl
 from routers.structured_logging import StructuredLogger, LogLevel, LogCategory, extract_madl_from_logs
 from routers import ai_healing
+from routers import script_store
+from routers import step_assembler
+from routers import keyword_executor
+from routers.script_preflight import preflight_script
+from routers.log_frames import LogFrames
+from routers.script_runner import run_command, run_script, ScriptResult
 
 
 router = APIRouter()
 
 # genai.configure(api_key=config.GEMINI_API_KEY) # REMOVE THIS LINE
 
-async def generate_script(testcase_id: str, script_type: str, script_lang: str, testplan: dict):
-    """Generate test script using Azure OpenAI API"""
+async def generate_script(
+    testcase_id: str,
+    script_type: str,
+    script_lang: str,
+    testplan: dict,
+    extra_requirements: Optional[List[str]] = None,
+    on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+    use_cache: bool = True
+):
+    """
+    Generate test script using Azure OpenAI API (streamed to on_chunk when given).
+    use_cache=False skips the LLM response cache, so a regeneration does not
+    get back the same script that just failed.
+    """
     try:
         prompt = f"Generate a test script for test case ID: {testcase_id}\n"
         prompt += f"Script type: {script_type}, Language: {script_lang}\n"
@@ -59,12 +76,26 @@ async def generate_script(testcase_id: str, script_type: str, script_lang: str,
         prompt += "- Use appropriate imports and syntax for the chosen script type and language.\n"
         prompt += "- Handle actions: 'Navigate to login', 'Enter credentials', 'Submit form' (assume credentials are in 'user/pass' format, split by '/').\n"
         prompt += "- Output only the code, no additional explanations or markdown (e.g., no ''' or # comments outside actions).\n"
-
-        script_content = call_openai_api(
-            prompt=prompt,
-            max_tokens=4000,
-            system_message="You are a test automation expert. Generate only executable Python code."
-        )
+        for requirement in extra_requirements or []:
+            prompt += f"- {requirement}\n"
+
+        if on_chunk:
+            script_content = await stream_openai_api(
+                prompt=prompt,
+                on_chunk=on_chunk,
+                max_tokens=4000,
+                system_message="You are a test automation expert. Generate only executable Python code.",
+                cache="generate_script" if use_cache else None,
+                endpoint="generate_script"
+            )
+        else:
+            script_content = await call_openai_api(
+                prompt=prompt,
+                max_tokens=4000,
+                system_message="You are a test automation expert. Generate only executable Python code.",
+                cache="generate_script" if use_cache else None,
+                endpoint="generate_script"
+            )
 
         if not script_content:
             raise ValueError("Azure OpenAI returned empty script content")
@@ -88,8 +119,7 @@ async def execute_with_auto_healing(
     4. Re-execute healed script
     """
     from app.routers import ai_healing
-    import tempfile
-    
+
     try:
         # Fetch script
         script_row = await conn.fetchrow(
@@ -118,102 +148,77 @@ async def execute_with_auto_healing(
         )
         testplan_output = json.dumps(dict(testplan_row)) if testplan_row else "{}"
         
-        # First execution attempt
+        # First execution attempt; a script failing pre-flight goes straight to healing
         logs = []
-        temp_file_path = None
-        
-        try:
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as temp_file:
-                temp_file.write(script_content)
-                temp_file_path = temp_file.name
-            
-            utils.logger.info(f"[EXEC] Executing script: {temp_file_path}")
-            process = subprocess.Popen(
-                [sys.executable, temp_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-                encoding='utf-8',
-                errors='replace'
-            )
-            
-            stdout, stderr = process.communicate()
-            logs.append(stdout)
-            
-            if process.returncode == 0:
-                utils.logger.info(f"[EXEC] Script executed successfully for {testcase_id}")
-                return {
-                    "status": "SUCCESS",
-                    "message": "Script executed successfully",
-                    "healed": False,
-                    "logs": logs,
-                    "output": stdout
-                }
-            else:
-                # First execution failed - trigger self-healing
-                execution_logs = stderr or stdout
-                
-                utils.logger.warning(f"[HEALING] Script failed for {testcase_id}, triggering self-healing...")
-                utils.logger.info(f"[HEALING] Error logs: {execution_logs[:200]}")
-                
-                try:
-                    healed_response = await ai_healing.self_heal(
-                        testplan_output=testplan_output,
-                        generated_script=script_content,
-                        execution_logs=execution_logs,
-                        screenshot=None,
-                        dom_snapshot=None
-                    )
-                    
-                    # Extract healed code from Response object
-                    healed_code = healed_response.body.decode('utf-8') if hasattr(healed_response, 'body') else str(healed_response)
-                    logs.append(f"\n[SELF-HEALING] Healed script generated:\n{healed_code[:200]}...")
-                    
-                    # Execute healed script
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as healed_file:
-                        healed_file.write(healed_code)
-                        healed_temp_path = healed_file.name
-                    
-                    utils.logger.info(f"[HEALING] Executing healed script: {healed_temp_path}")
-                    healed_process = subprocess.Popen(
-                        [sys.executable, healed_temp_path],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        encoding='utf-8',
-                        errors='replace'
-                    )
-                    
-                    healed_stdout, healed_stderr = healed_process.communicate()
-                    logs.append(healed_stdout)
-                    
-                    if healed_process.returncode == 0:
-                        utils.logger.info(f"[HEALING] Healed script executed successfully for {testcase_id}")
-                        return {
-                            "status": "SUCCESS",
-                            "message": "Script executed successfully after self-healing",
-                            "healed": True,
-                            "logs": logs,
-                            "output": healed_stdout
-                        }
-                    else:
-                        utils.logger.error(f"[HEALING] Healed script still failed: {healed_stderr}")
-                        return {
-                            "status": "FAILED",
-                            "message": f"Script failed even after self-healing: {healed_stderr}",
-                            "healed": True,
-                            "logs": logs,
-                            "output": healed_stderr
-                        }
-                    
-                finally:
-                    if 'healed_temp_path' in locals() and os.path.exists(healed_temp_path):
-                        os.unlink(healed_temp_path)
-        
-        finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-    
+        preflight = preflight_script(script_content)
+        script_content = preflight.script
+        if preflight.ok:
+            result = await run_script(script_content)
+        else:
+            result = ScriptResult(return_code=1, output=preflight.report() + "\n", stderr=preflight.report())
+        logs.append(result.stdout)
+
+        if result.return_code == 0:
+            utils.logger.info(f"[EXEC] Script executed successfully for {testcase_id}")
+            return {
+                "status": "SUCCESS",
+                "message": "Script executed successfully",
+                "healed": False,
+                "logs": logs,
+                "output": result.stdout,
+                "termination": None,
+                "artifacts": result.artifacts
+            }
+
+        # First execution failed - trigger self-healing
+        execution_logs = result.stderr or result.stdout
+
+        utils.logger.warning(f"[HEALING] Script failed for {testcase_id}, triggering self-healing...")
+        utils.logger.info(f"[HEALING] Error logs: {execution_logs[:200]}")
+
+        healed_response = await ai_healing.self_heal(
+            testplan_output=testplan_output,
+            generated_script=script_content,
+            execution_logs=execution_logs,
+            screenshot=None,
+            dom_snapshot=None
+        )
+
+        # Extract healed code from Response object
+        healed_code = healed_response.body.decode('utf-8') if hasattr(healed_response, 'body') else str(healed_response)
+        logs.append(f"\n[SELF-HEALING] Healed script generated:\n{healed_code[:200]}...")
+
+        healed_preflight = preflight_script(healed_code)
+        if not healed_preflight.ok:
+            raise ValueError(healed_preflight.report())
+
+        # Execute healed script
+        utils.logger.info(f"[HEALING] Executing healed script for {testcase_id}")
+        healed_result = await run_script(healed_preflight.script)
+        logs.append(healed_result.stdout)
+
+        if healed_result.return_code == 0:
+            utils.logger.info(f"[HEALING] Healed script executed successfully for {testcase_id}")
+            return {
+                "status": "SUCCESS",
+                "message": "Script executed successfully after self-healing",
+                "healed": True,
+                "logs": logs,
+                "output": healed_result.stdout,
+                "termination": None,
+                "artifacts": result.artifacts + healed_result.artifacts
+            }
+        utils.logger.error(f"[HEALING] Healed script still failed: {healed_result.stderr}")
+        return {
+            "status": "FAILED",
+            "message": f"Script failed even after self-healing: {healed_result.stderr}",
+            "healed": True,
+            "logs": logs,
+            "output": healed_result.stderr,
+            "termination": healed_result.termination,
+            "artifacts": result.artifacts + healed_result.artifacts
+        }
+
     except Exception as e:
         utils.logger.error(f"[HEALING] Auto-healing failed: {str(e)}")
         return {
@@ -228,8 +233,6 @@ from jose import jwt, JWTError
 from fastapi import WebSocket, WebSocketDisconnect
 import json
 import tempfile
-import subprocess
-import sys
 import asyncio
 import os
 from datetime import datetime
@@ -244,7 +247,8 @@ from routers import madl_storage
 async def execute_testcase_with_madl(
     websocket: WebSocket,
     testcase_id: str,
-    script_type: str
+    script_type: str,
+    force_regenerate: bool = False
 ):
     """
     WebSocket endpoint:
@@ -253,11 +257,14 @@ async def execute_testcase_with_madl(
     3. SEND test plan to client for EDITING (NEW)
     4. Wait for edited testplan or skip (NEW)
     5. Search MADL for reusable methods (using edited TP)
-    6. Generate script with Gemini (using edited TP)
+    6. Reuse the last passing script for an identical plan, or generate
+       one with Gemini (using edited TP); force_regenerate=true skips reuse
     7. Execute script, stream logs
     8. Store execution + optionally store reusable MADL methods
     """
     await websocket.accept()
+    frames = LogFrames.for_websocket(websocket)
+    llm_ledger.start_llm_usage(testcase_id)
     utils.logger.debug(f"[MADL-EXEC] WebSocket opened for {testcase_id}, {script_type}")
 
     # ---------------- JWT extraction & validation ----------------
@@ -269,10 +276,10 @@ async def execute_testcase_with_madl(
             token = auth_header.decode().split("Bearer ")[1].strip()
 
     if not token:
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "FAILED",
             "error": "Authorization token missing"
-        }))
+        })
         await websocket.close()
         return
 
@@ -282,15 +289,14 @@ async def execute_testcase_with_madl(
         if not userid:
             raise JWTError("userid missing in token")
     except JWTError as e:
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "FAILED",
             "error": f"Invalid token: {str(e)}"
-        }))
+        })
         await websocket.close()
         return
 
     conn = None
-    temp_file_path = None
     execution_output = ""
     execution_status = "FAILED"
     execution_message = "Unknown error"
@@ -305,10 +311,10 @@ async def execute_testcase_with_madl(
             testcase_id
         )
         if not tc_project:
-            await websocket.send_text(json.dumps({
+            await frames.send({
                 "status": "FAILED",
                 "error": "Test case not found"
-            }))
+            })
             await websocket.close()
             return
 
@@ -318,18 +324,18 @@ async def execute_testcase_with_madl(
             tc_project["projectid"]
         )
         if not access:
-            await websocket.send_text(json.dumps({
+            await frames.send({
                 "status": "FAILED",
                 "error": "Unauthorized test case access"
-            }))
+            })
             await websocket.close()
             return
 
         # ---------------- BUILD test plan ----------------
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "BUILDING_PLAN",
             "log": "Building test plan..."
-        }))
+        })
 
         prereq_chain = await utils.get_prereq_chain(conn, testcase_id)
 
@@ -361,17 +367,17 @@ async def execute_testcase_with_madl(
             )
 
         # Notify that test plan is ready
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "PLAN_READY",
             "log": "Test plan ready"
-        }))
+        })
 
         # ---------------- SEND TESTPLAN TO CLIENT TO EDIT (NEW) ----------------
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "TESTPLAN_READY",
             "log": "Test plan ready for review/editing",
             "testplan": testplan_dict
-        }))
+        })
 
         edited_testplan = None
         wait_start = datetime.now()
@@ -381,10 +387,10 @@ async def execute_testcase_with_madl(
         try:
             while True:
                 if (datetime.now() - wait_start).total_seconds() > EDIT_TIMEOUT_SECONDS:
-                    await websocket.send_text(json.dumps({
+                    await frames.send({
                         "status": "TESTPLAN_EDIT_TIMEOUT",
                         "log": "Timed out waiting for edited testplan; using original"
-                    }))
+                    })
                     break
 
                 try:
@@ -400,17 +406,17 @@ async def execute_testcase_with_madl(
                 action = data.get("action")
                 if action == "update_testplan":
                     edited_testplan = data.get("testplan")
-                    await websocket.send_text(json.dumps({
+                    await frames.send({
                         "status": "TESTPLAN_UPDATED",
                         "log": "Edited testplan received"
-                    }))
+                    })
                     break
 
                 elif action in ("skip_edit", "skip_methods", "continue"):
-                    await websocket.send_text(json.dumps({
+                    await frames.send({
                         "status": "TESTPLAN_SKIPPED",
                         "log": "Client skipped editing"
-                    }))
+                    })
                     break
 
         except WebSocketDisconnect:
@@ -431,15 +437,15 @@ async def execute_testcase_with_madl(
             active_testplan = testplan_dict
 
         # ---------------- MADL SEARCH ----------------
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "SEARCHING_MADL",
             "log": "Searching MADL for reusable methods..."
-        }))
+        })
 
         reusable_methods = await search_for_reusable_methods(active_testplan)
 
         if reusable_methods:
-            await websocket.send_text(json.dumps({
+            await frames.send({
                 "status": "METHODS_FOUND",
                 "methods": [
                     {
@@ -450,98 +456,136 @@ async def execute_testcase_with_madl(
                     for m in reusable_methods
                 ],
                 "log": f"Found {len(reusable_methods)} reusable methods"
-            }))
+            })
         else:
-            await websocket.send_text(json.dumps({
+            await frames.send({
                 "status": "NO_MADL_METHODS",
                 "log": "No reusable MADL methods found"
-            }))
+            })
 
         # ---------------- SCRIPT GENERATION ----------------
-        await websocket.send_text(json.dumps({
-            "status": "GENERATING",
-            "log": "Generating script using AI..."
-        }))
-
-        generated_script = await generate_script_with_madl(
-            testcase_id=testcase_id,
-            script_type=script_type,
-            script_lang="python",
-            testplan=active_testplan,
-            selected_madl_methods=None,
-            logger=None
-        )
+        selected_madl_methods = None
+        prompt_version = script_store.PROMPT_VERSIONS["generate_script_madl"]
+        script_hash = script_store.plan_hash(active_testplan, script_type, selected_madl_methods, prompt_version)
+        stored_script = None if force_regenerate else await script_store.find_passing_script(conn, script_hash)
+
+        if stored_script:
+            generated_script = stored_script["script"]
+            scriptid = stored_script["scriptid"]
+            script_reused = True
+            await frames.send({
+                "status": "SCRIPT_REUSED",
+                "scriptid": scriptid,
+                "log": f"Test plan unchanged; reusing script {scriptid} that last passed"
+            })
+        else:
+            await frames.send({
+                "status": "GENERATING",
+                "log": "Generating script using AI..."
+            })
+
+            async def send_chunk(chunk: str):
+                await frames.send({
+                    "status": "GENERATING_CHUNK",
+                    "chunk": chunk
+                })
+
+            generated_script = await generate_script_with_madl(
+                testcase_id=testcase_id,
+                script_type=script_type,
+                script_lang="python",
+                testplan=active_testplan,
+                selected_madl_methods=selected_madl_methods,
+                logger=None,
+                on_chunk=send_chunk
+            )
+            scriptid = await script_store.save_script(
+                conn, script_hash, testcase_id, script_type, prompt_version, generated_script
+            )
+            script_reused = False
+
+        # ---------------- PRE-FLIGHT ----------------
+        preflight = preflight_script(generated_script)
+        generated_script = preflight.script
+        await frames.send({
+            "status": "PREFLIGHT_OK" if preflight.ok else "PREFLIGHT_FAILED",
+            "log": preflight.report(),
+            "issues": [str(issue) for issue in preflight.issues]
+        })
+
+        if not preflight.ok:
+            # Broken script: heal with the precise error, as the unified path does
+            failed_report = preflight.report()
+            preflight_failure = None
+            try:
+                await frames.send({
+                    "status": "AUTO_HEALING",
+                    "log": "Pre-flight check failed. Starting auto-healing..."
+                })
+                healed_response = await ai_healing.self_heal(
+                    testplan_output=json.dumps(active_testplan),
+                    generated_script=generated_script,
+                    execution_logs=failed_report,
+                    screenshot=None,
+                    dom_snapshot=None
+                )
+                healed_code = healed_response.body.decode('utf-8') if hasattr(healed_response, 'body') else str(healed_response)
+                healed_preflight = preflight_script(healed_code)
+                if not healed_preflight.ok:
+                    raise ValueError(healed_preflight.report())
+
+                await script_store.record_script_status(conn, scriptid, "FAILED")
+                scriptid = await script_store.save_script(
+                    conn, script_hash, testcase_id, script_type, prompt_version, healed_preflight.script,
+                    healed_from=scriptid
+                )
+                script_reused = False
+                preflight = healed_preflight
+                generated_script = preflight.script
+                await frames.send({
+                    "status": "AUTO_HEALING",
+                    "log": "Script healed. Re-executing..."
+                })
+            except Exception as healing_error:
+                utils.logger.error(f"[HEALING] Self-healing failed: {str(healing_error)}")
+                preflight_failure = f"Pre-flight check failed and self-healing failed: {str(healing_error)}"
 
         # ---------------- SCRIPT EXECUTION ----------------
-        await websocket.send_text(json.dumps({
-            "status": "EXECUTING",
-            "log": "Starting execution..."
-        }))
-
-        with tempfile.NamedTemporaryFile(
-            mode="w", delete=False, suffix=".py", encoding="utf-8"
-        ) as tmp:
-            tmp.write(generated_script)
-            temp_file_path = tmp.name
-
-        process = subprocess.Popen(
-            [sys.executable, temp_file_path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            text=True,
-            encoding="utf-8",
-            errors="replace",
-            bufsize=1
-        )
+        if preflight.ok:
+            await frames.send({
+                "status": "EXECUTING",
+                "log": "Starting execution..."
+            })
 
-        while True:
-            if process.stdout is None:
-                break
+            async def stream_line(line: str):
+                await frames.line(line)
 
-            line = process.stdout.readline()
-            if not line:
-                break
+            script_result = await run_script(generated_script, on_line=stream_line)
+            execution_output = script_result.output
+            return_code = script_result.return_code
+            termination = script_result.termination
+            artifacts = script_result.artifacts
 
-            line = line.rstrip("\n")
-            if not line.strip():
-                continue
-
-            execution_output += line + "\n"
-
-            await websocket.send_text(json.dumps({
-                "status": "RUNNING",
-                "log": line
-            }))
-            await asyncio.sleep(0.01)
-
-        return_code = process.wait()
-
-        if return_code == 0:
-            execution_status = "SUCCESS"
-            execution_message = "Script executed successfully"
+            if return_code == 0:
+                execution_status = "SUCCESS"
+                execution_message = "Script executed successfully"
+            else:
+                execution_status = "FAILED"
+                execution_message = script_result.exit_message()
         else:
+            # Broken script: no interpreter or browser is launched for it
             execution_status = "FAILED"
-            execution_message = f"Script exited with code {return_code}"
+            execution_message = preflight_failure
+            execution_output = failed_report + "\n"
+            termination = None
+            artifacts = []
 
         # ---------------- SAVE EXECUTION ----------------
-        exeid = await utils.get_next_exeid(conn)
-        datestamp = datetime.now().date()
-        exetime = datetime.now().time()
-
-        await conn.execute(
-            """
-            INSERT INTO execution (exeid, testcaseid, scripttype, datestamp, exetime, message, output, status)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            """,
-            exeid,
-            testcase_id,
-            script_type,
-            datestamp,
-            exetime,
-            execution_message,
-            execution_output,
-            execution_status
+        exeid = await utils.save_execution(
+            conn, testcase_id, script_type, execution_message, execution_output, execution_status,
+            termination, artifacts
         )
+        await script_store.record_script_result(conn, scriptid, exeid, execution_status, script_reused)
 
         # ---------------- OPTIONAL: STORE MADL ----------------
         if execution_status == "SUCCESS":
@@ -557,19 +601,19 @@ async def execute_testcase_with_madl(
                 utils.logger.error(f"[MADL] Storage error: {str(e)}")
 
         # ---------------- FINAL STATUS ----------------
-        await websocket.send_text(json.dumps({
+        await frames.send({
             "status": "COMPLETED",
             "final_status": execution_status,
             "log": execution_message
-        }))
+        })
 
     except Exception as e:
         utils.logger.error(f"[MADL-EXEC] Unexpected error: {str(e)}")
         try:
-            await websocket.send_text(json.dumps({
+            await frames.send({
                 "status": "FAILED",
                 "error": str(e)
-            }))
+            })
         except:
             pass
 
@@ -577,12 +621,6 @@ async def execute_testcase_with_madl(
         if conn:
             await db.release_db_connection(conn)
 
-        if temp_file_path and os.path.exists(temp_file_path):
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
-
         try:
             await websocket.close()
         except:
@@ -594,16 +632,20 @@ async def execute_testcase_with_madl(
 async def execute_testcase_unified(
     websocket: WebSocket,
     testcase_id: str,
-    script_type: str
+    script_type: str,
+    force_regenerate: bool = False
 ):
     """
     Unified endpoint that handles:
     1. Dynamically building test plan from prerequisites and steps
-    2. Script generation from test plan
+    2. Script generation from test plan (the last passing script is reused
+       when the plan is unchanged, unless force_regenerate=true)
     3. Script execution with auto-healing on failure
     All in one seamless WebSocket flow.
     """
     await websocket.accept()
+    frames = LogFrames.for_websocket(websocket)
+    llm_ledger.start_llm_usage(testcase_id)
     utils.logger.debug(f"Unified WebSocket accepted for testcase_id: {testcase_id}, script_type: {script_type}")
 
     # Extract token from headers
@@ -616,7 +658,7 @@ async def execute_testcase_unified(
     if not token:
         error_msg = {"error": "Authorization token missing"}
         utils.logger.error(f"Validation failed: {error_msg}")
-        await websocket.send_text(json.dumps(error_msg))
+        await frames.send(error_msg)
         await websocket.close()
         return
 
@@ -625,7 +667,7 @@ async def execute_testcase_unified(
     if not current_user:
         error_msg = {"error": "Invalid or expired token"}
         utils.logger.error(f"Validation failed: {error_msg}")
-        await websocket.send_text(json.dumps(error_msg))
+        await frames.send(error_msg)
         await websocket.close()
         return
 
@@ -641,7 +683,7 @@ async def execute_testcase_unified(
         if script_type not in ["playwright", "selenium"]:
             error_msg = {"error": "Script type must be 'playwright' or 'selenium'"}
             utils.logger.error(f"Validation failed: {error_msg}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True
             return
@@ -654,7 +696,7 @@ async def execute_testcase_unified(
         if not tc_project:
             error_msg = {"error": "Test case not found"}
             utils.logger.error(f"Error: {error_msg} for testcase_id: {testcase_id}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True
             return
@@ -668,7 +710,7 @@ async def execute_testcase_unified(
         if not access:
             error_msg = {"error": "You are not authorized for this test case's project"}
             utils.logger.error(f"Error: {error_msg} for userid: {userid}, project_ids: {project_ids}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True
             return
@@ -678,11 +720,11 @@ async def execute_testcase_unified(
             "status": "STARTED",
             "log": f"Execution initialized for {testcase_id}"
         }
-        await websocket.send_text(json.dumps(initial_response))
+        await frames.send(initial_response)
 
         # 4. Build test plan from prerequisites and steps
         build_plan_log = {"status": "BUILDING_PLAN", "log": "Building test plan from prerequisites and steps..."}
-        await websocket.send_text(json.dumps(build_plan_log))
+        await frames.send(build_plan_log)
         
         try:
             # Get prerequisite chain
@@ -716,35 +758,100 @@ async def execute_testcase_unified(
             utils.logger.info(f"[UNIFIED] Test plan built successfully for {testcase_id}")
             
             plan_built_log = {"status": "PLAN_READY", "log": "Test plan built successfully"}
-            await websocket.send_text(json.dumps(plan_built_log))
+            await frames.send(plan_built_log)
             
         except Exception as e:
             error_msg = {"error": f"Failed to build test plan: {str(e)}"}
             utils.logger.error(f"Plan building error: {str(e)}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True
             return
 
-        # 5. GENERATE SCRIPT
-        generation_log = {"status": "GENERATING", "log": "Generating test script using AI..."}
-        await websocket.send_text(json.dumps(generation_log))
-        
+        # 5. GENERATE SCRIPT (or reuse the last passing one for this exact plan)
+        prompt_version = script_store.PROMPT_VERSIONS["generate_script"]
+        script_hash = script_store.plan_hash(testplan_dict, script_type, None, prompt_version)
+        stored_script = None if force_regenerate else await script_store.find_passing_script(conn, script_hash)
+        assembled = None
+        keyword_plan = None
+
+        async def send_chunk(chunk: str):
+            await frames.send({"status": "GENERATING_CHUNK", "chunk": chunk})
+
         try:
-            generated_script = await generate_script(
-                testcase_id=testcase_id,
-                script_type=script_type,
-                script_lang="python",
-                testplan=testplan_dict
-            )
-            utils.logger.info(f"[UNIFIED] Script generated successfully for {testcase_id}")
-            
-            generation_complete = {"status": "GENERATED", "log": f"Script generated ({len(generated_script)} bytes)"}
-            await websocket.send_text(json.dumps(generation_complete))
+            if stored_script:
+                generated_script = stored_script["script"]
+                scriptid = stored_script["scriptid"]
+                script_reused = True
+                reuse_log = {
+                    "status": "SCRIPT_REUSED",
+                    "scriptid": scriptid,
+                    "log": f"Test plan unchanged; reusing script {scriptid} that last passed"
+                }
+                await frames.send(reuse_log)
+            else:
+                # No passing script for this plan (or force_regenerate): a cached
+                # LLM answer would be the script that failed, so the cache is skipped
+                if config.KEYWORD_EXECUTOR_ENABLED and script_type == "playwright":
+                    try:
+                        keyword_plan = await keyword_executor.resolve_plan(testplan_dict, use_cache=False)
+                        await frames.send({
+                            "status": "KEYWORD_PLAN",
+                            "mapped": keyword_plan.mapped,
+                            "generated": keyword_plan.generated,
+                            "log": keyword_plan.summary()
+                        })
+                    except Exception as e:
+                        utils.logger.info(f"[KEYWORD] Not using step actions for {testcase_id}: {str(e)}")
+
+                if not keyword_plan and config.STEP_ASSEMBLY_ENABLED:
+                    await frames.send({
+                        "status": "ASSEMBLING",
+                        "log": "Assembling script from cached step snippets..."
+                    })
+                    try:
+                        assembled = await step_assembler.assemble_script(conn, script_type, testplan_dict, use_cache=False)
+                        await frames.send({"status": "ASSEMBLED", "log": assembled.summary()})
+                    except Exception as e:
+                        utils.logger.warning(f"[ASSEMBLY] Falling back to full generation for {testcase_id}: {str(e)}")
+
+                if keyword_plan:
+                    generated_script = keyword_executor.build_runner_script(keyword_plan)
+                elif assembled:
+                    generated_script = assembled.script
+                else:
+                    generation_log = {"status": "GENERATING", "log": "Generating test script using AI..."}
+                    await frames.send(generation_log)
+
+                    generated_script = await generate_script(
+                        testcase_id=testcase_id,
+                        script_type=script_type,
+                        script_lang="python",
+                        testplan=testplan_dict,
+                        on_chunk=send_chunk,
+                        use_cache=False
+                    )
+                utils.logger.info(f"[UNIFIED] Script generated successfully for {testcase_id}")
+                scriptid = await script_store.save_script(
+                    conn, script_hash, testcase_id, script_type, prompt_version, generated_script
+                )
+                script_reused = False
+
+                generation_complete = {"status": "GENERATED", "log": f"Script generated ({len(generated_script)} bytes)"}
+                await frames.send(generation_complete)
+
+            # Pre-flight runs as soon as the stream ends, before any process is spawned
+            preflight = preflight_script(generated_script)
+            generated_script = preflight.script
+            await frames.send({
+                "status": "PREFLIGHT_OK" if preflight.ok else "PREFLIGHT_FAILED",
+                "log": preflight.report(),
+                "issues": [str(issue) for issue in preflight.issues]
+            })
         except Exception as e:
             error_msg = {"error": f"Script generation failed: {str(e)}"}
             utils.logger.error(f"Generation error: {str(e)}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True
             return
@@ -752,144 +859,108 @@ async def execute_testcase_unified(
         
         # 6. EXECUTE with auto-healing (script is not saved, passed directly)
         execution_log = {"status": "EXECUTING", "log": "Starting script execution..."}
-        await websocket.send_text(json.dumps(execution_log))
+        await frames.send(execution_log)
 
-        # Execute directly without database fetch
-        import tempfile
         execution_logs = []
-        temp_file_path = None
+        execution_output = ""
+        execution_failed = False
+        failure_logs = ""
+
+        if preflight.ok:
+            async def stream_line(line: str):
+                execution_logs.append(line)
+                await frames.line(line)
+
+            script_result = await run_script(generated_script, on_line=stream_line)
+            execution_output = script_result.output
+            return_code = script_result.return_code
+            termination = script_result.termination
+            artifacts = list(script_result.artifacts)
+        else:
+            # Broken script: skip the launch and heal with the precise error
+            execution_logs.append(preflight.report())
+            execution_output = preflight.report() + "\n"
+            return_code = None
+            termination = None
+            artifacts = []
         
-        try:
-            # Create temp file with generated script
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as temp_file:
-                temp_file.write(generated_script)
-                temp_file_path = temp_file.name
-            
-            utils.logger.info(f"[EXEC] Executing generated script: {temp_file_path}")
-            
-            process = subprocess.Popen(
-                [sys.executable, temp_file_path],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,  # Combine stderr with stdout for unified logging
-                text=True,
-                encoding='utf-8',
-                errors='replace',
-                bufsize=1  # Line buffered for real-time output
-            )
-            
-            execution_output = ""
-            execution_failed = False
-            failure_logs = ""
-            
-            # Read output line-by-line and send to WebSocket in real-time
-            for line in process.stdout:
-                line = line.rstrip('\n')
-                if line.strip():
-                    execution_logs.append(line)
-                    execution_output += line + "\n"
-                    
-                    # Send each log line immediately to WebSocket
-                    log_response = {
-                        "status": "RUNNING",
-                        "log": line
-                    }
-                    await websocket.send_text(json.dumps(log_response))
-                    await asyncio.sleep(0.02)  # Small delay to allow client to process
-            
-            # Wait for process to complete
-            return_code = process.wait()
+        if return_code == 0:
+            utils.logger.info(f"[EXEC] Script executed successfully for {testcase_id}")
+            execution_status = "SUCCESS"
+            execution_message = "Script executed successfully"
+        else:
+            # Execution failed - trigger self-healing
+            execution_failed = True
+            failure_logs = execution_output
+            utils.logger.warning(f"[HEALING] Script failed for {testcase_id}, triggering self-healing...")
             
-            if return_code == 0:
-                utils.logger.info(f"[EXEC] Script executed successfully for {testcase_id}")
-                execution_status = "SUCCESS"
-                execution_message = "Script executed successfully"
-            else:
-                # Execution failed - trigger self-healing
-                execution_failed = True
-                failure_logs = execution_output
-                utils.logger.warning(f"[HEALING] Script failed for {testcase_id}, triggering self-healing...")
+            try:
+                from app.routers import ai_healing
                 
-                try:
-                    from app.routers import ai_healing
-                    
-                    # Send healing status to WebSocket
-                    healing_start = {"status": "AUTO_HEALING", "log": "Script execution failed. Starting auto-healing..."}
-                    await websocket.send_text(json.dumps(healing_start))
-                    
-                    healed_response = await ai_healing.self_heal(
-                        testplan_output=testplan_json,
-                        generated_script=generated_script,
-                        execution_logs=failure_logs,
-                        screenshot=None,
-                        dom_snapshot=None
-                    )
-                    
-                    # Extract healed code
-                    healed_code = healed_response.body.decode('utf-8') if hasattr(healed_response, 'body') else str(healed_response)
-                    
-                    # Send healing complete message
-                    healing_complete = {"status": "AUTO_HEALING", "log": "Script healed. Re-executing..."}
-                    await websocket.send_text(json.dumps(healing_complete))
-                    
-                    # Execute healed script
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as healed_file:
-                        healed_file.write(healed_code)
-                        healed_temp_path = healed_file.name
-                    
-                    utils.logger.info(f"[HEALING] Executing healed script: {healed_temp_path}")
-                    
-                    # Stream healed execution output line-by-line
-                    healed_process = subprocess.Popen(
-                        [sys.executable, healed_temp_path],
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.STDOUT,
-                        text=True,
-                        encoding='utf-8',
-                        errors='replace',
-                        bufsize=1
-                    )
-                    
-                    healed_output = ""
-                    for line in healed_process.stdout:
-                        line = line.rstrip('\n')
-                        if line.strip():
-                            execution_logs.append(f"[AUTO-HEALED] {line}")
-                            healed_output += line + "\n"
-                            
-                            # Send healed execution logs with AUTO-HEALED tag
-                            log_response = {
-                                "status": "RUNNING",
-                                "log": f"[AUTO-HEALED] {line}"
-                            }
-                            await websocket.send_text(json.dumps(log_response))
-                            await asyncio.sleep(0.02)
-                    
-                    healed_return_code = healed_process.wait()
-                    
-                    if healed_return_code == 0:
-                        utils.logger.info(f"[HEALING] Healed script executed successfully for {testcase_id}")
-                        execution_status = "SUCCESS"
-                        execution_message = "[AUTO-HEALED] Script executed successfully after self-healing"
-                        execution_output = healed_output
-                    else:
-                        utils.logger.error(f"[HEALING] Healed script still failed")
-                        execution_status = "FAILED"
-                        execution_message = "[AUTO-HEALED] Script failed even after self-healing"
-                        execution_output = healed_output
-                    
-                    if 'healed_temp_path' in locals() and os.path.exists(healed_temp_path):
-                        os.unlink(healed_temp_path)
+                # Send healing status to WebSocket
+                healing_reason = "Script execution failed" if preflight.ok else "Pre-flight check failed"
+                healing_start = {"status": "AUTO_HEALING", "log": f"{healing_reason}. Starting auto-healing..."}
+                await frames.send(healing_start)
+                
+                healed_response = await ai_healing.self_heal(
+                    testplan_output=testplan_json,
+                    generated_script=generated_script,
+                    execution_logs=failure_logs,
+                    screenshot=None,
+                    dom_snapshot=None
+                )
+                
+                # Extract healed code
+                healed_code = healed_response.body.decode('utf-8') if hasattr(healed_response, 'body') else str(healed_response)
                 
-                except Exception as healing_error:
-                    utils.logger.error(f"[HEALING] Self-healing failed: {str(healing_error)}")
+                healed_preflight = preflight_script(healed_code)
+                healed_code = healed_preflight.script
+                if not healed_preflight.ok:
+                    raise ValueError(healed_preflight.report())
+
+                # Send healing complete message
+                healing_complete = {"status": "AUTO_HEALING", "log": "Script healed. Re-executing..."}
+                await frames.send(healing_complete)
+                
+                # Stream healed execution output with the AUTO-HEALED tag
+                async def stream_healed_line(line: str):
+                    execution_logs.append(f"[AUTO-HEALED] {line}")
+                    await frames.line(f"[AUTO-HEALED] {line}")
+
+                utils.logger.info(f"[HEALING] Executing healed script for {testcase_id}")
+                healed_result = await run_script(healed_code, on_line=stream_healed_line)
+                healed_output = healed_result.output
+                healed_return_code = healed_result.return_code
+                termination = healed_result.termination
+                artifacts += healed_result.artifacts
+
+                # The healed script becomes the latest version for this plan
+                await script_store.record_script_status(conn, scriptid, "FAILED")
+                scriptid = await script_store.save_script(
+                    conn, script_hash, testcase_id, script_type, prompt_version, healed_code,
+                    healed_from=scriptid
+                )
+                script_reused = False
+
+                if healed_return_code == 0:
+                    utils.logger.info(f"[HEALING] Healed script executed successfully for {testcase_id}")
+                    execution_status = "SUCCESS"
+                    execution_message = "[AUTO-HEALED] Script executed successfully after self-healing"
+                    execution_output = healed_output
+                else:
+                    utils.logger.error(f"[HEALING] Healed script still failed")
                     execution_status = "FAILED"
-                    execution_message = f"Script failed and self-healing failed: {str(healing_error)}"
-                    execution_output = failure_logs
-        
-        finally:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-        
+                    execution_message = "[AUTO-HEALED] Script failed even after self-healing"
+                    if termination:
+                        execution_message += f" ({termination})"
+                    execution_output = healed_output
+
+            except Exception as healing_error:
+                utils.logger.error(f"[HEALING] Self-healing failed: {str(healing_error)}")
+                execution_status = "FAILED"
+                execution_message = f"Script failed and self-healing failed: {str(healing_error)}"
+                execution_output = failure_logs
+
         # Send final status
         final_response = {
             "status": "COMPLETED",
@@ -899,21 +970,19 @@ async def execute_testcase_unified(
         if execution_status == "FAILED":
             final_response["error"] = execution_message
         
-        await websocket.send_text(json.dumps(final_response))
+        await frames.send(final_response)
         utils.logger.debug(f"Sent completion status: {execution_status}")
 
         # Save to execution table
-        exeid = await utils.get_next_exeid(conn)
-        datestamp = datetime.now().date()
-        exetime = datetime.now().time()
-        await conn.execute(
-            """
-            INSERT INTO execution (exeid, testcaseid, scripttype, datestamp, exetime, message, output, status)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            """,
-            exeid, testcase_id, script_type, datestamp, exetime, execution_message, 
-            execution_output, execution_status
+        exeid = await utils.save_execution(
+            conn, testcase_id, script_type, execution_message, execution_output, execution_status,
+            termination, artifacts
         )
+        await script_store.record_script_result(conn, scriptid, exeid, execution_status, script_reused)
+
+        # Snippets of an assembled script that passed without healing become reusable
+        if assembled and execution_status == "SUCCESS" and not execution_failed:
+            await step_assembler.remember_snippets(conn, testcase_id, assembled)
 
     except WebSocketDisconnect as e:
         utils.logger.error(f"Client disconnected for testcase {testcase_id}: {str(e)}")
@@ -921,14 +990,14 @@ async def execute_testcase_unified(
         utils.logger.error(f"HTTPException during execution for testcase {testcase_id}: {str(e)}")
         try:
             error_response = {"error": f"Execution failed: {str(e.detail)}", "status": "FAILED"}
-            await websocket.send_text(json.dumps(error_response))
+            await frames.send(error_response)
         except:
             pass
     except Exception as e:
         utils.logger.error(f"Execution failed for testcase {testcase_id}: {str(e)}")
         try:
             error_response = {"error": f"Execution failed: {str(e)}", "status": "FAILED"}
-            await websocket.send_text(json.dumps(error_response))
+            await frames.send(error_response)
         except:
             pass
     finally:
@@ -948,6 +1017,8 @@ async def execute_testcase(
     script_type: str
 ):
     await websocket.accept()
+    frames = LogFrames.for_websocket(websocket)
+    llm_ledger.start_llm_usage(testcase_id)
     utils.logger.debug(f"WebSocket accepted for testcase_id: {testcase_id}, script_type: {script_type}")
 
     # Extract token from headers
@@ -960,7 +1031,7 @@ async def execute_testcase(
     if not token:
         error_msg = {"error": "Authorization token missing"}
         utils.logger.error(f"Validation failed: {error_msg}")
-        await websocket.send_text(json.dumps(error_msg))
+        await frames.send(error_msg)
         await websocket.close()
         return
 
@@ -969,7 +1040,7 @@ async def execute_testcase(
     if not current_user:
         error_msg = {"error": "Invalid or expired token"}
         utils.logger.error(f"Validation failed: {error_msg}")
-        await websocket.send_text(json.dumps(error_msg))
+        await frames.send(error_msg)
         await websocket.close()
         return
 
@@ -985,7 +1056,7 @@ async def execute_testcase(
         if script_type not in ["playwright", "selenium"]:
             error_msg = {"error": "Script type must be 'playwright' or 'selenium'"}
             utils.logger.error(f"Validation failed: {error_msg}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True  # Mark connection as closed
             return
@@ -998,7 +1069,7 @@ async def execute_testcase(
         if not tc_project:
             error_msg = {"error": "Test case not found"}
             utils.logger.error(f"Error: {error_msg} for testcase_id: {testcase_id}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True  # Mark connection as closed
             return
@@ -1012,7 +1083,7 @@ async def execute_testcase(
         if not access:
             error_msg = {"error": "You are not authorized for this test case's project"}
             utils.logger.error(f"Error: {error_msg} for userid: {userid}, project_ids: {project_ids}")
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True  # Mark connection as closed
             return
@@ -1025,7 +1096,7 @@ async def execute_testcase(
         if not script_row or not script_row["script"]:
             utils.logger.error(f"No script found for testcase_id: {testcase_id}, script_row: {script_row}")
             error_msg = {"error": "No script found for this test case"}
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True  # Mark connection as closed
             return
@@ -1046,21 +1117,21 @@ async def execute_testcase(
         except json.JSONDecodeError as e:
             utils.logger.error(f"Failed to parse script JSON: {str(e)}")
             error_msg = {"error": f"Invalid script JSON format: {str(e)}"}
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True  # Mark connection as closed
             return
         except ValueError as e:
             utils.logger.error(f"Script JSON error: {str(e)}")
             error_msg = {"error": str(e)}
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True  # Mark connection as closed
             return
         except Exception as e:
             utils.logger.error(f"Unexpected error processing script JSON: {str(e)}")
             error_msg = {"error": f"Unexpected error: {str(e)}"}
-            await websocket.send_text(json.dumps(error_msg))
+            await frames.send(error_msg)
             await websocket.close()
             connection_closed = True  # Mark connection as closed
             return
@@ -1070,7 +1141,7 @@ async def execute_testcase(
             "status": "STARTED",
             "log": f"Execution initialized for {testcase_id}"
         }
-        await websocket.send_text(json.dumps(initial_response))
+        await frames.send(initial_response)
         utils.logger.debug("Sent initial status")
 
         # Execute with auto-healing
@@ -1081,15 +1152,10 @@ async def execute_testcase(
             user_id=userid
         )
         
-        # Send execution logs line by line
+        # Send execution logs, coalesced into frames
         for log_line in execution_result.get("logs", []):
             if log_line.strip():
-                log_response = {
-                    "status": "RUNNING",
-                    "log": log_line.strip()
-                }
-                await websocket.send_text(json.dumps(log_response))
-                await asyncio.sleep(0.05)
+                await frames.line(log_line.strip())
         
         # Send final status
         final_status = "SUCCESS" if execution_result["status"] == "SUCCESS" else "FAILED"
@@ -1105,20 +1171,13 @@ async def execute_testcase(
         if final_status == "FAILED":
             final_response["error"] = final_message
         
-        await websocket.send_text(json.dumps(final_response))
+        await frames.send(final_response)
         utils.logger.debug(f"Sent completion status: {final_status}")
 
         # Save to execution table
-        exeid = await utils.get_next_exeid(conn)
-        datestamp = datetime.now().date()
-        exetime = datetime.now().time()
-        await conn.execute(
-            """
-            INSERT INTO execution (exeid, testcaseid, scripttype, datestamp, exetime, message, output, status)
-            VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
-            """,
-            exeid, testcase_id, script_type, datestamp, exetime, final_message, 
-            execution_result.get("output", ""), final_status
+        await utils.save_execution(
+            conn, testcase_id, script_type, final_message, execution_result.get("output", ""), final_status,
+            execution_result.get("termination"), execution_result.get("artifacts", [])
         )
 
     except WebSocketDisconnect as e:
@@ -1127,14 +1186,14 @@ async def execute_testcase(
         utils.logger.error(f"HTTPException during execution for testcase {testcase_id}: {str(e)}")
         try:
             error_response = {"error": f"Execution failed: {str(e.detail)}", "status": "FAILED"}
-            await websocket.send_text(json.dumps(error_response))
+            await frames.send(error_response)
         except:
             pass
     except Exception as e:
         utils.logger.error(f"Execution failed for testcase {testcase_id}: {str(e)}")
         try:
             error_response = {"error": f"Execution failed: {str(e)}", "status": "FAILED"}
-            await websocket.send_text(json.dumps(error_response))
+            await frames.send(error_response)
         except:
             pass
     finally:
@@ -1229,40 +1288,48 @@ async def execute_code(file: UploadFile, script_type: str, token: str = Depends(
             class_name = os.path.splitext(file.filename)[0]
             compile_cmd = ["javac", temp_file_path]
             run_cmd = ["java", class_name]
-            subprocess.run(compile_cmd, check=True, capture_output=True, text=True)
+            compile_result = await run_command(compile_cmd)
+            if compile_result.return_code != 0:
+                raise HTTPException(status_code=500, detail=f"Execution failed: {compile_result.stderr}")
             cmd = run_cmd
         else:
             raise HTTPException(status_code=500, detail="Unsupported language")
 
-        def generate_logs():
-            process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-            while True:
-                output = process.stdout.readline()
-                error = process.stderr.readline()
-                if output:
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    yield f"[{timestamp}] {output.strip()}\n"
-                if error:
-                    timestamp = datetime.now().strftime("%H:%M:%S")
-                    yield f"[{timestamp}] ERROR: {error.strip()}\n"
-                if process.poll() is not None:
-                    break
-            # Ensure all remaining output is sent
-            for line in process.stdout:
+        async def generate_logs():
+            # Both pipes are drained concurrently into one queue, in arrival order
+            queue: asyncio.Queue = asyncio.Queue()
+
+            async def put_output(line: str):
                 timestamp = datetime.now().strftime("%H:%M:%S")
-                yield f"[{timestamp}] {line.strip()}\n"
-            for line in process.stderr:
+                await queue.put(f"[{timestamp}] {line.strip()}\n")
+
+            async def put_error(line: str):
                 timestamp = datetime.now().strftime("%H:%M:%S")
-                yield f"[{timestamp}] ERROR: {line.strip()}\n"
-            os.unlink(temp_file_path)  # Clean up temporary file
+                await queue.put(f"[{timestamp}] ERROR: {line.strip()}\n")
+
+            async def run():
+                try:
+                    await run_command(cmd, on_line=put_output, on_stderr_line=put_error)
+                finally:
+                    await queue.put(None)
+
+            task = asyncio.create_task(run())
+            try:
+                while True:
+                    item = await queue.get()
+                    if item is None:
+                        break
+                    yield item
+                await task
+            finally:
+                if not task.done():
+                    task.cancel()
+                os.unlink(temp_file_path)  # Clean up temporary file
 
         return StreamingResponse(generate_logs(), media_type="text/plain")
 
     except HTTPException:
         raise
-    except subprocess.CalledProcessError as e:
-        utils.logger.error(f"Execution failed: {e}")
-        raise HTTPException(status_code=500, detail=f"Execution failed: {e.stderr}")
     except Exception as e:
         utils.logger.error(f"Unexpected error: {e}")
         raise HTTPException(status_code=500, detail=f"Unexpected error: {e}")
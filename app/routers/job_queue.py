@@ -0,0 +1,204 @@
+"""
+Execution Job Queue
+Durable execution_job table that moves script runs off the API host. The
+API enqueues a script and follows it; worker nodes (app/worker.py, any
+number, on any machine that reaches the database) claim jobs with
+SELECT ... FOR UPDATE SKIP LOCKED and hold a lease that they renew by
+heartbeat while the script runs. Output lines come back through
+execution_job_log. A job whose lease runs out (worker crashed or lost the
+database) is claimed again by another node, up to
+EXECUTION_QUEUE_MAX_ATTEMPTS times.
+New jobs and new log lines are announced with NOTIFY so both sides react at
+once; both also poll, so a missed notification only costs a poll interval.
+Artifacts go to the shared artifact store on the worker node; the job only
+carries their refs back.
+"""
+
+import asyncio
+import json
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+import asyncpg
+
+import config
+import database as db
+import utils
+from routers.artifacts import ArtifactRef
+from routers.script_runner import ScriptResult
+
+QUEUED_CHANNEL = "execution_job_queued"  # payload: jobid; worker nodes listen
+LOG_CHANNEL = "execution_job_log"  # payload: jobid; the API listens
+FINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED")
+
+# Claimable: queued, or running on a worker whose lease expired
+CLAIM_SQL = """
+UPDATE execution_job
+SET status = 'RUNNING', workerid = $1, attempts = attempts + 1,
+    lease_until = NOW() + make_interval(secs => $2), started_at = NOW()
+WHERE jobid = (
+    SELECT jobid FROM execution_job
+    WHERE (status = 'QUEUED' OR (status = 'RUNNING' AND lease_until < NOW()))
+      AND attempts < $3
+    ORDER BY created_at
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING jobid, script, attempts
+"""
+
+EXPIRE_SQL = """
+UPDATE execution_job
+SET status = 'FAILED', finished_at = NOW(), return_code = 1,
+    output = 'Worker lease expired ' || attempts || ' times; giving up',
+    termination = 'Worker lease expired ' || attempts || ' times'
+WHERE status = 'RUNNING' AND lease_until < NOW() AND attempts >= $1
+"""
+
+HEARTBEAT_SQL = """
+UPDATE execution_job SET lease_until = NOW() + make_interval(secs => $3)
+WHERE jobid = $1 AND workerid = $2 AND status = 'RUNNING'
+RETURNING jobid
+"""
+
+FINISH_SQL = """
+UPDATE execution_job
+SET status = $3, return_code = $4, output = $5, stdout = $6, stderr = $7, termination = $8,
+    artifacts = $9::jsonb, finished_at = NOW()
+WHERE jobid = $1 AND workerid = $2 AND status = 'RUNNING'
+"""
+
+# Worker node shutting down: hand the job to another node without using up an attempt
+RELEASE_SQL = """
+UPDATE execution_job SET status = 'QUEUED', workerid = NULL, lease_until = NULL, attempts = attempts - 1
+WHERE jobid = $1 AND workerid = $2 AND status = 'RUNNING'
+"""
+
+
+class JobQueue:
+    """API side: enqueue scripts and follow them to completion"""
+
+    def __init__(self):
+        self.is_ready = False
+        self._listener: Optional[asyncpg.Connection] = None
+        self._wakeups: Dict[str, asyncio.Event] = {}
+
+    async def start(self):
+        try:
+            self._listener = await asyncpg.connect(config.DB_URL)
+            await self._listener.add_listener(LOG_CHANNEL, self._on_notify)
+            self.is_ready = True
+            utils.logger.info("[JOB-QUEUE] Scripts run on worker nodes")
+        except Exception as e:
+            utils.logger.warning(f"[JOB-QUEUE] Queue listener failed to start, running scripts locally: {str(e)}")
+
+    async def stop(self):
+        self.is_ready = False
+        if self._listener:
+            await self._listener.close()
+            self._listener = None
+
+    def _on_notify(self, connection, pid, channel, payload):
+        wakeup = self._wakeups.get(payload)
+        if wakeup:
+            wakeup.set()
+
+    def accepts(self, env: Optional[Dict[str, str]]) -> bool:
+        # env carries paths on this host (session handoff files), meaningless on a worker node
+        return self.is_ready and not env
+
+    async def run(
+        self,
+        script_content: str,
+        on_line: Optional[Callable[[str], Awaitable[None]]] = None
+    ) -> ScriptResult:
+        """Enqueue one script, stream its output lines to on_line and return its result"""
+        jobid = f"JOB-{uuid.uuid4().hex[:16].upper()}"
+        wakeup = asyncio.Event()
+        self._wakeups[jobid] = wakeup
+        last_seq = 0
+        finished = False
+        loop = asyncio.get_running_loop()
+        waiting_since = loop.time()
+
+        try:
+            conn = await db.get_db_connection()
+            try:
+                await conn.execute(
+                    "INSERT INTO execution_job (jobid, script, status) VALUES ($1, $2, 'QUEUED')",
+                    jobid, script_content
+                )
+                await conn.execute("SELECT pg_notify($1, $2)", QUEUED_CHANNEL, jobid)
+            finally:
+                await db.release_db_connection(conn)
+
+            while True:
+                wakeup.clear()
+                conn = await db.get_db_connection()
+                try:
+                    # Status before logs: lines written before the job finished are then all visible
+                    job = await conn.fetchrow(
+                        """
+                        SELECT status, return_code, output, stdout, stderr, termination, artifacts,
+                               (status = 'QUEUED' OR lease_until < NOW()) AS unclaimed
+                        FROM execution_job WHERE jobid = $1
+                        """,
+                        jobid
+                    )
+                    rows = await conn.fetch(
+                        "SELECT seq, line FROM execution_job_log WHERE jobid = $1 AND seq > $2 ORDER BY seq",
+                        jobid, last_seq
+                    )
+                finally:
+                    await db.release_db_connection(conn)
+
+                for row in rows:
+                    last_seq = row["seq"]
+                    if on_line:
+                        await on_line(row["line"])
+
+                if job["status"] in FINAL_STATUSES:
+                    finished = True
+                    return ScriptResult(
+                        return_code=job["return_code"] if job["return_code"] is not None else 1,
+                        output=job["output"] or "",
+                        stdout=job["stdout"] or "",
+                        stderr=job["stderr"] or "",
+                        termination=job["termination"],
+                        artifacts=[ArtifactRef(**ref) for ref in json.loads(job["artifacts"] or "[]")]
+                    )
+
+                if not job["unclaimed"]:
+                    waiting_since = loop.time()
+                elif loop.time() - waiting_since > config.EXECUTION_QUEUE_CLAIM_TIMEOUT:
+                    message = f"No worker node took job {jobid} within {config.EXECUTION_QUEUE_CLAIM_TIMEOUT}s"
+                    utils.logger.error(f"[JOB-QUEUE] {message}")
+                    return ScriptResult(
+                        return_code=1, output=message + "\n", stderr=message + "\n", termination=message
+                    )
+
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout=config.EXECUTION_QUEUE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._wakeups.pop(jobid, None)
+            if not finished:
+                # Caller went away or nobody took the job: the worker's next heartbeat stops the run
+                try:
+                    conn = await db.get_db_connection()
+                    try:
+                        await conn.execute(
+                            """
+                            UPDATE execution_job SET status = 'CANCELLED', finished_at = NOW()
+                            WHERE jobid = $1 AND status IN ('QUEUED', 'RUNNING')
+                            """,
+                            jobid
+                        )
+                    finally:
+                        await db.release_db_connection(conn)
+                except Exception as e:
+                    utils.logger.warning(f"[JOB-QUEUE] Could not cancel job {jobid}: {str(e)}")
+
+
+job_queue = JobQueue()
@@ -0,0 +1,151 @@
+"""
+Keyword-Driven Step Execution
+Maps the test plan's BDD steps and args onto the registered handlers in
+step_actions and produces a small runner script that executes them directly.
+Only steps no handler matches go to the LLM (one call for all of them, as
+async snippets); a fully mapped test case needs no generation at all.
+The runner script goes through pre-flight, execution and healing like any
+generated script.
+"""
+
+import ast
+import os
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from azure_openai_client import call_openai_api
+from routers import step_actions
+from routers.step_assembler import PlanStep, parse_sections, plan_steps
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNNER_TEMPLATE = '''"""
+Keyword-driven test run. step_actions.run_steps prints the
+'Running action' / 'Action completed' / 'Action ... failed' line for each step.
+"""
+import asyncio
+import sys
+
+sys.path.insert(0, {app_dir!r})
+from routers import step_actions
+
+STEPS = {steps!r}
+
+sys.exit(asyncio.run(step_actions.run_steps(STEPS)))
+'''
+
+
+@dataclass
+class KeywordPlan:
+    steps: List[PlanStep]
+    mapped: int
+    generated: int
+
+    def summary(self) -> str:
+        return (
+            f"Keyword plan: {self.mapped} of {len(self.steps)} steps mapped to step actions, "
+            f"{self.generated} generated"
+        )
+
+
+def _build_prompt(steps: List[PlanStep]) -> str:
+    listing = []
+    for i, step in enumerate(steps, start=1):
+        data = f" | test data: {step.arg}" if step.arg else ""
+        status = "handled by the library" if step.code is None else "WRITE THIS"
+        listing.append(f"{i}. [{status}] {step.step}{data}")
+    sections = [f"### STEP {i}" for i, s in enumerate(steps, start=1) if s.code is not None]
+
+    return f"""You write the body of an async Python function for individual test steps.
+Each body runs as `async def step(page, arg)` where `page` is a Playwright async API
+page already on the state left by the previous step and `arg` is the step's test data.
+- Await every Playwright call. No imports, no browser setup or teardown, no print.
+- Raise an exception when the step cannot be completed.
+- `re` and `asyncio` are available.
+
+Test steps in order:
+{chr(10).join(listing)}
+
+Output ONLY these sections, each starting with its marker line exactly as shown,
+with code at column 0 and no markdown or explanations:
+{chr(10).join(sections)}
+"""
+
+
+async def resolve_plan(testplan: Dict[str, Any], use_cache: bool = True) -> KeywordPlan:
+    """
+    Match every plan step to a step action and generate snippets for the rest.
+    Unmatched steps are marked with code="" until the LLM fills them in
+    (use_cache=False skips the LLM response cache).
+    Raises ValueError when the plan is empty, nothing maps or the LLM output
+    cannot be used, so the caller can fall back to assembly/generation.
+    """
+    steps = plan_steps(testplan, "playwright")
+    if not steps:
+        raise ValueError("Test plan has no steps")
+
+    unmapped = [s for s in steps if step_actions.match_action(s.step, s.arg) is None]
+    if len(unmapped) == len(steps):
+        raise ValueError("No step matches a step action")
+    for step in steps:
+        step.source = "action"
+    for step in unmapped:
+        step.code, step.source = "", "llm"
+
+    if unmapped:
+        text = await call_openai_api(
+            prompt=_build_prompt(steps),
+            max_tokens=3000,
+            system_message="You are a test automation expert. Output only the requested code sections.",
+            cache="keyword_executor" if use_cache else None,
+            endpoint="keyword_executor"
+        )
+        sections = parse_sections(text)
+        for i, step in enumerate(steps, start=1):
+            if step.code is None:
+                continue
+            if f"STEP {i}" not in sections:
+                raise ValueError(f"AI output is missing STEP {i}")
+            step.code = sections[f"STEP {i}"]
+            try:
+                step_actions.compile_snippet(step.code)
+            except SyntaxError as e:
+                raise ValueError(f"STEP {i} does not compile: {e.msg} (line {e.lineno})")
+            except ValueError as e:
+                raise ValueError(f"STEP {i} failed pre-flight: {e}")
+
+    return KeywordPlan(steps=steps, mapped=len(steps) - len(unmapped), generated=len(unmapped))
+
+
+def build_runner_script(plan: KeywordPlan) -> str:
+    """Python script that runs the resolved steps with step_actions.run_steps"""
+    steps = []
+    for step in plan.steps:
+        entry = {"step": step.step, "arg": step.arg}
+        if step.source == "llm":
+            entry["code"] = step.code
+        steps.append(entry)
+    return RUNNER_TEMPLATE.format(app_dir=APP_DIR, steps=steps)
+
+
+def runner_steps(script_content: str) -> Optional[List[Dict[str, str]]]:
+    """
+    The STEPS of an unmodified runner script, or None for any other script
+    (including a runner the healer rewrote), so the context host only ever
+    runs plans that build_runner_script produced.
+    """
+    if "step_actions.run_steps(STEPS)" not in script_content:
+        return None
+    try:
+        tree = ast.parse(script_content)
+        for node in tree.body:
+            if isinstance(node, ast.Assign) and [getattr(t, "id", None) for t in node.targets] == ["STEPS"]:
+                steps = ast.literal_eval(node.value)
+                break
+        else:
+            return None
+    except (SyntaxError, ValueError):
+        return None
+    if RUNNER_TEMPLATE.format(app_dir=APP_DIR, steps=steps) != script_content:
+        return None
+    return steps
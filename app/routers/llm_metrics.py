@@ -0,0 +1,108 @@
+"""
+LLM Metrics Endpoints
+Exposes the Azure OpenAI call limiter state (queue depth, in-flight calls,
+queue wait times) and response cache hit rates for this API process, and
+per-project aggregates from the LLM usage ledger.
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from routers.users import get_current_any_user
+import azure_openai_client
+import database as db
+
+router = APIRouter()
+
+
+@router.get("/llm/metrics")
+async def get_llm_metrics(current_user: dict = Depends(get_current_any_user)):
+    """Current LLM concurrency metrics for this API process"""
+    return azure_openai_client.get_llm_metrics()
+
+
+@router.get("/projects/{projectid}/llm-usage")
+async def get_project_llm_usage(
+    projectid: str,
+    limit: int = 10,
+    current_user: dict = Depends(get_current_any_user)
+):
+    """
+    LLM cost and latency for a project's test cases:
+    - totals per endpoint/model (ordered by tokens spent)
+    - the executions that spent the most tokens
+    """
+    conn = None
+    try:
+        conn = await db.get_db_connection()
+
+        user_projects = await conn.fetchrow(
+            "SELECT projectid FROM projectuser WHERE userid = $1",
+            current_user["userid"]
+        )
+        if not user_projects or not user_projects["projectid"] or projectid not in user_projects["projectid"]:
+            raise HTTPException(status_code=403, detail="You do not have access to this project")
+
+        by_endpoint = await conn.fetch(
+            """
+            SELECT l.endpoint,
+                   l.model,
+                   COUNT(*) AS calls,
+                   COALESCE(SUM(l.prompt_tokens), 0) AS prompt_tokens,
+                   COALESCE(SUM(l.completion_tokens), 0) AS completion_tokens,
+                   ROUND(AVG(l.latency_ms)::numeric, 2) AS avg_latency_ms,
+                   ROUND(MAX(l.latency_ms)::numeric, 2) AS max_latency_ms,
+                   ROUND(AVG(l.queue_wait_ms)::numeric, 2) AS avg_queue_wait_ms,
+                   SUM(CASE WHEN l.cache_hit THEN 1 ELSE 0 END) AS cache_hits,
+                   SUM(CASE WHEN l.coalesced THEN 1 ELSE 0 END) AS coalesced
+            FROM llm_call l
+            JOIN testcase t ON t.testcaseid = l.testcaseid
+            WHERE $1 = ANY(t.projectid)
+            GROUP BY l.endpoint, l.model
+            ORDER BY SUM(l.prompt_tokens + l.completion_tokens) DESC
+            """,
+            projectid
+        )
+
+        top_executions = await conn.fetch(
+            """
+            SELECT e.exeid, e.testcaseid, e.status, e.datestamp,
+                   e.llm_calls, e.llm_prompt_tokens, e.llm_completion_tokens, e.llm_latency_ms
+            FROM execution e
+            JOIN testcase t ON t.testcaseid = e.testcaseid
+            WHERE $1 = ANY(t.projectid) AND COALESCE(e.llm_calls, 0) > 0
+            ORDER BY e.llm_prompt_tokens + e.llm_completion_tokens DESC
+            LIMIT $2
+            """,
+            projectid, limit
+        )
+
+        endpoints = [
+            {
+                **dict(row),
+                "avg_latency_ms": float(row["avg_latency_ms"] or 0),
+                "max_latency_ms": float(row["max_latency_ms"] or 0),
+                "avg_queue_wait_ms": float(row["avg_queue_wait_ms"] or 0)
+            }
+            for row in by_endpoint
+        ]
+        return {
+            "projectid": projectid,
+            "totals": {
+                "calls": sum(e["calls"] for e in endpoints),
+                "prompt_tokens": sum(e["prompt_tokens"] for e in endpoints),
+                "completion_tokens": sum(e["completion_tokens"] for e in endpoints)
+            },
+            "by_endpoint": endpoints,
+            "top_executions": [
+                {**dict(row), "datestamp": str(row["datestamp"])}
+                for row in top_executions
+            ]
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to load LLM usage: {str(e)}")
+    finally:
+        if conn:
+            await db.release_db_connection(conn)
@@ -0,0 +1,107 @@
+"""
+Log Frames
+Websocket output of the execution endpoints. Script output lines are
+coalesced into one RUNNING frame per LOG_FRAME_INTERVAL_MS or
+LOG_FRAME_MAX_LINES lines, whichever comes first, instead of a frame per
+line; "log" holds the lines joined by newlines and "line_count" their number.
+Frames go out from a background sender, so a slow client makes lines queue
+up (sent as full frames of LOG_FRAME_MAX_LINES back to back) instead of
+stalling the script. Only when LOG_FRAME_MAX_PENDING lines are waiting does
+line() block, and that pushes back on the script's output pipe.
+Status frames sent with send() first flush the pending lines, so ordering is
+kept.
+Clients connecting with ?format=msgpack get binary msgpack frames of the
+same shape (when msgpack is installed).
+"""
+
+import asyncio
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import WebSocket
+
+import config
+
+try:
+    import msgpack
+except ImportError:  # msgpack missing: every client gets JSON text frames
+    msgpack = None
+
+
+class LogFrames:
+    def __init__(self, websocket: WebSocket, binary: bool = False):
+        self.websocket = websocket
+        self.binary = binary and msgpack is not None
+        self.interval = config.LOG_FRAME_INTERVAL_MS / 1000
+        self.max_lines = max(1, config.LOG_FRAME_MAX_LINES)
+        self.max_pending = max(self.max_lines, config.LOG_FRAME_MAX_PENDING)
+        self._pending: List[Tuple[Dict[str, Any], str]] = []
+        self._full = asyncio.Event()
+        self._room = asyncio.Event()
+        self._room.set()
+        self._lock = asyncio.Lock()
+        self._sender: Optional[asyncio.Task] = None
+        self._error: Optional[BaseException] = None
+
+    @classmethod
+    def for_websocket(cls, websocket: WebSocket) -> "LogFrames":
+        return cls(websocket, binary=websocket.query_params.get("format") == "msgpack")
+
+    async def _send_raw(self, payload: Dict[str, Any]):
+        if self.binary:
+            await self.websocket.send_bytes(msgpack.packb(payload, default=str))
+        else:
+            await self.websocket.send_text(json.dumps(payload))
+
+    async def _drain(self):
+        """Send everything pending; consecutive lines with the same fields share a frame"""
+        while self._pending:
+            fields = self._pending[0][0]
+            count = 1
+            while count < min(len(self._pending), self.max_lines) and self._pending[count][0] == fields:
+                count += 1
+            batch = [line for _, line in self._pending[:count]]
+            del self._pending[:count]
+            if len(self._pending) < self.max_pending:
+                self._room.set()
+            await self._send_raw({"status": "RUNNING", **fields, "log": "\n".join(batch), "line_count": count})
+
+    async def _run_sender(self):
+        try:
+            while self._pending:
+                if len(self._pending) < self.max_lines:
+                    try:
+                        await asyncio.wait_for(self._full.wait(), timeout=self.interval)
+                    except asyncio.TimeoutError:
+                        pass
+                self._full.clear()
+                async with self._lock:
+                    await self._drain()
+        except Exception as e:
+            # Client gone: the next line() raises, which stops the run as a failed send used to
+            self._error = e
+            self._pending.clear()
+            self._room.set()
+        finally:
+            self._sender = None
+
+    async def line(self, line: str, **fields: Any):
+        """Queue one output line; fields (e.g. testcase_id) go on its frame"""
+        if self._error:
+            raise self._error
+        self._pending.append((fields, line))
+        if self._sender is None:
+            self._sender = asyncio.create_task(self._run_sender())
+        if len(self._pending) >= self.max_lines:
+            self._full.set()
+        if len(self._pending) >= self.max_pending:
+            self._room.clear()
+            await self._room.wait()
+            if self._error:
+                raise self._error
+
+    async def send(self, payload: Dict[str, Any]):
+        """Send a status frame right away, after the lines queued before it"""
+        async with self._lock:
+            await self._drain()
+            await self._send_raw(payload)
@@ -18,8 +18,8 @@ from qdrant_client import AsyncQdrantClient
 from qdrant_client.models import VectorParams, PointStruct, Distance
 from sentence_transformers import SentenceTransformer
 
-from app import utils
-from app import config
+import utils
+import config
 
 # dataclass used by callers
 @dataclass
@@ -44,6 +44,8 @@ class StepSnippet:
     step_text: str
     snippet_code: str
     snippet_id: str
+    script_type: str = ""
+    score: float = 0.0
 
 class MADLModule:
     def __init__(self):
@@ -239,10 +241,11 @@ class MADLModule:
         step_mappings: list of dicts:
           {
             "step_text": "<BDD step text>",
-            "snippet_code": "<the code snippet/run-time mapping for this step>"
+            "snippet_code": "<the code snippet/run-time mapping for this step>",
+            "script_type": "<playwright|selenium>"   (optional)
           }
 
-        Each stored point payload contains: testcaseid, step_text, snippet_code, snippet_id
+        Each stored point payload contains: testcaseid, step_text, snippet_code, snippet_id, script_type
         """
         if not self.is_ready:
             utils.logger.warning("[MADL] not initialized, cannot store steps")
@@ -263,7 +266,8 @@ class MADLModule:
                     "testcaseid": testcaseid,
                     "step_text": step_text,
                     "snippet_code": snippet_code,
-                    "snippet_id": snippet_id
+                    "snippet_id": snippet_id,
+                    "script_type": m.get("script_type", "")
                 }
                 point_id = int(uuid.uuid4().int) % (2**63 - 1)
                 points.append(PointStruct(id=point_id, vector=vec, payload=payload))
@@ -297,7 +301,9 @@ class MADLModule:
                     testcaseid=payload.get("testcaseid", ""),
                     step_text=payload.get("step_text", ""),
                     snippet_code=payload.get("snippet_code", ""),
-                    snippet_id=payload.get("snippet_id", "")
+                    snippet_id=payload.get("snippet_id", ""),
+                    script_type=payload.get("script_type", ""),
+                    score=p.score
                 ))
             utils.logger.info(f"[MADL] search_by_step found {len(snippets)} snippets")
             return snippets
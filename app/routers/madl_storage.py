@@ -72,10 +72,11 @@ async def extract_madl_metadata_from_script(
         }}
         """
         
-        response = call_openai_api(
+        response = await call_openai_api(
             prompt=analysis_prompt,
             max_tokens=1500,
-            system_message="You are a test automation expert. Extract metadata and return only valid JSON."
+            system_message="You are a test automation expert. Extract metadata and return only valid JSON.",
+            cache="madl_metadata"
         )
         
         # Parse Azure OpenAI response
@@ -1,5 +1,7 @@
+import asyncio
 import io
 import json
+from typing import Any, Dict, List, Tuple
 import pandas as pd
 
 from fastapi import APIRouter, UploadFile, Depends, HTTPException
@@ -7,35 +9,37 @@ from fastapi.responses import HTMLResponse, StreamingResponse
 
 from azure_openai_client import call_openai_api
 import config
+from routers import rule_normalizer
 
+import models
+import utils
+import database as db
 from routers.users import get_current_any_user
-from app import models
-from app import utils
-from app import database as db
-from app.routers.users import get_current_any_user
 
 
 router = APIRouter()
+# Only the stateless batch endpoint; main.py mounts this one, not the legacy router
+batch_router = APIRouter()
 
-# Store the last normalized output in app state
-_last_output = None
+# Last normalized output per user, for /download_normalized
+_last_outputs: Dict[str, bytes] = {}
+
+# Extra rule for batch prompts so split steps can be routed back to their scenario
+REF_RULE = """- Every input step has a "Ref". Copy it unchanged into EVERY output step derived from it.
+"""
 
 # ==========================================================
 # 🧩 HELPER: Azure OpenAI Normalization Function
 # ==========================================================
-def normalize_with_llm(steps):
-    """
-    Takes a list of test steps and sends them to the Azure OpenAI LLM
-    to normalize them into atomic BDD-style steps.
-    """
-    prompt = f"""
+def _build_normalize_prompt(steps, extra_rules: str = "") -> str:
+    return f"""
 You are a QA automation expert.
 You are given a list of test steps in JSON. Some steps combine multiple actions.
 Normalize them so that:
 - Each step performs exactly one action.
 - Each step has correctly mapped test data.
 - Use clean BDD style (Given/When/Then/And).
-Return JSON array with keys: Index, Step, TestDataText, TestData.
+{extra_rules}Return JSON array with keys: Index, Step, TestDataText, TestData.
 
 Example:
 Input:
@@ -76,23 +80,231 @@ Now normalize:
 {json.dumps(steps, indent=2)}
 Return ONLY the JSON array.
 """
+
+
+def _parse_json_array(text: str) -> List[Dict[str, Any]]:
+    start = text.find("[")
+    end = text.rfind("]") + 1
+    return json.loads(text[start:end])
+
+
+async def normalize_with_llm(steps):
+    """
+    Takes a list of test steps and sends them to the Azure OpenAI LLM
+    to normalize them into atomic BDD-style steps.
+    """
+    prompt = _build_normalize_prompt(steps)
     try:
-        text = call_openai_api(
+        text = await call_openai_api(
             prompt=prompt,
             max_tokens=2000,
-            system_message="You are a QA automation expert. Return only valid JSON arrays."
+            system_message="You are a QA automation expert. Return only valid JSON arrays.",
+            cache="normalize"
         )
 
         # Extract JSON content from response
-        start = text.find("[")
-        end = text.rfind("]") + 1
-        normalized = json.loads(text[start:end])
-        return normalized
+        return _parse_json_array(text)
     except Exception as e:
         print(f"❌ Azure OpenAI normalization failed: {e}")
         raise HTTPException(status_code=500, detail=f"Normalization failed: {str(e)}")
 
 
+# ==========================================================
+# 📦 HELPERS: Batch normalization
+# ==========================================================
+def _estimate_tokens(obj) -> int:
+    """Rough prompt size of a JSON value (about 4 characters per token)"""
+    return len(json.dumps(obj, ensure_ascii=False)) // 4 + 1
+
+
+def pack_step_chunks(
+    scenarios: List[Tuple[str, List[Dict[str, Any]]]],
+    budget_tokens: int
+) -> List[List[Dict[str, Any]]]:
+    """
+    Pack the steps of all scenarios, in order, into chunks of at most
+    budget_tokens each. Every step is tagged with a Ref "<scenario>#<position>"
+    (unless it already has one) so results can be routed back; a large
+    scenario may span several chunks.
+    """
+    chunks: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    used = 0
+    for key, steps in scenarios:
+        for position, step in enumerate(steps):
+            item = {
+                "Ref": step.get("Ref") or f"{key}#{position}",
+                "Index": step.get("Index", position + 1),
+                "Step": step.get("Step", "") or "",
+                "TestDataText": step.get("TestDataText", "") or "",
+                "TestData": step.get("TestData", {}) or {}
+            }
+            cost = _estimate_tokens(item)
+            if current and used + cost > budget_tokens:
+                chunks.append(current)
+                current, used = [], 0
+            current.append(item)
+            used += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_ref(ref: Any) -> Tuple[str, int]:
+    key, _, position = str(ref).rpartition("#")
+    return key, int(position) if position.isdigit() else 0
+
+
+async def normalize_chunk_with_llm(chunk: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normalize one packed chunk; output steps keep the Ref of their source step"""
+    text = await call_openai_api(
+        prompt=_build_normalize_prompt(chunk, REF_RULE),
+        max_tokens=4000,
+        system_message="You are a QA automation expert. Return only valid JSON arrays.",
+        cache="normalize"
+    )
+    return _parse_json_array(text)
+
+
+def _coerce_step(step: Dict[str, Any]) -> Dict[str, Any]:
+    raw_td = step.get("TestData", {})
+    if isinstance(raw_td, dict):
+        testdata = raw_td
+    elif raw_td is None or raw_td == "":
+        testdata = {}
+    else:
+        testdata = {"value": str(raw_td)}
+    return {
+        "Step": step.get("Step", "") or "",
+        "TestDataText": step.get("TestDataText", "") or "",
+        "TestData": testdata
+    }
+
+
+def _pending_steps(key: str, steps: List[Dict[str, Any]], rule_results) -> List[Dict[str, Any]]:
+    """Steps the rules left for the LLM, tagged with their source position"""
+    return [
+        {**step, "Ref": f"{key}#{position}"}
+        for position, step in enumerate(steps)
+        if rule_results[position] is None
+    ]
+
+
+async def normalize_steps(steps: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Normalize one scenario's steps: the rule-based normalizer handles what it
+    can and only the remaining steps are sent to the LLM.
+    """
+    rule_results = rule_normalizer.apply_rules(steps)
+    pending = _pending_steps("step", steps, rule_results)
+    escalated: Dict[int, List[Dict[str, Any]]] = {}
+    if pending:
+        try:
+            chunks = pack_step_chunks([("step", pending)], config.NORMALIZE_CHUNK_TOKENS)
+            outputs = await asyncio.gather(*(normalize_chunk_with_llm(chunk) for chunk in chunks))
+        except Exception as e:
+            print(f"❌ Azure OpenAI normalization failed: {e}")
+            raise HTTPException(status_code=500, detail=f"Normalization failed: {str(e)}")
+        for chunk, output in zip(chunks, outputs):
+            for step in output:
+                key, position = _split_ref(step.get("Ref", ""))
+                if key != "step":
+                    if len(chunk) != 1:
+                        raise HTTPException(status_code=500, detail="Normalization failed: AI output lost step references")
+                    position = _split_ref(chunk[0]["Ref"])[1]
+                escalated.setdefault(position, []).append(_coerce_step(step))
+    return rule_normalizer.merge_results(rule_results, escalated)
+
+
+def _unique_key(key: str, taken: set) -> str:
+    """Scenario key that no earlier scenario of the batch uses (results are routed by key)"""
+    unique, n = key, 1
+    while unique in taken:
+        n += 1
+        unique = f"{key}-{n}"
+    taken.add(unique)
+    return unique
+
+
+async def stream_batch_normalization(scenarios: List[Tuple[str, List[Dict[str, Any]]]]):
+    """
+    Normalize what the rules can right away, run the LLM chunks for the rest
+    concurrently (the LLM client enforces the global AI call limit) and yield
+    one NDJSON line per scenario as soon as every chunk holding its steps has
+    finished, then a summary line.
+    """
+    rule_results = {key: rule_normalizer.apply_rules(steps) for key, steps in scenarios}
+    pending = [(key, _pending_steps(key, steps, rule_results[key])) for key, steps in scenarios]
+    chunks = pack_step_chunks([(k, s) for k, s in pending if s], config.NORMALIZE_CHUNK_TOKENS)
+    chunks_left: Dict[str, int] = {}
+    for chunk in chunks:
+        for key in {_split_ref(item["Ref"])[0] for item in chunk}:
+            chunks_left[key] = chunks_left.get(key, 0) + 1
+    escalated: Dict[str, Dict[int, List[Dict[str, Any]]]] = {key: {} for key in chunks_left}
+    errors: Dict[str, str] = {}
+
+    def scenario_line(key: str) -> str:
+        return json.dumps({
+            "scenario": key,
+            "status": "SUCCESS",
+            "normalized_steps": rule_normalizer.merge_results(rule_results[key], escalated.get(key, {}))
+        }) + "\n"
+
+    for key, steps in scenarios:
+        if not steps:
+            yield json.dumps({"scenario": key, "status": "FAILED", "error": "No steps to normalize"}) + "\n"
+        elif key not in chunks_left:
+            yield scenario_line(key)
+
+    async def run_chunk(chunk):
+        try:
+            return chunk, await normalize_chunk_with_llm(chunk), None
+        except Exception as e:
+            return chunk, None, e
+
+    tasks = [asyncio.create_task(run_chunk(chunk)) for chunk in chunks]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            chunk, output, error = await next_done
+            keys = list(dict.fromkeys(_split_ref(item["Ref"])[0] for item in chunk))
+
+            if error is not None:
+                for key in keys:
+                    errors[key] = f"Normalization failed: {str(error)}"
+            else:
+                for step in output:
+                    key, position = _split_ref(step.get("Ref", ""))
+                    if key not in keys:
+                        if len(chunk) != 1:
+                            for k in keys:
+                                errors.setdefault(k, "AI output lost step references")
+                            break
+                        key, position = _split_ref(chunk[0]["Ref"])
+                    escalated[key].setdefault(position, []).append(_coerce_step(step))
+
+            for key in keys:
+                chunks_left[key] -= 1
+                if chunks_left[key]:
+                    continue
+                if key in errors:
+                    yield json.dumps({"scenario": key, "status": "FAILED", "error": errors[key]}) + "\n"
+                    continue
+                yield scenario_line(key)
+
+        yield json.dumps({
+            "status": "COMPLETED",
+            "scenarios": len(scenarios),
+            "chunks": len(chunks),
+            "rule_normalized_steps": sum(r is not None for results in rule_results.values() for r in results),
+            "llm_steps": sum(len(s) for _, s in pending),
+            "failed": len(errors) + sum(1 for _, s in scenarios if not s)
+        }) + "\n"
+    finally:
+        # Client went away mid-stream: stop paying for the remaining chunks
+        for task in tasks:
+            task.cancel()
+
+
 # ==========================================================
 # 🚀 ENDPOINTS
 # ==========================================================
@@ -100,12 +312,11 @@ Return ONLY the JSON array.
 @router.post("/normalize")
 async def normalize_endpoint(file: UploadFile, current_user = Depends(get_current_any_user)):
     """
-    Accepts a JSON file, normalizes the test steps using Azure OpenAI,
+    Accepts a JSON file, normalizes the test steps (rules first, Azure OpenAI
+    for the steps they cannot handle),
     and returns an HTML table comparison of original vs normalized steps.
     Added authentication via get_current_any_user
     """
-    global _last_output
-    
     try:
         # Read file contents
         file_bytes = await file.read()
@@ -123,16 +334,16 @@ async def normalize_endpoint(file: UploadFile, current_user = Depends(get_curren
     if not original_steps:
         return HTMLResponse("<h3>❌ No 'Steps' found in the scenario.</h3>", status_code=400)
 
-    # Normalize steps using LLM
-    normalized_steps = normalize_with_llm(original_steps)
+    # Normalize steps: rules first, LLM only for the steps they cannot handle
+    normalized_steps = await normalize_steps(original_steps)
 
     # Prepare new output JSON
     output_json = data.copy()
     output_json["Scenarios"][0]["Steps"] = normalized_steps
-    output_bytes = io.BytesIO(json.dumps(output_json, indent=2, ensure_ascii=False).encode("utf-8"))
+    output_bytes = json.dumps(output_json, indent=2, ensure_ascii=False).encode("utf-8")
 
-    # Store output for download
-    _last_output = output_bytes
+    # Store output for this user's download
+    _last_outputs[current_user["userid"]] = output_bytes
 
     # Convert to dataframes for display
     df_orig = pd.DataFrame([
@@ -198,20 +409,74 @@ async def normalize_endpoint(file: UploadFile, current_user = Depends(get_curren
     return HTMLResponse(html)
 
 
+@batch_router.post("/normalize/batch")
+async def normalize_batch(
+    request: models.BatchNormalizeRequest,
+    current_user: dict = Depends(get_current_any_user)
+):
+    """
+    Normalize many uploaded scenarios and/or stored test cases in one call.
+    Steps are packed into token-budgeted chunks that run concurrently, and
+    results stream back as NDJSON, one line per scenario as it completes.
+    """
+    scenarios: List[Tuple[str, List[Dict[str, Any]]]] = []
+    taken: set = set()
+    for i, scenario in enumerate(request.scenarios):
+        key = _unique_key(str(scenario.get("ScenarioId") or f"scenario-{i + 1}"), taken)
+        scenarios.append((key, scenario.get("Steps", []) or []))
+
+    if request.testcase_ids:
+        conn = None
+        try:
+            conn = await db.get_db_connection()
+            user_proj_row = await conn.fetchrow(
+                "SELECT projectid FROM projectuser WHERE userid = $1",
+                current_user["userid"]
+            )
+            user_projects = set(user_proj_row["projectid"] or []) if user_proj_row else set()
+
+            # A test case asked for twice is normalized once
+            for testcase_id in dict.fromkeys(request.testcase_ids):
+                tc = await conn.fetchrow("SELECT projectid FROM testcase WHERE testcaseid = $1", testcase_id)
+                if not tc:
+                    raise HTTPException(status_code=404, detail=f"Test case {testcase_id} not found")
+                if not (set(tc["projectid"] or []) & user_projects):
+                    raise HTTPException(status_code=403, detail=f"No access to test case {testcase_id}")
+                steps_row = await conn.fetchrow(
+                    "SELECT steps, args FROM teststep WHERE testcaseid = $1",
+                    testcase_id
+                )
+                steps_list = steps_row["steps"] if steps_row and steps_row["steps"] else []
+                args_list = steps_row["args"] if steps_row and steps_row["args"] else []
+                scenarios.append((_unique_key(testcase_id, taken), [
+                    {"Index": idx, "Step": step_text, "TestDataText": arg if arg else ""}
+                    for idx, (step_text, arg) in enumerate(zip(steps_list, args_list), 1)
+                ]))
+        finally:
+            if conn:
+                await db.release_db_connection(conn)
+
+    if not scenarios:
+        raise HTTPException(status_code=400, detail="Provide scenarios or testcase_ids")
+
+    return StreamingResponse(
+        stream_batch_normalization(scenarios),
+        media_type="application/x-ndjson"
+    )
+
+
 @router.get("/download_normalized")
 async def download_normalized(current_user = Depends(get_current_any_user)):
     """
-    Allows the user to download the last normalized JSON output.
+    Allows the user to download their last normalized JSON output.
     Added authentication via get_current_any_user
     """
-    global _last_output
-    
-    if _last_output is None:
+    output = _last_outputs.get(current_user["userid"])
+    if output is None:
         return HTMLResponse("<h3>No normalized file generated yet.</h3>", status_code=404)
-    
-    _last_output.seek(0)
+
     return StreamingResponse(
-        _last_output,
+        io.BytesIO(output),
         media_type="application/json",
         headers={"Content-Disposition": "attachment; filename=normalized_output.json"},
     )
@@ -0,0 +1,286 @@
+"""
+Rule-Based Step Normalizer
+Deterministic fast path in front of the LLM normalizer: splits trivial
+compound steps on conjunctions ("enter username and password then click
+login"), fixes the Given/When/Then/And prefix and maps test data onto the
+resulting steps with keyword rules. Steps it is not sure about are left for
+the LLM (returned as None).
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+BDD_KEYWORDS = ("given", "when", "then", "and", "but")
+
+# Verbs that start an atomic UI action
+ACTION_VERBS = {
+    "enter", "type", "fill", "input", "click", "tap", "press", "select", "choose",
+    "check", "uncheck", "open", "navigate", "go", "visit", "launch", "submit",
+    "login", "logout", "log", "sign", "upload", "download", "clear", "hover",
+    "scroll", "wait", "close", "accept", "dismiss", "switch", "refresh", "reload",
+    "search", "verify", "validate", "assert", "confirm", "expect", "see", "save",
+    "delete", "add", "remove", "toggle", "drag", "drop", "expand", "collapse"
+}
+# Verbs whose step consumes a test data value
+DATA_VERBS = {"enter", "type", "fill", "input", "select", "choose", "open", "navigate", "go", "visit", "launch", "upload", "search"}
+SUBJECT_WORDS = {"i", "user", "the", "a", "an", "customer", "admin", "he", "she", "they", "we"}
+
+# _extract_field-style keyword -> TestData key table (first match wins)
+FIELD_KEYWORDS: List[Tuple[str, Tuple[str, ...]]] = [
+    ("username", ("username", "user name", "user id", "userid", "login id")),
+    ("password", ("password", "passcode")),
+    ("email", ("email", "e-mail")),
+    # Not "link": "click the Help link" names a click target, not a URL
+    ("url", ("url", "website")),
+    ("phone", ("phone", "mobile")),
+]
+
+THEN_PATTERN = re.compile(
+    r"\b(verify|verifies|validate|validates|assert|asserts|confirm|confirms|expect|expects|should|see|sees|"
+    r"is displayed|are displayed|is shown|are shown|appears|is visible|is redirected)\b",
+    re.IGNORECASE
+)
+GIVEN_PATTERN = re.compile(
+    r"\b(is on|am on|is logged in|am logged in|exists|is registered|has an?|have an?)\b",
+    re.IGNORECASE
+)
+# Wording the rules do not try to interpret
+ESCALATE_PATTERN = re.compile(r"\b(if|else|otherwise|unless|until|or|either|each|every|repeat|while)\b", re.IGNORECASE)
+CONJUNCTION_PATTERN = re.compile(r"\s*,?\s*\b(?:and then|then|and)\b\s*|\s*;\s*", re.IGNORECASE)
+QUOTED_PATTERN = re.compile(r"\"[^\"]*\"|'[^']*'")
+PAIR_PATTERN = re.compile(r"^\s*([A-Za-z_][\w ]{0,30}?)\s*[:=]\s*(.+?)\s*$")
+
+MAX_RULE_WORDS = 25
+
+
+def extract_field(text: str) -> str:
+    """TestData key named in the step text, or empty string"""
+    lowered = text.lower()
+    for field, keywords in FIELD_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return field
+    return ""
+
+
+def _guess_key(value: str, field: str) -> str:
+    if field:
+        return field
+    if re.match(r"^https?://", value, re.IGNORECASE):
+        return "url"
+    if re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", value):
+        return "email"
+    return "value"
+
+
+def _split_keyword(text: str) -> Tuple[str, str]:
+    words = text.strip().split(maxsplit=1)
+    if words and words[0].lower() in BDD_KEYWORDS:
+        return words[0].capitalize(), (words[1] if len(words) > 1 else "")
+    return "", text.strip()
+
+
+def _infer_keyword(body: str) -> str:
+    if THEN_PATTERN.search(body):
+        return "Then"
+    if GIVEN_PATTERN.search(body):
+        return "Given"
+    return "When"
+
+
+def _verb_position(words: List[str]) -> Optional[int]:
+    """Index of the first action verb, allowing a short subject before it"""
+    for i, word in enumerate(words[:4]):
+        lowered = word.lower().strip(",.")
+        if lowered in ACTION_VERBS:
+            return i
+        if lowered not in SUBJECT_WORDS and not lowered.endswith("s"):
+            return None
+        # "clicks", "enters": third person forms of an action verb
+        if lowered.endswith("s") and lowered[:-1] in ACTION_VERBS:
+            return i
+    return None
+
+
+def _starts_with_field(words: List[str]) -> bool:
+    """True when the words are a bare field name ("password", "the user name")"""
+    text = " ".join(w.lower() for w in words)
+    text = re.sub(r"^(?:the|a|an)\s+", "", text)
+    return any(text == keyword or text.startswith(keyword + " ") for _, keywords in FIELD_KEYWORDS for keyword in keywords)
+
+
+def _is_label_joint(left: str, right: str) -> bool:
+    """
+    "Terms and Conditions", "Save and Close": a conjunction between two
+    capitalised words is part of a label, not a split point.
+    """
+    left_words, right_words = left.split(), right.split()
+    if not left_words or not right_words:
+        return False
+    before, after = left_words[-1].strip(",."), right_words[0].strip(",.")
+    return before[:1].isupper() and before != "I" and after[:1].isupper()
+
+
+def _split_parts(body: str) -> Optional[List[str]]:
+    """
+    Atomic step bodies for a compound step, or None when unsure. A split is
+    only made when every part is an independent action (its own verb and
+    object) or a bare field carrying the previous field's verb.
+    """
+    quoted: List[str] = []
+
+    def hide(match):
+        quoted.append(match.group(0))
+        return f"\x00{len(quoted) - 1}\x00"
+
+    masked = QUOTED_PATTERN.sub(hide, body)
+    pieces = CONJUNCTION_PATTERN.split(masked)
+    if any(_is_label_joint(left, right) for left, right in zip(pieces, pieces[1:])):
+        return None
+    raw_parts = [p.strip(" ,.") for p in pieces]
+    raw_parts = [p for p in raw_parts if p]
+    if not raw_parts:
+        return None
+
+    first_words = raw_parts[0].split()
+    verb_at = _verb_position(first_words)
+    if verb_at == 0:
+        # "click login" -> "I click login", the style of the LLM prompt's example
+        first_words = ["I", first_words[0].lower()] + first_words[1:]
+        raw_parts[0] = " ".join(first_words)
+        verb_at = 1
+    subject = " ".join(first_words[:verb_at]) if verb_at else ""
+    verb_phrase = " ".join(first_words[:verb_at + 1]) if verb_at is not None else ""
+
+    parts = [raw_parts[0]]
+    for part in raw_parts[1:]:
+        words = part.split()
+        at = _verb_position(words)
+        if at is not None:
+            if at == len(words) - 1:
+                # A verb without an object ("... and close") is not an action on its own
+                return None
+            if at == 0 and subject:
+                # "I enter username and click login": the subject carries over
+                part = f"{subject} {part}"
+                at = len(subject.split())
+            verb_phrase = " ".join(part.split()[:at + 1])
+        elif (verb_phrase and len(words) <= 3 and _starts_with_field(words)
+              and _starts_with_field(parts[-1].split()[len(verb_phrase.split()):])):
+            # "enter username and password": the verb carries over from one field to the next
+            part = f"{verb_phrase} {part}"
+        else:
+            return None
+        parts.append(part)
+
+    def unhide(text: str) -> str:
+        return re.sub(r"\x00(\d+)\x00", lambda m: quoted[int(m.group(1))], text)
+
+    return [unhide(p) for p in parts]
+
+
+def _parse_test_data(step: Dict[str, Any]) -> Tuple[Dict[str, str], List[str]]:
+    """Named values from TestData/"key:value" text, plus positional values"""
+    named: Dict[str, str] = {}
+    positional: List[str] = []
+    raw_td = step.get("TestData")
+    if isinstance(raw_td, dict):
+        named.update({str(k): str(v) for k, v in raw_td.items() if v not in (None, "")})
+
+    text = str(step.get("TestDataText", "") or "").strip()
+    if text and text.upper() != "NULL":
+        for item in re.split(r"\s*[,;]\s*", text):
+            if not item:
+                continue
+            pair = PAIR_PATTERN.match(item)
+            if pair and not re.match(r"^https?$", pair.group(1), re.IGNORECASE):
+                named.setdefault(pair.group(1).strip().lower().replace(" ", "_"), pair.group(2))
+            elif item not in named.values():
+                positional.append(item)
+    return named, positional
+
+
+def _assign_data(parts: List[str], named: Dict[str, str], positional: List[str]) -> Optional[List[Dict[str, str]]]:
+    """TestData for each part, or None when the values cannot be placed unambiguously"""
+    assigned: List[Dict[str, str]] = [{} for _ in parts]
+    if not named and not positional:
+        return assigned
+    if len(parts) == 1:
+        data = dict(named)
+        if len(positional) == 1:
+            data.setdefault(_guess_key(positional[0], extract_field(parts[0])), positional[0])
+        elif positional:
+            return None
+        return [data]
+
+    unused = dict(named)
+    for i, part in enumerate(parts):
+        field = extract_field(part)
+        if field and field in unused:
+            assigned[i] = {field: unused.pop(field)}
+
+    takers = [
+        i for i, part in enumerate(parts)
+        if not assigned[i] and (extract_field(part) or any(w.lower() in DATA_VERBS for w in part.split()[:4]))
+    ]
+    leftovers = list(unused.items()) + [(None, value) for value in positional]
+    if len(leftovers) != len(takers):
+        return None
+    for i, (key, value) in zip(takers, leftovers):
+        assigned[i] = {key or _guess_key(value, extract_field(parts[i])): value}
+    return assigned
+
+
+def _format_data(data: Dict[str, str]) -> str:
+    return ", ".join(f"{k}:{v}" for k, v in data.items())
+
+
+def normalize_step(step: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Normalize one step into atomic BDD steps (Index left to the caller),
+    or None when it should go to the LLM.
+    """
+    text = str(step.get("Step", "") or "").strip()
+    if not text or len(text.split()) > MAX_RULE_WORDS:
+        return None
+    keyword, body = _split_keyword(text)
+    if not body or ESCALATE_PATTERN.search(QUOTED_PATTERN.sub("", body)):
+        return None
+
+    parts = _split_parts(body)
+    if not parts:
+        return None
+    named, positional = _parse_test_data(step)
+    data = _assign_data(parts, named, positional)
+    if data is None:
+        return None
+
+    keyword = keyword or _infer_keyword(parts[0])
+    original_text = str(step.get("TestDataText", "") or "")
+    results = []
+    for i, (part, part_data) in enumerate(zip(parts, data)):
+        results.append({
+            "Step": f"{keyword if i == 0 else 'And'} {part}",
+            "TestDataText": original_text if len(parts) == 1 and original_text.upper() != "NULL" else _format_data(part_data),
+            "TestData": part_data
+        })
+    return results
+
+
+def apply_rules(steps: List[Dict[str, Any]]) -> List[Optional[List[Dict[str, Any]]]]:
+    """normalize_step for every step, same order; None entries need the LLM"""
+    return [normalize_step(step) for step in steps]
+
+
+def merge_results(
+    rule_results: List[Optional[List[Dict[str, Any]]]],
+    escalated: Dict[int, List[Dict[str, Any]]]
+) -> List[Dict[str, Any]]:
+    """
+    Combine rule output with LLM output (keyed by source position) in source
+    order and renumber Index from 1.
+    """
+    merged: List[Dict[str, Any]] = []
+    for position, result in enumerate(rule_results):
+        for step in (result if result is not None else escalated.get(position, [])):
+            merged.append({"Index": len(merged) + 1, **{k: v for k, v in step.items() if k not in ("Index", "Ref")}})
+    return merged
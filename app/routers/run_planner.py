@@ -0,0 +1,394 @@
+"""
+Regression Run Planner
+Orders a project's test cases over the prerequisite (pretestid) DAG, runs
+independent branches in parallel up to a worker limit and skips everything
+below a failed prerequisite, so wall-clock time is bounded by the critical path.
+"""
+
+import asyncio
+import os
+import tempfile
+import time
+from contextlib import AsyncExitStack
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncContextManager, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+import utils
+import config
+import database as db
+import llm_ledger
+from routers.executions import generate_script
+from routers.log_frames import LogFrames
+from routers.script_runner import run_script, ScriptResult
+from routers.script_preflight import preflight_script
+from routers.shared_prereq import (
+    SNAPSHOT_REQUIREMENTS,
+    RESUME_REQUIREMENTS,
+    STORAGE_STATE_IN_ENV,
+    STORAGE_STATE_OUT_ENV,
+    START_URL_ENV,
+    build_dependent_plan,
+    extract_session_url,
+)
+
+router = APIRouter()
+
+
+@dataclass
+class CaseResult:
+    """Outcome of one test case within a run"""
+    testcase_id: str
+    status: str  # SUCCESS, FAILED, SKIPPED
+    message: str
+    duration_ms: float = 0.0
+    exeid: Optional[str] = None
+
+
+@dataclass
+class SessionSnapshot:
+    """Playwright session exported by a passed prerequisite for its dependents"""
+    state_path: str
+    prefix: Tuple[str, ...]
+    session_url: Optional[str] = None
+
+
+# run_case(testcase_id, handoff from parent, has_dependents) -> (result, handoff for children)
+CaseRunner = Callable[[str, Any, bool], Awaitable[Tuple[CaseResult, Any]]]
+
+
+def build_children(parents: Dict[str, Optional[str]]) -> Dict[str, List[str]]:
+    """Invert the pretestid map; prerequisites outside the selection are ignored"""
+    children: Dict[str, List[str]] = {tc_id: [] for tc_id in parents}
+    for tc_id, parent in parents.items():
+        if parent in children:
+            children[parent].append(tc_id)
+    return children
+
+
+def topological_order(parents: Dict[str, Optional[str]]) -> Tuple[List[str], List[str]]:
+    """
+    Kahn's algorithm over the pretestid edges.
+    Returns (ordered test cases, test cases stuck on a prerequisite cycle).
+    """
+    children = build_children(parents)
+    ready = [tc_id for tc_id, parent in parents.items() if parent not in parents]
+    ordered = []
+    while ready:
+        tc_id = ready.pop(0)
+        ordered.append(tc_id)
+        ready.extend(children[tc_id])
+    placed = set(ordered)
+    return ordered, [tc_id for tc_id in parents if tc_id not in placed]
+
+
+def descendants(children: Dict[str, List[str]], tc_id: str) -> List[str]:
+    """All test cases that (transitively) depend on tc_id"""
+    found, stack = [], list(children.get(tc_id, []))
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack.extend(children.get(child, []))
+    return found
+
+
+class RunPlanner:
+    """
+    Schedules test cases over the prerequisite DAG.
+    A test case starts as soon as its prerequisite passed and a worker is free;
+    descendants of a failed prerequisite are reported as SKIPPED.
+    """
+
+    def __init__(
+        self,
+        parents: Dict[str, Optional[str]],
+        run_case: CaseRunner,
+        max_workers: int = config.RUN_PLANNER_MAX_WORKERS,
+        on_event: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None,
+        case_slot: Optional[Callable[[str], AsyncContextManager]] = None
+    ):
+        self.parents = parents
+        self.children = build_children(parents)
+        self.run_case = run_case
+        self.max_workers = max(1, max_workers)
+        self.on_event = on_event
+        self.case_slot = case_slot  # extra admission control (e.g. shared caps across runs)
+        self.results: Dict[str, CaseResult] = {}
+
+    async def _emit(self, event: Dict[str, Any]):
+        if self.on_event:
+            await self.on_event(event)
+
+    async def _skip_descendants(self, tc_id: str, reason: str):
+        for child in descendants(self.children, tc_id):
+            if child not in self.results:
+                self.results[child] = CaseResult(child, "SKIPPED", reason)
+                await self._emit({"status": "CASE_SKIPPED", "testcase_id": child, "log": reason})
+
+    async def run(self) -> Dict[str, Any]:
+        order, cyclic = topological_order(self.parents)
+        semaphore = asyncio.Semaphore(self.max_workers)
+        pending = set()
+        started = time.monotonic()
+
+        for tc_id in cyclic:
+            self.results[tc_id] = CaseResult(tc_id, "SKIPPED", "Blocked by a prerequisite cycle")
+            await self._emit({"status": "CASE_SKIPPED", "testcase_id": tc_id, "log": "Blocked by a prerequisite cycle"})
+
+        async def execute(tc_id: str, handoff: Any):
+            async with semaphore, AsyncExitStack() as slot:
+                if self.case_slot:
+                    await slot.enter_async_context(self.case_slot(tc_id))
+                await self._emit({"status": "CASE_STARTED", "testcase_id": tc_id})
+                case_started = time.monotonic()
+                try:
+                    result, child_handoff = await self.run_case(tc_id, handoff, bool(self.children[tc_id]))
+                except Exception as e:
+                    utils.logger.error(f"[RUN-PLANNER] {tc_id} crashed: {str(e)}")
+                    result, child_handoff = CaseResult(tc_id, "FAILED", str(e)), None
+                result.duration_ms = (time.monotonic() - case_started) * 1000
+
+            self.results[tc_id] = result
+            await self._emit({
+                "status": "CASE_COMPLETED",
+                "testcase_id": tc_id,
+                "final_status": result.status,
+                "log": result.message
+            })
+            if result.status == "SUCCESS":
+                for child in self.children[tc_id]:
+                    schedule(child, child_handoff)
+            else:
+                await self._skip_descendants(tc_id, f"Prerequisite {tc_id} did not pass")
+
+        def schedule(tc_id: str, handoff: Any):
+            pending.add(asyncio.create_task(execute(tc_id, handoff)))
+
+        for tc_id in order:
+            if self.parents[tc_id] not in self.parents:
+                schedule(tc_id, None)
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            pending.difference_update(done)
+            for task in done:
+                task.result()
+
+        return self.summary(order + cyclic, (time.monotonic() - started) * 1000)
+
+    def summary(self, order: List[str], wall_clock_ms: float) -> Dict[str, Any]:
+        """Run-level summary; critical_path_ms is the slowest prerequisite chain actually executed"""
+        chain_ms: Dict[str, float] = {}
+        for tc_id in order:
+            result = self.results.get(tc_id)
+            if result and result.status != "SKIPPED":
+                chain_ms[tc_id] = result.duration_ms + chain_ms.get(self.parents[tc_id], 0.0)
+
+        statuses = [r.status for r in self.results.values()]
+        return {
+            "total": len(order),
+            "passed": statuses.count("SUCCESS"),
+            "failed": statuses.count("FAILED"),
+            "skipped": statuses.count("SKIPPED"),
+            "max_workers": self.max_workers,
+            "wall_clock_ms": round(wall_clock_ms, 2),
+            "critical_path_ms": round(max(chain_ms.values(), default=0.0), 2),
+            "results": [asdict(self.results[tc_id]) for tc_id in order if tc_id in self.results]
+        }
+
+
+def make_case_runner(
+    script_type: str,
+    state_dir: str,
+    on_line: Callable[[str, str], Awaitable[None]]
+) -> CaseRunner:
+    """
+    Build the per-test-case runner used by the planner.
+    With Playwright, a passed prerequisite hands its storage_state to its
+    dependents so they only execute their own steps.
+    """
+
+    async def run_case(testcase_id: str, handoff: Optional[SessionSnapshot], has_dependents: bool):
+        requirements: List[str] = []
+        env: Dict[str, str] = {}
+        export_path = None
+        llm_ledger.start_llm_usage(testcase_id)
+
+        conn = await db.get_db_connection()
+        try:
+            if handoff:
+                testplan = await build_dependent_plan(conn, testcase_id, handoff.prefix)
+                requirements += RESUME_REQUIREMENTS
+                env[STORAGE_STATE_IN_ENV] = handoff.state_path
+                if handoff.session_url:
+                    env[START_URL_ENV] = handoff.session_url
+            else:
+                testplan = await utils.build_testplan(conn, testcase_id)
+        finally:
+            await db.release_db_connection(conn)
+
+        if script_type == "playwright" and has_dependents:
+            export_path = os.path.join(state_dir, f"{testcase_id}.json")
+            requirements += SNAPSHOT_REQUIREMENTS
+            env[STORAGE_STATE_OUT_ENV] = export_path
+
+        script = await generate_script(
+            testcase_id=testcase_id,
+            script_type=script_type,
+            script_lang="python",
+            testplan=testplan,
+            extra_requirements=requirements or None,
+            use_cache=False  # a cached script that failed would fail again on every run
+        )
+
+        async def stream(line: str):
+            await on_line(testcase_id, line)
+
+        preflight = preflight_script(script)
+        if preflight.ok:
+            script_result = await run_script(preflight.script, on_line=stream, env=env)
+            status = "SUCCESS" if script_result.return_code == 0 else "FAILED"
+            message = "Script executed successfully" if status == "SUCCESS" else script_result.exit_message()
+        else:
+            # Broken script: fail the case without launching an interpreter
+            await stream(preflight.report())
+            script_result = ScriptResult(return_code=1, output=preflight.report() + "\n")
+            status = "FAILED"
+            message = "Pre-flight check failed; script was not executed"
+
+        conn = await db.get_db_connection()
+        try:
+            exeid = await utils.save_execution(
+                conn, testcase_id, script_type, message, script_result.output, status, script_result.termination,
+                script_result.artifacts
+            )
+        finally:
+            await db.release_db_connection(conn)
+
+        child_handoff = None
+        if status == "SUCCESS" and export_path and os.path.exists(export_path):
+            child_handoff = SessionSnapshot(
+                state_path=export_path,
+                prefix=(handoff.prefix if handoff else ()) + (testcase_id,),
+                session_url=extract_session_url(script_result.output)
+            )
+        return CaseResult(testcase_id, status, message, exeid=exeid), child_handoff
+
+    return run_case
+
+
+@router.websocket("/projects/{project_id}/regression-run")
+async def run_project_regression(
+    websocket: WebSocket,
+    project_id: str,
+    script_type: str = "playwright",
+    tag: Optional[str] = None,
+    workers: int = config.RUN_PLANNER_MAX_WORKERS
+):
+    """
+    WebSocket endpoint:
+    1. Validate JWT and project access
+    2. Load the project's test cases (optionally filtered by tag)
+    3. Order them over the pretestid DAG and run independent branches in parallel
+    4. Stream per-case progress and finish with a run-level summary
+    """
+    await websocket.accept()
+    frames = LogFrames.for_websocket(websocket)
+    # The client may ask for fewer workers, never for more than the server allows
+    workers = max(1, min(workers, config.RUN_PLANNER_MAX_WORKERS))
+    utils.logger.debug(f"[RUN-PLANNER] WebSocket opened for {project_id}, tag={tag}, workers={workers}")
+
+    send_lock = asyncio.Lock()
+    client_connected = True
+
+    async def send(payload: Dict[str, Any]):
+        # Keep running after a disconnect; every execution is persisted anyway
+        nonlocal client_connected
+        if not client_connected:
+            return
+        async with send_lock:
+            try:
+                await frames.send(payload)
+            except Exception:
+                client_connected = False
+
+    current_user = await utils.get_websocket_user(websocket)
+    if not current_user:
+        await send({"status": "FAILED", "error": "Invalid or missing token"})
+        await websocket.close()
+        return
+
+    script_type = script_type.lower()
+    if script_type not in ["playwright", "selenium"]:
+        await send({"status": "FAILED", "error": "Script type must be 'playwright' or 'selenium'"})
+        await websocket.close()
+        return
+
+    try:
+        conn = await db.get_db_connection()
+        try:
+            access = await conn.fetchrow(
+                "SELECT 1 FROM projectuser WHERE userid = $1 AND $2 = ANY(projectid)",
+                current_user["userid"], project_id
+            )
+            rows = await conn.fetch(
+                """
+                SELECT testcaseid, pretestid FROM testcase
+                WHERE $1 = ANY(projectid) AND ($2::text IS NULL OR $2 = ANY(tag))
+                ORDER BY testcaseid
+                """,
+                project_id, tag
+            ) if access else []
+        finally:
+            await db.release_db_connection(conn)
+
+        if not access:
+            await send({"status": "FAILED", "error": "You are not assigned to this project"})
+            return
+        if not rows:
+            await send({"status": "FAILED", "error": "No test cases match this project/tag"})
+            return
+
+        parents = {
+            row["testcaseid"]: (row["pretestid"] or "").strip() or None
+            for row in rows
+        }
+        order, cyclic = topological_order(parents)
+        await send({
+            "status": "PLAN_READY",
+            "order": order,
+            "blocked": cyclic,
+            "log": f"Planned {len(parents)} test cases with {workers} workers"
+        })
+
+        async def stream_line(testcase_id: str, line: str):
+            nonlocal client_connected
+            if not client_connected:
+                return
+            try:
+                await frames.line(line, testcase_id=testcase_id)
+            except Exception:
+                client_connected = False
+
+        with tempfile.TemporaryDirectory(prefix="regression_state_") as state_dir:
+            planner = RunPlanner(
+                parents=parents,
+                run_case=make_case_runner(script_type, state_dir, stream_line),
+                max_workers=workers,
+                on_event=send
+            )
+            summary = await planner.run()
+
+        await send({"status": "COMPLETED", "summary": summary, "log": f"{summary['passed']}/{summary['total']} test cases passed"})
+
+    except WebSocketDisconnect:
+        utils.logger.warning("[RUN-PLANNER] Client disconnected")
+    except Exception as e:
+        utils.logger.error(f"[RUN-PLANNER] Unexpected error: {str(e)}")
+        await send({"status": "FAILED", "error": str(e)})
+    finally:
+        try:
+            await websocket.close()
+        except:
+            pass
@@ -0,0 +1,172 @@
+"""
+Screenshot Preprocessing
+Prepares failure screenshots for vision healing calls: crops around the
+failing element when the logs report its bounding box, downscales to
+SCREENSHOT_MAX_EDGE, re-encodes as JPEG/WebP and reuses the previous
+encoding for perceptually identical screenshots (dHash), so repeated heals
+of the same screen send identical bytes.
+"""
+
+import asyncio
+import base64
+import io
+import re
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+import config
+import utils
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow missing: screenshots are sent unmodified
+    Image = None
+
+# dHash -> PreparedScreenshot for recently seen screens
+RECENT_HASHES_LIMIT = 64
+
+BOUNDING_BOX_PATTERN = re.compile(
+    r"[\"']?x[\"']?\s*[:=]\s*(-?[\d.]+)\s*,\s*[\"']?y[\"']?\s*[:=]\s*(-?[\d.]+)\s*,\s*"
+    r"[\"']?width[\"']?\s*[:=]\s*([\d.]+)\s*,\s*[\"']?height[\"']?\s*[:=]\s*([\d.]+)"
+)
+
+
+@dataclass
+class PreparedScreenshot:
+    """Encoded screenshot ready for call_openai_with_images"""
+    image_b64: str
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+    encoded_bytes: int
+    dhash: Optional[int] = None
+    cropped: bool = False
+    reused: bool = False
+
+    def summary(self) -> str:
+        return (
+            f"{self.width}x{self.height} {self.mime_type}, "
+            f"{self.original_bytes} -> {self.encoded_bytes} bytes"
+            + (", cropped to failing element" if self.cropped else "")
+            + (", reused identical screen" if self.reused else "")
+        )
+
+
+_recent: "OrderedDict[int, PreparedScreenshot]" = OrderedDict()
+
+
+def find_bounding_box(logs: str) -> Optional[Tuple[float, float, float, float]]:
+    """Last {x, y, width, height} printed in the logs (Playwright bounding_box() format)"""
+    matches = BOUNDING_BOX_PATTERN.findall(logs or "")
+    if not matches:
+        return None
+    x, y, width, height = (float(v) for v in matches[-1])
+    return x, y, width, height
+
+
+def _sniff_mime(raw: bytes) -> str:
+    if raw.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if raw[:4] == b"RIFF" and raw[8:12] == b"WEBP":
+        return "image/webp"
+    return "image/png"
+
+
+def _dhash(image) -> int:
+    """64-bit difference hash: compares horizontally adjacent pixels of a 9x8 thumbnail"""
+    small = image.convert("L").resize((9, 8))
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (1 if left > right else 0)
+    return value
+
+
+def _process(raw: bytes, logs: str) -> PreparedScreenshot:
+    image = Image.open(io.BytesIO(raw))
+    image.load()
+    cropped = False
+
+    box = find_bounding_box(logs)
+    if box:
+        x, y, width, height = box
+        pad = config.SCREENSHOT_CROP_PADDING
+        left = max(0, int(x - pad))
+        top = max(0, int(y - pad))
+        right = min(image.width, int(x + width + pad))
+        bottom = min(image.height, int(y + height + pad))
+        if right - left > 0 and bottom - top > 0 and (right - left, bottom - top) != image.size:
+            image = image.crop((left, top, right, bottom))
+            cropped = True
+
+    resized = max(image.size) > config.SCREENSHOT_MAX_EDGE
+    if resized:
+        image.thumbnail((config.SCREENSHOT_MAX_EDGE, config.SCREENSHOT_MAX_EDGE))
+
+    fmt = config.SCREENSHOT_FORMAT.upper()
+    if fmt not in ("JPEG", "WEBP"):
+        fmt = "JPEG"
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format=fmt, quality=config.SCREENSHOT_QUALITY)
+    encoded = buffer.getvalue()
+    mime_type = f"image/{fmt.lower()}"
+
+    # Flat UI screenshots can be smaller as the original PNG; keep it then
+    if not resized and not cropped and len(encoded) >= len(raw):
+        encoded, mime_type = raw, _sniff_mime(raw)
+
+    return PreparedScreenshot(
+        image_b64=base64.b64encode(encoded).decode("utf-8"),
+        mime_type=mime_type,
+        width=image.width,
+        height=image.height,
+        original_bytes=len(raw),
+        encoded_bytes=len(encoded),
+        dhash=_dhash(image),
+        cropped=cropped
+    )
+
+
+def _find_recent(dhash: int) -> Optional[PreparedScreenshot]:
+    for seen_hash, prepared in _recent.items():
+        if bin(seen_hash ^ dhash).count("1") <= config.SCREENSHOT_DEDUPE_DISTANCE:
+            _recent.move_to_end(seen_hash)
+            return prepared
+    return None
+
+
+async def prepare_screenshot(raw: bytes, logs: str = "") -> PreparedScreenshot:
+    """
+    Preprocess an uploaded screenshot off the event loop. Falls back to the
+    original bytes when Pillow is unavailable or the image cannot be decoded.
+    """
+    fallback = PreparedScreenshot(
+        image_b64=base64.b64encode(raw).decode("utf-8"),
+        mime_type=_sniff_mime(raw),
+        width=0,
+        height=0,
+        original_bytes=len(raw),
+        encoded_bytes=len(raw)
+    )
+    if Image is None:
+        return fallback
+
+    try:
+        prepared = await asyncio.to_thread(_process, raw, logs)
+    except Exception as e:
+        utils.logger.warning(f"[SCREENSHOT] Preprocessing failed, sending original: {str(e)}")
+        return fallback
+
+    previous = _find_recent(prepared.dhash)
+    if previous and previous.cropped == prepared.cropped:
+        return PreparedScreenshot(**{**previous.__dict__, "original_bytes": len(raw), "reused": True})
+
+    _recent[prepared.dhash] = prepared
+    while len(_recent) > RECENT_HASHES_LIMIT:
+        _recent.popitem(last=False)
+    return prepared
@@ -0,0 +1,170 @@
+"""
+Script Pre-flight
+Static checks on a generated script before an interpreter and browser are
+launched for it: markdown fences (stripped), syntax, imports that are not
+installed, calls that hang or escape the test, and the log markers the
+healing/MADL pipeline relies on. Runs in milliseconds; a failed report is
+precise enough to hand straight to self-healing.
+"""
+
+import ast
+import importlib.util
+import re
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Optional
+
+FENCE_LINE = re.compile(r"^\s*```[\w+-]*\s*$", re.MULTILINE)
+
+# Dotted call names that block the run or reach outside the test
+FORBIDDEN_CALLS = {
+    "input": "waits for stdin, which never arrives",
+    "breakpoint": "opens a debugger and blocks",
+    "pdb.set_trace": "opens a debugger and blocks",
+    "page.pause": "opens the Playwright inspector and blocks",
+    "eval": "executes arbitrary code",
+    "exec": "executes arbitrary code",
+    "os.system": "runs shell commands",
+    "os.popen": "runs shell commands",
+    "subprocess.run": "runs shell commands",
+    "subprocess.call": "runs shell commands",
+    "subprocess.check_call": "runs shell commands",
+    "subprocess.check_output": "runs shell commands",
+    "subprocess.Popen": "runs shell commands",
+    "shutil.rmtree": "deletes directories",
+    "os.remove": "deletes files",
+    "os.unlink": "deletes files",
+    "os.rmdir": "deletes directories",
+}
+
+# Every generation prompt asks for these step log lines
+REQUIRED_LOG_MARKERS = ("Running action",)
+
+
+@dataclass
+class PreflightIssue:
+    check: str  # "syntax", "import", "forbidden_call" or "log_marker"
+    message: str
+    line: Optional[int] = None
+
+    def __str__(self) -> str:
+        return f"[{self.check}] " + (f"line {self.line}: " if self.line else "") + self.message
+
+
+@dataclass
+class PreflightResult:
+    script: str  # the script to run (markdown fences removed)
+    issues: List[PreflightIssue] = field(default_factory=list)
+    fixes: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.issues
+
+    def report(self) -> str:
+        """Error text for the execution log and the healing prompt"""
+        if self.ok:
+            return "Pre-flight checks passed" + (f" ({'; '.join(self.fixes)})" if self.fixes else "")
+        return "Pre-flight check failed:\n" + "\n".join(str(issue) for issue in self.issues)
+
+
+@lru_cache(maxsize=512)
+def _module_available(name: str) -> bool:
+    try:
+        return importlib.util.find_spec(name) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def _call_name(node: ast.Call) -> str:
+    parts = []
+    target = node.func
+    while isinstance(target, ast.Attribute):
+        parts.append(target.attr)
+        target = target.value
+    if isinstance(target, ast.Name):
+        parts.append(target.id)
+    return ".".join(reversed(parts))
+
+
+def _check_imports(tree: ast.AST) -> List[PreflightIssue]:
+    issues = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            top = name.split(".")[0]
+            if not _module_available(top):
+                issues.append(PreflightIssue("import", f"module '{name}' is not installed", node.lineno))
+    return issues
+
+
+def _check_calls(tree: ast.AST) -> List[PreflightIssue]:
+    issues = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call):
+            continue
+        name = _call_name(node)
+        reason = FORBIDDEN_CALLS.get(name)
+        if reason is None and name.endswith("page.pause"):  # self.page.pause(), new_page.pause()
+            reason = FORBIDDEN_CALLS["page.pause"]
+        if reason:
+            issues.append(PreflightIssue("forbidden_call", f"{name}() {reason}", node.lineno))
+    return issues
+
+
+def _check_log_markers(tree: ast.AST) -> List[PreflightIssue]:
+    strings = [
+        node.value for node in ast.walk(tree)
+        if isinstance(node, ast.Constant) and isinstance(node.value, str)
+    ]
+    return [
+        PreflightIssue("log_marker", f"no '{marker}' log line is printed; step progress cannot be tracked")
+        for marker in REQUIRED_LOG_MARKERS
+        if not any(marker in s for s in strings)
+    ]
+
+
+def preflight_snippet(code: str) -> List[PreflightIssue]:
+    """
+    Import and call checks for a step snippet that is exec'd inside a runner
+    (step actions) instead of being run as a script of its own
+    """
+    try:
+        tree = ast.parse(code or "pass", filename="<step snippet>")
+    except SyntaxError as e:
+        return [PreflightIssue("syntax", e.msg, e.lineno)]
+    return _check_imports(tree) + _check_calls(tree)
+
+
+def preflight_script(script_content: str) -> PreflightResult:
+    """Run all static checks; syntax errors stop the remaining checks"""
+    result = PreflightResult(script=script_content or "")
+    if FENCE_LINE.search(result.script):
+        result.script = FENCE_LINE.sub("", result.script).strip("\n") + "\n"
+        result.fixes.append("removed markdown code fences")
+
+    if not result.script.strip():
+        result.issues.append(PreflightIssue("syntax", "script is empty"))
+        return result
+
+    try:
+        tree = ast.parse(result.script, filename="<generated script>")
+    except SyntaxError as e:
+        source_line = (e.text or "").strip()
+        result.issues.append(PreflightIssue(
+            "syntax", f"{e.msg}" + (f": {source_line}" if source_line else ""), e.lineno
+        ))
+        return result
+    except ValueError as e:  # null bytes
+        result.issues.append(PreflightIssue("syntax", str(e)))
+        return result
+
+    result.issues += _check_imports(tree)
+    result.issues += _check_calls(tree)
+    result.issues += _check_log_markers(tree)
+    return result
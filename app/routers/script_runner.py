@@ -0,0 +1,424 @@
+"""
+Script Runner
+Launches generated test scripts as child processes and streams their output
+without blocking the event loop.
+Every run is bounded: a wall-clock deadline (EXECUTION_TIMEOUT), CPU and
+memory rlimits on the child processes (set by the child itself, see
+limited_args), and on timeout, cancellation or exit every process the run
+started is killed, including the browsers that Playwright starts detached
+in sessions of their own. Why a run was stopped is reported in
+ScriptResult.termination.
+Scripts run in a working directory of their own; the files they leave there
+(screenshots, DOM dumps) are stored as ScriptResult.artifacts.
+"""
+
+import asyncio
+import os
+import signal
+import sys
+import uuid
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+import config
+import utils
+from routers.artifacts import ArtifactRef, store_directory, workdir
+
+# Generated scripts occasionally print whole DOM dumps on one line
+STREAM_LINE_LIMIT = 1024 * 1024
+TIMEOUT_RETURN_CODE = 124  # as coreutils timeout
+KILL_SIGNAL = getattr(signal, "SIGKILL", signal.SIGTERM)
+EXIT_POLL_SECONDS = 0.05
+SCRIPT_FILE = "script.py"  # the script itself in its working directory, not an artifact
+# Inherited by every process of a run, detached browsers included, so they can be found after the run
+RUN_MARKER_ENV = "SCRIPT_RUN_ID"
+
+# Sets the rlimits in the child and execs the real command: preexec_fn is not
+# safe in a server with threads (it runs between fork and exec)
+LIMITS_LAUNCHER = """import os, resource, sys
+cpu, memory = int(sys.argv[1]), int(sys.argv[2])
+if cpu > 0:
+    # SIGXCPU at the soft limit, SIGKILL a little later for processes that ignore it
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu, cpu + 5))
+if memory > 0:
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+os.execvp(sys.argv[3], sys.argv[3:])
+"""
+
+
+@dataclass
+class ScriptResult:
+    """Outcome of one script run"""
+    return_code: int
+    output: str  # stdout and stderr lines in arrival order
+    stdout: str = ""
+    stderr: str = ""
+    termination: Optional[str] = None  # why the run was stopped (timeout, limit, signal); None if it exited
+    artifacts: List[ArtifactRef] = field(default_factory=list)  # files the run left in its working directory
+
+    def exit_message(self) -> str:
+        """Execution message for a run that did not pass"""
+        if self.termination:
+            return f"Script stopped: {self.termination}"
+        return f"Script exited with code {self.return_code}"
+
+
+def limited_args(
+    args: Sequence[str],
+    cpu_seconds: int = config.EXECUTION_CPU_LIMIT_SECONDS,
+    memory_mb: int = config.EXECUTION_MEMORY_LIMIT_MB
+) -> List[str]:
+    """
+    args run through LIMITS_LAUNCHER: per-process CPU and address-space
+    limits, inherited by the browsers the command starts (0 disables a limit)
+    """
+    if resource is None or (cpu_seconds <= 0 and memory_mb <= 0):
+        return list(args)
+    return [sys.executable, "-c", LIMITS_LAUNCHER, str(cpu_seconds), str(memory_mb * 1024 * 1024), *args]
+
+
+def _descendants(pid: int) -> List[int]:
+    """All processes started by pid, recursively (from /proc; empty where there is none)"""
+    children: Dict[int, List[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat", "rb") as stat_file:
+                stat = stat_file.read()
+            ppid = int(stat.rsplit(b")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    found, stack = [], [pid]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            found.append(child)
+            stack.append(child)
+    return found
+
+
+def _marked(marker: str) -> List[int]:
+    """Processes whose environment carries RUN_MARKER_ENV=marker, wherever they were reparented to"""
+    needle = f"{RUN_MARKER_ENV}={marker}".encode("utf-8")
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+    found = []
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/environ", "rb") as environ_file:
+                if needle in environ_file.read().split(b"\0"):
+                    found.append(int(entry))
+        except OSError:
+            continue
+    return found
+
+
+def kill_marked(marker: str):
+    """SIGKILL every process of a run, including detached ones whose parent already exited"""
+    for target in _marked(marker):
+        try:
+            os.kill(target, KILL_SIGNAL)
+        except OSError:
+            pass
+
+
+def kill_process_group(pgid: int):
+    """SIGKILL what is left in a process group, e.g. after its leader exited"""
+    if hasattr(os, "killpg"):
+        try:
+            os.killpg(pgid, KILL_SIGNAL)
+        except OSError:
+            pass
+
+
+def kill_process_tree(pid: int):
+    """
+    SIGKILL a running (not yet reaped) process and everything it started:
+    its descendants, since Playwright launches browsers detached in process
+    groups of their own, and the rest of its process group.
+    """
+    for target in [pid] + _descendants(pid):
+        try:
+            os.kill(target, KILL_SIGNAL)
+        except OSError:
+            pass
+    kill_process_group(pid)
+
+
+def _describe_exit(return_code: int, stderr: List[str]) -> Optional[str]:
+    if return_code < 0:
+        if hasattr(signal, "SIGXCPU") and -return_code == signal.SIGXCPU:
+            return f"CPU time limit ({config.EXECUTION_CPU_LIMIT_SECONDS}s) exceeded"
+        try:
+            return f"Killed by signal {signal.Signals(-return_code).name}"
+        except ValueError:
+            return f"Killed by signal {-return_code}"
+    if return_code != 0 and config.EXECUTION_MEMORY_LIMIT_MB > 0 and any("MemoryError" in line for line in stderr):
+        return f"Memory limit ({config.EXECUTION_MEMORY_LIMIT_MB} MB) exceeded"
+    return None
+
+
+async def _exited(process: asyncio.subprocess.Process) -> int:
+    # Process.wait() also waits for the pipes to close, which leftover browsers hold open
+    while process.returncode is None:
+        await asyncio.sleep(EXIT_POLL_SECONDS)
+    return process.returncode
+
+
+async def _read_stream(
+    stream: asyncio.StreamReader,
+    name: str,
+    collected: Dict[str, List[str]],
+    on_line: Optional[Callable[[str], Awaitable[None]]]
+):
+    while True:
+        raw_line = await stream.readline()
+        if not raw_line:
+            break
+        line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line.strip():
+            continue
+        collected[name].append(line)
+        collected["output"].append(line)
+        if on_line:
+            await on_line(line)
+
+
+async def run_command(
+    args: Sequence[str],
+    on_line: Optional[Callable[[str], Awaitable[None]]] = None,
+    env: Optional[Dict[str, str]] = None,
+    on_stderr_line: Optional[Callable[[str], Awaitable[None]]] = None,
+    timeout: Optional[float] = config.EXECUTION_TIMEOUT,
+    cwd: Optional[str] = None
+) -> ScriptResult:
+    """
+    Run a command and stream every non-empty output line to on_line (stderr
+    lines go to on_stderr_line instead, when given). stdout and stderr are
+    read concurrently, so a chatty stderr can never fill its pipe and stall
+    the child, and the event loop stays free for other requests.
+    The command runs in its own session under limited_args; every process it
+    started is killed at the timeout, on cancellation and once it has exited
+    (a script that never closed its browser).
+    """
+    posix = resource is not None
+    marker = uuid.uuid4().hex
+    process = await asyncio.create_subprocess_exec(
+        *limited_args(args),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, **(env or {}), RUN_MARKER_ENV: marker},
+        limit=STREAM_LINE_LIMIT,
+        cwd=cwd,
+        start_new_session=posix
+    )
+
+    collected: Dict[str, List[str]] = {"output": [], "stdout": [], "stderr": []}
+    stderr_sink = on_stderr_line or on_line
+    readers = asyncio.gather(
+        _read_stream(process.stdout, "stdout", collected, on_line),
+        _read_stream(process.stderr, "stderr", collected, stderr_sink)
+    )
+    waiter = asyncio.ensure_future(_exited(process))
+    termination = None
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout else None
+    try:
+        pending = {waiter, readers}
+        while waiter in pending:
+            remaining = None if deadline is None else max(0.0, deadline - loop.time())
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if readers in done:
+                readers.result()  # a failing on_line (client gone) ends the run
+            if not done:
+                termination = f"Timed out after {timeout:g}s"
+                break
+        if termination:
+            kill_process_tree(process.pid)
+        else:
+            # Drivers/browsers the script left behind still hold the pipes open;
+            # detached ones were reparented when the script exited
+            kill_process_group(process.pid)
+        kill_marked(marker)
+        await readers
+        return_code = await process.wait()
+    except BaseException:
+        # Client went away or the caller was cancelled: do not leave the browser running
+        if process.returncode is None:
+            kill_process_tree(process.pid)
+        kill_process_group(process.pid)
+        kill_marked(marker)
+        waiter.cancel()
+        readers.cancel()
+        await asyncio.gather(waiter, readers, return_exceptions=True)
+        await process.wait()
+        raise
+
+    if termination:
+        return_code = TIMEOUT_RETURN_CODE
+    else:
+        termination = _describe_exit(return_code, collected["stderr"])
+    if termination:
+        utils.logger.warning(f"[EXEC] {args[-1]}: {termination}")
+        note = f"Execution terminated: {termination}"
+        collected["stderr"].append(note)
+        collected["output"].append(note)
+        if stderr_sink:
+            await stderr_sink(note)
+
+    def joined(name: str) -> str:
+        return "".join(line + "\n" for line in collected[name])
+
+    return ScriptResult(
+        return_code=return_code,
+        output=joined("output"),
+        stdout=joined("stdout"),
+        stderr=joined("stderr"),
+        termination=termination
+    )
+
+
+async def _run_pooled(
+    run: Callable[[Callable[[str], Awaitable[None]]], Awaitable[ScriptResult]],
+    on_line: Optional[Callable[[str], Awaitable[None]]]
+) -> ScriptResult:
+    """
+    Apply EXECUTION_TIMEOUT to a run in a pooled process. Cancelling the run
+    stops it there (context closed, warm worker killed and replaced); the
+    lines streamed so far become the result.
+    """
+    seen: List[str] = []
+
+    async def sink(line: str):
+        seen.append(line)
+        if on_line:
+            await on_line(line)
+
+    try:
+        return await asyncio.wait_for(run(sink), timeout=config.EXECUTION_TIMEOUT or None)
+    except asyncio.TimeoutError:
+        termination = f"Timed out after {config.EXECUTION_TIMEOUT:g}s"
+        utils.logger.warning(f"[EXEC] Pooled run: {termination}")
+        note = f"Execution terminated: {termination}"
+        if on_line:
+            await on_line(note)
+        output = "".join(line + "\n" for line in seen + [note])
+        return ScriptResult(
+            return_code=TIMEOUT_RETURN_CODE,
+            output=output,
+            stdout="".join(line + "\n" for line in seen),
+            stderr=note + "\n",
+            termination=termination
+        )
+
+
+async def run_script(
+    script_content: str,
+    on_line: Optional[Callable[[str], Awaitable[None]]] = None,
+    env: Optional[Dict[str, str]] = None
+) -> ScriptResult:
+    """
+    Run the script on a worker node when the execution queue is up (scripts
+    without env only), otherwise on this host with run_local. Every non-empty
+    output line (stdout + stderr) is streamed to on_line.
+    """
+    from routers.job_queue import job_queue
+
+    if job_queue.accepts(env):
+        utils.logger.info("[EXEC] Queueing script for a worker node")
+        return await job_queue.run(script_content, on_line=on_line)
+    return await run_local(script_content, on_line=on_line, env=env)
+
+
+async def run_local(
+    script_content: str,
+    on_line: Optional[Callable[[str], Awaitable[None]]] = None,
+    env: Optional[Dict[str, str]] = None
+) -> ScriptResult:
+    """
+    Run the script in the cheapest place available on this host: a keyword
+    runner script as a browser context of the shared context host, other
+    scripts on an idle warm worker, otherwise in a fresh interpreter. The
+    latter two run in a working directory of their own (the shared context
+    host writes no files).
+    """
+    from routers.context_pool import context_pool
+
+    steps = context_pool.steps_for(script_content) if not env else None
+    if steps is not None:
+        utils.logger.info(f"[EXEC] Executing keyword plan ({len(steps)} steps) in a shared browser context")
+        return await _run_pooled(lambda sink: context_pool.run(steps, on_line=sink), on_line)
+
+    with workdir() as path:
+        result = await _run_in_workdir(script_content, path, on_line, env)
+        result.artifacts = await store_artifacts(path)
+        return result
+
+
+async def store_artifacts(path: str) -> List[ArtifactRef]:
+    """Files a run left in its working directory, stored; never raises"""
+    try:
+        return await store_directory(path, exclude=[SCRIPT_FILE])
+    except Exception as e:
+        # The run itself went fine; losing its screenshots must not fail it
+        utils.logger.warning(f"[EXEC] Storing artifacts failed: {str(e)}")
+        return []
+
+
+async def run_script_file(
+    script_content: str,
+    path: str,
+    on_line: Optional[Callable[[str], Awaitable[None]]] = None,
+    env: Optional[Dict[str, str]] = None,
+    on_stderr_line: Optional[Callable[[str], Awaitable[None]]] = None
+) -> ScriptResult:
+    """Write the script into its working directory and run it in a fresh interpreter"""
+    script_path = os.path.join(path, SCRIPT_FILE)
+    with open(script_path, "w", encoding="utf-8") as script_file:
+        script_file.write(script_content)
+    utils.logger.info(f"[EXEC] Executing script: {script_path}")
+    return await run_command(
+        [sys.executable, script_path], on_line=on_line, env=env, on_stderr_line=on_stderr_line, cwd=path
+    )
+
+
+async def _run_in_workdir(
+    script_content: str,
+    path: str,
+    on_line: Optional[Callable[[str], Awaitable[None]]],
+    env: Optional[Dict[str, str]]
+) -> ScriptResult:
+    from routers.worker_pool import worker_pool
+
+    worker = worker_pool.try_acquire() if worker_pool.accepts(script_content) else None
+    if worker:
+        utils.logger.info(f"[EXEC] Executing script on warm worker {worker.process.pid}")
+
+        async def run_on_worker(sink):
+            pooled = await worker_pool.run(worker, script_content, on_line=sink, env=env, cwd=path)
+            return ScriptResult(
+                return_code=pooled.return_code,
+                output="".join(line + "\n" for line in pooled.output),
+                stdout="".join(line + "\n" for line in pooled.stdout),
+                stderr="".join(line + "\n" for line in pooled.stderr),
+                termination=_describe_exit(pooled.return_code, pooled.stderr)  # e.g. the CPU limit
+            )
+
+        return await _run_pooled(run_on_worker, on_line)
+
+    return await run_script_file(script_content, path, on_line, env)
@@ -0,0 +1,96 @@
+"""
+Generated Script Store
+Persists every generated script under a hash of what produced it (test plan,
+script type, selected MADL methods, prompt version), so a run whose plan is
+unchanged reuses the last script that passed instead of asking the LLM again.
+Each execution row records the scriptid it ran.
+"""
+
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+# Bump a generator's version whenever its prompt changes, so scripts produced
+# by the old prompt are no longer reused
+PROMPT_VERSIONS = {
+    "generate_script": "1",
+    "generate_script_madl": "1",
+}
+
+
+def plan_hash(
+    testplan: Dict[str, Any],
+    script_type: str,
+    madl_methods: Optional[List[Dict[str, Any]]],
+    prompt_version: str
+) -> str:
+    """sha256 over the inputs that determine the generated script"""
+    payload = {
+        "testplan": testplan,
+        "script_type": script_type.lower(),
+        "madl_methods": sorted((m.get("signature", "") for m in madl_methods or [])),
+        "prompt_version": prompt_version
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+async def find_passing_script(conn, script_hash: str):
+    """Latest script with this hash whose last execution passed, or None"""
+    return await conn.fetchrow(
+        """
+        SELECT scriptid, script, created_at, pass_count
+        FROM generated_script
+        WHERE plan_hash = $1 AND last_status = 'SUCCESS'
+        ORDER BY scriptid DESC
+        LIMIT 1
+        """,
+        script_hash
+    )
+
+
+async def save_script(
+    conn,
+    script_hash: str,
+    testcase_id: str,
+    script_type: str,
+    prompt_version: str,
+    script: str,
+    healed_from: Optional[int] = None
+) -> int:
+    """Store a newly generated (or healed) script and return its scriptid"""
+    return await conn.fetchval(
+        """
+        INSERT INTO generated_script (plan_hash, testcaseid, scripttype, prompt_version, script, healed_from)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING scriptid
+        """,
+        script_hash, testcase_id, script_type.lower(), prompt_version, script, healed_from
+    )
+
+
+async def record_script_status(conn, scriptid: Optional[int], status: str):
+    """Store the outcome of running a script; only SUCCESS keeps it reusable"""
+    if scriptid is None:
+        return
+    await conn.execute(
+        """
+        UPDATE generated_script
+        SET last_status = $2,
+            last_used_at = NOW(),
+            pass_count = pass_count + CASE WHEN $2 = 'SUCCESS' THEN 1 ELSE 0 END,
+            fail_count = fail_count + CASE WHEN $2 = 'SUCCESS' THEN 0 ELSE 1 END
+        WHERE scriptid = $1
+        """,
+        scriptid, status
+    )
+
+
+async def record_script_result(conn, scriptid: Optional[int], exeid: str, status: str, reused: bool):
+    """Store the outcome on the script and link the execution to it"""
+    if scriptid is None:
+        return
+    await record_script_status(conn, scriptid, status)
+    await conn.execute(
+        "UPDATE execution SET scriptid = $2, script_reused = $3 WHERE exeid = $1",
+        exeid, scriptid, reused
+    )
@@ -41,10 +41,11 @@ async def generate_test_script(testcase_id: str, script_type: str, script_lang:
         prompt += "- Handle actions: 'Navigate to login', 'Enter credentials', 'Submit form' (assume credentials are in 'user/pass' format, split by '/').\n"
         prompt += "- Output only the code, no additional explanations or markdown (e.g., no ''' or # comments outside actions).\n"
 
-        script_content = call_openai_api(
+        script_content = await call_openai_api(
             prompt=prompt,
             max_tokens=4000,
-            system_message="You are a test automation expert. Generate only executable Python code."
+            system_message="You are a test automation expert. Generate only executable Python code.",
+            cache="generate_script"
         )
 
         # Validate generated content
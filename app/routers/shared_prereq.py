@@ -0,0 +1,345 @@
+"""
+Shared Prerequisite Execution
+Groups selected test cases by their prerequisite (pretestid) chain and
+arranges the chains in a prefix tree. Every prerequisite in the tree runs
+once, resuming from its parent's Playwright session (storage_state) and
+snapshotting its own, so chains [A] and [A, B] share the run of A. Each
+selected test case starts from the snapshot of its whole chain instead of
+replaying the login steps.
+"""
+
+import os
+import tempfile
+import uuid
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+
+import utils
+import database as db
+import llm_ledger
+from routers.executions import generate_script
+from routers.log_frames import LogFrames
+from routers.script_preflight import preflight_script
+from routers.script_runner import run_script, ScriptResult
+
+router = APIRouter()
+
+STORAGE_STATE_IN_ENV = "PW_STORAGE_STATE_IN"
+STORAGE_STATE_OUT_ENV = "PW_STORAGE_STATE_OUT"
+START_URL_ENV = "PW_START_URL"
+SESSION_URL_MARKER = "SESSION_URL:"
+
+# Extra prompt requirements for the script that performs the shared prefix
+SNAPSHOT_REQUIREMENTS = [
+    "Create the page through browser.new_context() and context.new_page() so the session can be exported.",
+    f"After the last step passes, call context.storage_state(path=os.environ['{STORAGE_STATE_OUT_ENV}']) "
+    f"and print '{SESSION_URL_MARKER} ' followed by page.url, then close the browser.",
+]
+
+# Extra prompt requirements for scripts that resume from the snapshot
+RESUME_REQUIREMENTS = [
+    f"Create the context with browser.new_context(storage_state=os.environ['{STORAGE_STATE_IN_ENV}']); "
+    "the prerequisite steps have already been performed in that session, do not repeat them.",
+    f"Before the first step, open os.environ['{START_URL_ENV}'] with page.goto() when that variable is set.",
+]
+
+
+async def group_by_prerequisite_prefix(conn, testcase_ids: List[str]) -> Dict[Tuple[str, ...], List[str]]:
+    """
+    Map each prerequisite chain (ordered, without the test itself) to the
+    selected test cases that depend on it. Tests without prerequisites are
+    grouped under the empty tuple.
+    """
+    groups: Dict[Tuple[str, ...], List[str]] = {}
+    for testcase_id in testcase_ids:
+        chain = await utils.get_prereq_chain(conn, testcase_id)
+        groups.setdefault(tuple(chain[:-1]), []).append(testcase_id)
+    return groups
+
+
+@dataclass
+class PrefixNode:
+    """One prerequisite in the prefix tree, identified by its chain from the root"""
+    prefix: Tuple[str, ...]
+    members: List[str] = field(default_factory=list)  # selected tests whose whole chain is this prefix
+    children: Dict[str, "PrefixNode"] = field(default_factory=dict)
+
+    def all_members(self) -> List[str]:
+        found = list(self.members)
+        for child in self.children.values():
+            found.extend(child.all_members())
+        return found
+
+    def count_prerequisites(self) -> int:
+        return sum(1 + child.count_prerequisites() for child in self.children.values())
+
+
+def build_prefix_tree(groups: Dict[Tuple[str, ...], List[str]]) -> PrefixNode:
+    """Merge the chains of group_by_prerequisite_prefix so a shared prefix appears once"""
+    root = PrefixNode(())
+    for prefix, members in groups.items():
+        node = root
+        for depth, tc_id in enumerate(prefix, start=1):
+            node = node.children.setdefault(tc_id, PrefixNode(prefix[:depth]))
+        node.members.extend(members)
+    return root
+
+
+async def build_prefix_plan(conn, prefix: Tuple[str, ...]) -> dict:
+    """Test plan that performs the whole prerequisite chain as one script"""
+    plan = {
+        "pretestid - steps": {},
+        "current testid": prefix[-1],
+        "current - bdd steps": await utils.get_steps_map(conn, prefix[-1])
+    }
+    for tc_id in prefix[:-1]:
+        steps = await utils.get_steps_map(conn, tc_id)
+        if steps:
+            plan["pretestid - steps"][tc_id] = steps
+    return plan
+
+
+async def build_dependent_plan(conn, testcase_id: str, prefix: Tuple[str, ...]) -> dict:
+    """Test plan with only the test's own steps; prerequisites come from the snapshot"""
+    return {
+        "pretestid - steps": {},
+        "resumed after prerequisites": list(prefix),
+        "current testid": testcase_id,
+        "current - bdd steps": await utils.get_steps_map(conn, testcase_id)
+    }
+
+
+def extract_session_url(output: str) -> Optional[str]:
+    """Return the last URL the prefix script reported before exporting its session"""
+    session_url = None
+    for line in output.splitlines():
+        if SESSION_URL_MARKER in line:
+            session_url = line.split(SESSION_URL_MARKER, 1)[1].strip() or session_url
+    return session_url
+
+
+@router.websocket("/testcases/execute-shared-prereq")
+async def execute_with_shared_prerequisites(
+    websocket: WebSocket,
+    testcase_ids: str,
+    script_type: str = "playwright"
+):
+    """
+    WebSocket endpoint:
+    1. Validate JWT and access to every selected test case
+    2. Group the test cases by common prerequisite prefix
+    3. Run every prerequisite once from its parent's snapshot and capture
+       Playwright storage_state
+    4. Run each dependent test from its chain's session, stream logs
+    5. Store one execution row per selected test case
+    """
+    await websocket.accept()
+    frames = LogFrames.for_websocket(websocket)
+    llm_ledger.start_llm_usage()
+    utils.logger.debug(f"[SHARED-PREREQ] WebSocket opened for {testcase_ids}, {script_type}")
+
+    current_user = await utils.get_websocket_user(websocket)
+    if not current_user:
+        await frames.send({"status": "FAILED", "error": "Invalid or missing token"})
+        await websocket.close()
+        return
+
+    # storage_state snapshots are a Playwright feature
+    script_type = script_type.lower()
+    if script_type != "playwright":
+        await frames.send({
+            "status": "FAILED",
+            "error": "Shared prerequisite execution requires script_type 'playwright'"
+        })
+        await websocket.close()
+        return
+
+    ids = [tc_id.strip() for tc_id in testcase_ids.split(',') if tc_id.strip()]
+    if not ids:
+        await frames.send({"status": "FAILED", "error": "No valid testcase_ids provided"})
+        await websocket.close()
+        return
+
+    conn = None
+    results: Dict[str, str] = {}
+    try:
+        conn = await db.get_db_connection()
+
+        for tc_id in ids:
+            tc_project = await conn.fetchrow("SELECT projectid FROM testcase WHERE testcaseid = $1", tc_id)
+            if not tc_project:
+                await frames.send({"status": "FAILED", "error": f"Test case {tc_id} not found"})
+                return
+            access = await conn.fetchrow(
+                "SELECT 1 FROM projectuser WHERE userid = $1 AND projectid && $2",
+                current_user["userid"], tc_project["projectid"]
+            )
+            if not access:
+                await frames.send({"status": "FAILED", "error": f"Unauthorized test case access: {tc_id}"})
+                return
+
+        groups = await group_by_prerequisite_prefix(conn, ids)
+        tree = build_prefix_tree(groups)
+        await frames.send({
+            "status": "GROUPS_READY",
+            "groups": [{"prefix": list(prefix), "testcases": members} for prefix, members in groups.items()],
+            "log": f"{len(ids)} test cases grouped into {len(groups)} prerequisite chains, "
+                   f"{tree.count_prerequisites()} prerequisite runs"
+        })
+
+        async def run_dependent(tc_id: str, prefix: Tuple[str, ...], resume_env: Dict[str, str]):
+            async def stream_test(line: str):
+                await frames.line(line, testcase_id=tc_id)
+
+            await frames.send({"status": "GENERATING", "testcase_id": tc_id, "log": f"Generating script for {tc_id}..."})
+            try:
+                script = await generate_script(
+                    testcase_id=tc_id,
+                    script_type=script_type,
+                    script_lang="python",
+                    testplan=await build_dependent_plan(conn, tc_id, prefix),
+                    extra_requirements=RESUME_REQUIREMENTS if prefix else None,
+                    use_cache=False
+                )
+                preflight = preflight_script(script)
+                if preflight.ok:
+                    await frames.send({"status": "EXECUTING", "testcase_id": tc_id, "log": f"Executing {tc_id}..."})
+                    result = await run_script(preflight.script, on_line=stream_test, env=resume_env)
+                    status = "SUCCESS" if result.return_code == 0 else "FAILED"
+                    message = "Script executed successfully" if status == "SUCCESS" else result.exit_message()
+                    output, termination, artifacts = result.output, result.termination, result.artifacts
+                else:
+                    # Broken script: fail the case without launching an interpreter
+                    await stream_test(preflight.report())
+                    status, message = "FAILED", "Pre-flight check failed; script was not executed"
+                    output, termination, artifacts = preflight.report() + "\n", None, []
+                if prefix:
+                    message += f" (resumed after {' > '.join(prefix)})"
+            except Exception as e:
+                status, message, output, termination, artifacts = "FAILED", str(e), "", None, []
+
+            await utils.save_execution(conn, tc_id, script_type, message, output, status, termination, artifacts)
+            results[tc_id] = status
+            await frames.send({
+                "status": "TESTCASE_COMPLETED",
+                "testcase_id": tc_id,
+                "final_status": status,
+                "log": message
+            })
+
+        async def snapshot(node: PrefixNode, parent_env: Dict[str, str], state_dir: str) -> Optional[Dict[str, str]]:
+            """Run one prerequisite from its parent's session; the resume env for its subtree, None if it failed"""
+            prefix = node.prefix
+            state_path = os.path.join(state_dir, f"storage_state_{uuid.uuid4().hex[:12]}.json")
+            tag = f"[PREREQ {' > '.join(prefix)}]"
+
+            async def stream_prefix(line: str):
+                await frames.line(f"{tag} {line}")
+
+            waiting = node.all_members()
+            await frames.send({
+                "status": "PREREQ_RUNNING",
+                "prefix": list(prefix),
+                "log": f"{tag} Running shared prerequisites once for {len(waiting)} test cases"
+            })
+            try:
+                if parent_env:
+                    # Fork from the longest shared snapshot: only this prerequisite's own steps
+                    testplan = await build_dependent_plan(conn, prefix[-1], prefix[:-1])
+                    requirements = RESUME_REQUIREMENTS + SNAPSHOT_REQUIREMENTS
+                else:
+                    testplan = await build_prefix_plan(conn, prefix)
+                    requirements = SNAPSHOT_REQUIREMENTS
+                prefix_script = await generate_script(
+                    testcase_id=prefix[-1],
+                    script_type=script_type,
+                    script_lang="python",
+                    testplan=testplan,
+                    extra_requirements=requirements,
+                    use_cache=False
+                )
+                preflight = preflight_script(prefix_script)
+                if not preflight.ok:
+                    # Broken script: its dependents fail without launching an interpreter
+                    await stream_prefix(preflight.report())
+                    prefix_result = ScriptResult(return_code=1, output=preflight.report() + "\n")
+                    prefix_error = "pre-flight check failed; script was not executed"
+                else:
+                    prefix_result = await run_script(
+                        preflight.script,
+                        on_line=stream_prefix,
+                        env={**parent_env, STORAGE_STATE_OUT_ENV: state_path}
+                    )
+                    prefix_error = None
+                    if prefix_result.return_code != 0:
+                        prefix_error = prefix_result.termination or f"exited with code {prefix_result.return_code}"
+                    elif not os.path.exists(state_path):
+                        prefix_error = "did not export a storage_state snapshot"
+            except Exception as e:
+                prefix_result = None
+                prefix_error = str(e)
+
+            if prefix_error:
+                message = f"Shared prerequisite {' > '.join(prefix)} failed: {prefix_error}"
+                await frames.send({"status": "PREREQ_FAILED", "prefix": list(prefix), "log": message})
+                for tc_id in waiting:
+                    await utils.save_execution(
+                        conn, tc_id, script_type, message,
+                        prefix_result.output if prefix_result else "", "FAILED",
+                        prefix_result.termination if prefix_result else None,
+                        prefix_result.artifacts if prefix_result else ()
+                    )
+                    results[tc_id] = "FAILED"
+                    await frames.send({
+                        "status": "TESTCASE_COMPLETED",
+                        "testcase_id": tc_id,
+                        "final_status": "FAILED",
+                        "log": message
+                    })
+                return None
+
+            resume_env = {STORAGE_STATE_IN_ENV: state_path}
+            session_url = extract_session_url(prefix_result.output)
+            if session_url:
+                resume_env[START_URL_ENV] = session_url
+            await frames.send({
+                "status": "PREREQ_SNAPSHOT_READY",
+                "prefix": list(prefix),
+                "log": f"{tag} Session captured" + (f" at {session_url}" if session_url else "")
+            })
+            return resume_env
+
+        async def run_node(node: PrefixNode, resume_env: Dict[str, str], state_dir: str):
+            for tc_id in node.members:
+                await run_dependent(tc_id, node.prefix, resume_env)
+            for child in node.children.values():
+                child_env = await snapshot(child, resume_env, state_dir)
+                if child_env is not None:
+                    await run_node(child, child_env, state_dir)
+
+        with tempfile.TemporaryDirectory(prefix="prereq_state_") as state_dir:
+            await run_node(tree, {}, state_dir)
+
+        await frames.send({
+            "status": "COMPLETED",
+            "results": results,
+            "log": f"{sum(1 for s in results.values() if s == 'SUCCESS')}/{len(results)} test cases passed"
+        })
+
+    except WebSocketDisconnect:
+        utils.logger.warning("[SHARED-PREREQ] Client disconnected")
+    except Exception as e:
+        utils.logger.error(f"[SHARED-PREREQ] Unexpected error: {str(e)}")
+        try:
+            await frames.send({"status": "FAILED", "error": str(e)})
+        except:
+            pass
+    finally:
+        if conn:
+            await db.release_db_connection(conn)
+        try:
+            await websocket.close()
+        except:
+            pass
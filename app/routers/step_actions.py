@@ -0,0 +1,315 @@
+"""
+Step Action Library
+Registered async Playwright handlers for recurring BDD steps (navigate, fill,
+click, select, check, radio answers, account-list rows, verify, wait) and a
+runner that executes a resolved test plan directly, without a generated
+script. Steps no handler matches carry an LLM-written snippet instead.
+
+Imports nothing from the app but the stdlib-only script_preflight: it runs in
+child processes, either from a keyword_executor runner script or inside the
+context host.
+"""
+
+import asyncio
+import json
+import os
+import re
+import textwrap
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+try:
+    from routers.script_preflight import preflight_snippet
+except ImportError:  # context host: started from the routers directory
+    from script_preflight import preflight_snippet
+
+ACTION_TIMEOUT_MS = 15000
+LOCATOR_POLL_SECONDS = 0.25
+HEADLESS_ENV = "STEP_ACTIONS_HEADLESS"
+
+BDD_PREFIX = re.compile(r"^(given|when|then|and|but)\s+", re.IGNORECASE)
+SUBJECT_PREFIX = re.compile(r"^(i|the user|user)\s+", re.IGNORECASE)
+ANY_VALUE = r"\S.*"
+ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "last": -1}
+
+
+@dataclass
+class StepContext:
+    page: Any
+    step: str
+    arg: str
+    state: Dict[str, Any] = field(default_factory=dict)
+
+
+Handler = Callable[[StepContext, "re.Match"], Awaitable[None]]
+
+
+@dataclass
+class StepAction:
+    name: str
+    patterns: List["re.Pattern"]
+    handler: Handler
+    arg_pattern: Optional["re.Pattern"] = None  # test data the step needs, if any
+
+
+ACTIONS: List[StepAction] = []
+
+
+def step_action(name: str, *patterns: str, arg_pattern: Optional[str] = None):
+    """Register a handler; earlier registrations win when several patterns match"""
+    def register(handler: Handler) -> Handler:
+        ACTIONS.append(StepAction(
+            name=name,
+            patterns=[re.compile(p, re.IGNORECASE) for p in patterns],
+            handler=handler,
+            arg_pattern=re.compile(arg_pattern, re.IGNORECASE | re.DOTALL) if arg_pattern else None
+        ))
+        return handler
+    return register
+
+
+def clean_step(step: str) -> str:
+    """Step text without the BDD keyword and "I"/"the user" subject"""
+    text = BDD_PREFIX.sub("", step.strip())
+    return SUBJECT_PREFIX.sub("", text).strip().rstrip(".")
+
+
+def match_action(step: str, arg: str) -> Optional[Tuple[StepAction, "re.Match"]]:
+    text = clean_step(step)
+    for action in ACTIONS:
+        if action.arg_pattern and not action.arg_pattern.fullmatch(arg or ""):
+            continue
+        for pattern in action.patterns:
+            match = pattern.fullmatch(text)
+            if match:
+                return action, match
+    return None
+
+
+# ==========================================================
+# Locators
+# ==========================================================
+async def find_element(page, name: str, roles: Tuple[str, ...] = ()):
+    """First visible-in-DOM match by role name, label, placeholder, text, name or id"""
+    candidates = [page.get_by_role(role, name=name) for role in roles]
+    candidates += [
+        page.get_by_label(name),
+        page.get_by_placeholder(name),
+        page.get_by_text(name),
+        page.locator(f"[name={json.dumps(name)}]"),
+    ]
+    if re.fullmatch(r"[A-Za-z][\w-]*", name):
+        candidates.append(page.locator(f"#{name}"))
+
+    deadline = asyncio.get_running_loop().time() + ACTION_TIMEOUT_MS / 1000
+    while True:
+        for locator in candidates:
+            if await locator.count():
+                return locator.first
+        if asyncio.get_running_loop().time() > deadline:
+            raise LookupError(f"No element found for '{name}'")
+        await asyncio.sleep(LOCATOR_POLL_SECONDS)
+
+
+async def find_frame_with(page, selector: str):
+    """Page or child frame that contains selector (apps that render inside frames)"""
+    deadline = asyncio.get_running_loop().time() + ACTION_TIMEOUT_MS / 1000
+    while True:
+        for frame in page.frames:
+            if await frame.locator(selector).count():
+                return frame
+        if asyncio.get_running_loop().time() > deadline:
+            raise LookupError(f"No frame contains {selector}")
+        await asyncio.sleep(LOCATOR_POLL_SECONDS)
+
+
+def _target_name(text: str) -> str:
+    text = re.sub(r"^(on\s+)?(the\s+|a\s+|an\s+)", "", text.strip(), flags=re.IGNORECASE)
+    return text.strip("\"' ")
+
+
+# ==========================================================
+# Handlers (registration order = match priority)
+# ==========================================================
+@step_action("radio_answer", r".*\banswer\s*=\s*(?P<answer>\d+)\b.*")
+async def radio_answer(ctx: StepContext, match):
+    """Questionnaire radios whose ids end in answerN (claims forms)"""
+    xpath = f"//input[@type='radio' and contains(@id,'answer{match.group('answer')}') and not(@disabled)]"
+    radio = ctx.page.locator(f"xpath={xpath}").first
+    await radio.wait_for(state="attached", timeout=ACTION_TIMEOUT_MS)
+    await radio.click(force=True)
+
+
+ACCOUNT_TABLE_XPATH = "//table[.//text()[contains(.,'Customer Account List')]]"
+ACCOUNT_LINK_XPATH = ACCOUNT_TABLE_XPATH + "//a[contains(@href,'selectedAccountNumber')]"
+
+
+@step_action(
+    "account_row",
+    r"(?:click|select|open)(?: on)?(?: the)? (?P<which>.+?) account(?: number)?(?: in the account list)?",
+    r"(?:click|select|open)(?: on)?(?: the)? account(?: number)? (?P<which>[\dxX*]+)",
+)
+async def account_row(ctx: StepContext, match):
+    """Customer Account List row by ordinal, masked number (XXXX5034) or account number"""
+    frame = await find_frame_with(ctx.page, f"xpath={ACCOUNT_TABLE_XPATH}")
+    links = frame.locator(f"xpath={ACCOUNT_LINK_XPATH}")
+    total = await links.count()
+    if total == 0:
+        raise RuntimeError("No account numbers found in Customer Account List")
+
+    which = (ctx.arg or match.group("which")).lower()
+    target = None
+    ordinal = next((idx for word, idx in ORDINALS.items() if word in which.split()), None)
+    numeric = re.search(r"(\d+)(st|nd|rd|th)\b", which)
+    if ordinal is not None or numeric:
+        idx = ordinal if ordinal is not None else int(numeric.group(1))
+        if idx > total:
+            raise RuntimeError(f"Only {total} accounts found, cannot click account {idx}")
+        target = links.nth(total - 1 if idx == -1 else idx - 1)
+    else:
+        digits = "".join(c for c in which if c.isdigit())
+        if not digits:
+            raise RuntimeError(f"Unable to determine which account to click from '{which}'")
+        masked = "x" in which or "*" in which
+        for i in range(total):
+            href = await links.nth(i).get_attribute("href") or ""
+            if (masked and href.endswith(digits[-4:])) or (not masked and digits in href):
+                target = links.nth(i)
+                break
+        if target is None:
+            raise RuntimeError(f"Account {which} not found")
+
+    await target.scroll_into_view_if_needed()
+    await target.click(timeout=ACTION_TIMEOUT_MS)
+
+
+@step_action("press_key", r"press (?:the )?(?P<key>enter|tab|escape|esc|space|backspace)(?: key)?")
+async def press_key(ctx: StepContext, match):
+    key = match.group("key").capitalize()
+    await ctx.page.keyboard.press("Escape" if key == "Esc" else key)
+
+
+@step_action("wait", r"wait(?: for)? (?P<seconds>\d+(?:\.\d+)?) sec(?:ond)?s?")
+async def wait_seconds(ctx: StepContext, match):
+    await ctx.page.wait_for_timeout(float(match.group("seconds")) * 1000)
+
+
+@step_action(
+    "verify_text",
+    r"(?:verify|validate|confirm|check|see|should see|assert)(?: that)?(?: the)? (?P<text>.+?) (?:is |are )?(?:displayed|visible|shown|present)",
+    r"(?:verify|validate|confirm|should see|see)(?: that)?(?: the)? (?:text|message)(?: (?P<text>.+))?",
+)
+async def verify_text(ctx: StepContext, match):
+    text = ctx.arg or _target_name(match.group("text") or "")
+    if not text:
+        raise RuntimeError("No text to verify")
+    await ctx.page.get_by_text(text).first.wait_for(state="visible", timeout=ACTION_TIMEOUT_MS)
+
+
+@step_action(
+    "select_option",
+    r"(?:select|choose)(?: the)? (?P<field>.+?)(?: dropdown| list| option)?",
+    arg_pattern=ANY_VALUE
+)
+async def select_option(ctx: StepContext, match):
+    element = await find_element(ctx.page, _target_name(match.group("field")), roles=("combobox", "listbox"))
+    await element.select_option(label=ctx.arg)
+
+
+@step_action("check", r"(?P<verb>check|uncheck|tick|untick)(?: the)? (?P<target>.+?)(?: checkbox| box)?")
+async def check_box(ctx: StepContext, match):
+    element = await find_element(ctx.page, _target_name(match.group("target")), roles=("checkbox",))
+    if match.group("verb").lower() in ("check", "tick"):
+        await element.check()
+    else:
+        await element.uncheck()
+
+
+@step_action(
+    "fill",
+    r"(?:enter|type|fill(?: in)?|input|provide)(?: the| a| an| valid| invalid)* (?P<field>.+?)(?: field| box| textbox)?(?: with .*)?",
+    arg_pattern=ANY_VALUE
+)
+async def fill_field(ctx: StepContext, match):
+    element = await find_element(ctx.page, _target_name(match.group("field")), roles=("textbox", "searchbox"))
+    await element.fill(ctx.arg)
+
+
+@step_action(
+    "navigate",
+    r"(?:navigate|go|open|visit|launch|browse)(?: to)?(?: the)? (?P<target>.+?)",
+    arg_pattern=r"https?://\S+"
+)
+async def navigate(ctx: StepContext, match):
+    await ctx.page.goto(ctx.arg)
+
+
+@step_action("click", r"(?:click|tap|press|hit)(?: on)?(?: the)? (?P<target>.+?)(?: button| link| tab| icon| menu)?")
+async def click(ctx: StepContext, match):
+    element = await find_element(ctx.page, _target_name(match.group("target")), roles=("button", "link", "tab", "menuitem"))
+    await element.click(timeout=ACTION_TIMEOUT_MS)
+
+
+# ==========================================================
+# Runner
+# ==========================================================
+def compile_snippet(code: str) -> Callable[[Any, str], Awaitable[None]]:
+    """
+    Turn an LLM snippet (body using `page` and `arg`) into an async function.
+    Raises ValueError when pre-flight rejects it (the runner script's own
+    pre-flight cannot see code held in STEPS strings).
+    """
+    issues = preflight_snippet(code)
+    if issues:
+        raise ValueError("; ".join(str(issue) for issue in issues))
+    namespace: Dict[str, Any] = {"re": re, "asyncio": asyncio}
+    source = "async def __snippet(page, arg):\n" + textwrap.indent(code.strip() or "pass", "    ")
+    exec(compile(source, "<step snippet>", "exec"), namespace)
+    return namespace["__snippet"]
+
+
+async def run_plan(browser, steps: List[Dict[str, str]], log: Callable[[str], None] = print) -> int:
+    """
+    Run resolved steps ({"step", "arg"} plus "code" for LLM-written ones) in a
+    new context of browser, logging the standard step lines. Stops at the
+    first failing step; returns the exit code.
+    """
+    context = await browser.new_context()
+    try:
+        page = await context.new_page()
+        state: Dict[str, Any] = {}
+        for step in steps:
+            label = step["step"]
+            log(f"Running action: {label} at {datetime.now()}")
+            try:
+                if step.get("code") is not None:
+                    await compile_snippet(step["code"])(page, step.get("arg", ""))
+                else:
+                    resolved = match_action(label, step.get("arg", ""))
+                    if resolved is None:
+                        raise RuntimeError("No step action matches this step")
+                    action, match = resolved
+                    await action.handler(StepContext(page, label, step.get("arg", ""), state), match)
+                log(f"Action completed: {label} at {datetime.now()}")
+            except Exception as e:
+                log(f"Action {label} failed at {datetime.now()} due to: {e}")
+                return 1
+        return 0
+    finally:
+        await context.close()
+
+
+async def run_steps(steps: List[Dict[str, str]], headless: Optional[bool] = None) -> int:
+    """Launch a browser and run_plan() the steps in it, printing the log lines"""
+    from playwright.async_api import async_playwright
+
+    if headless is None:
+        headless = os.environ.get(HEADLESS_ENV, "true").lower() == "true"
+
+    async with async_playwright() as pw:
+        browser = await pw.chromium.launch(headless=headless)
+        try:
+            return await run_plan(browser, steps, log=lambda line: print(line, flush=True))
+        finally:
+            await browser.close()
@@ -0,0 +1,305 @@
+"""
+Step-Level Script Assembly
+Builds a test script from per-step code snippets instead of asking the LLM
+for the whole script:
+- exact match: step_snippet table keyed by (script type, step text, test data)
+- semantic match: MADL step embeddings (madl_module.search_by_step), only for
+  the same normalized step text or a near-identical one
+- the LLM only writes the steps nobody has seen yet, plus the setup/teardown
+  glue when it is not cached for this test plan
+The assembler owns the script structure (imports, per-step try/except with the
+standard "Running action" log lines, teardown in finally), so snippets stay
+small and interchangeable. Snippets of a passing run are remembered.
+"""
+
+import asyncio
+import hashlib
+import re
+import textwrap
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from azure_openai_client import call_openai_api
+import config
+import utils
+from routers.madl_module import madl_module
+
+SETUP_KEY = "__setup__"
+TEARDOWN_KEY = "__teardown__"
+
+# Variable the snippets drive the browser through
+BROWSER_HANDLES = {
+    "playwright": ("page", "a Playwright sync API `page` (keep the browser/context in variables for teardown)"),
+    "selenium": ("driver", "a Selenium WebDriver `driver`"),
+}
+
+SECTION_MARKER = re.compile(r"^###\s*(SETUP|TEARDOWN|STEP\s+(\d+))\s*$", re.MULTILINE)
+FENCE_LINE = re.compile(r"^\s*```.*$", re.MULTILINE)
+BDD_PREFIX = re.compile(r"^(given|when|then|and|but)\s+", re.IGNORECASE)
+
+
+@dataclass
+class PlanStep:
+    """One step of the flattened test plan"""
+    testcase_id: str
+    step: str
+    arg: str
+    key: str
+    code: Optional[str] = None
+    source: str = ""  # "exact", "semantic" or "llm"
+
+
+@dataclass
+class AssembledScript:
+    script: str
+    script_type: str
+    steps: List[PlanStep]
+    setup: str
+    teardown: str
+    glue_scope: str = ""
+    glue_generated: bool = False
+    counts: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> str:
+        return (
+            f"Assembled {len(self.steps)} steps: {self.counts.get('exact', 0)} cached, "
+            f"{self.counts.get('semantic', 0)} matched semantically, {self.counts.get('llm', 0)} generated"
+            + (" (+ setup/teardown)" if self.glue_generated else "")
+        )
+
+
+def _clean_arg(arg: Any) -> str:
+    text = "" if arg is None else str(arg).strip()
+    return "" if text.upper() == "NULL" else text
+
+
+def normalize_step_text(step: str) -> str:
+    """Keyword-less, case/whitespace-insensitive step text"""
+    return " ".join(BDD_PREFIX.sub("", step.strip()).lower().split())
+
+
+def step_key(script_type: str, step: str, arg: str) -> str:
+    """Exact-match key: normalized step text plus its test data"""
+    return hashlib.sha256(f"{script_type.lower()}\n{normalize_step_text(step)}\n{arg}".encode("utf-8")).hexdigest()
+
+
+def glue_scope(steps: List[PlanStep]) -> str:
+    """
+    Test cases of the plan (prerequisites first): setup/teardown are cached per
+    plan, since imports and browser setup differ between plans.
+    """
+    return ",".join(dict.fromkeys(s.testcase_id for s in steps))
+
+
+def plan_steps(testplan: Dict[str, Any], script_type: str) -> List[PlanStep]:
+    """Prerequisite steps then current steps, for both test plan layouts in use"""
+    prereq = testplan.get("pretestid_steps") or testplan.get("pretestid - steps") or {}
+    current = testplan.get("current_bdd_steps") or testplan.get("current - bdd steps") or {}
+    current_id = testplan.get("current_testid") or testplan.get("current testid") or ""
+
+    steps: List[PlanStep] = []
+    for testcase_id, step_map in list(prereq.items()) + [(current_id, current)]:
+        for step, arg in (step_map or {}).items():
+            arg = _clean_arg(arg)
+            steps.append(PlanStep(testcase_id, step, arg, step_key(script_type, step, arg)))
+    return steps
+
+
+async def _load_exact(conn, keys: List[str]) -> Dict[str, str]:
+    rows = await conn.fetch(
+        "SELECT step_key, snippet_code FROM step_snippet WHERE step_key = ANY($1::text[])",
+        keys
+    )
+    return {row["step_key"]: row["snippet_code"] for row in rows}
+
+
+async def _semantic_match(step: PlanStep, script_type: str) -> Optional[str]:
+    """
+    MADL step snippet for this script type that uses this step's test data,
+    written for the same normalized step text or scoring at least
+    STEP_SEMANTIC_MIN_SCORE. Nearby steps ("click Save" / "click Cancel") score
+    well above the MADL search threshold, so a plain hit is not enough.
+    """
+    normalized = normalize_step_text(step.step)
+    for snippet in await madl_module.search_by_step(step.step):
+        if snippet.script_type != script_type:
+            continue
+        if step.arg and step.arg not in snippet.snippet_code:
+            continue
+        if normalize_step_text(snippet.step_text) == normalized or snippet.score >= config.STEP_SEMANTIC_MIN_SCORE:
+            return snippet.snippet_code
+    return None
+
+
+def _build_prompt(script_type: str, steps: List[PlanStep], need_glue: bool) -> str:
+    handle, handle_desc = BROWSER_HANDLES[script_type]
+    listing = []
+    for i, step in enumerate(steps, start=1):
+        data = f" | test data: {step.arg}" if step.arg else ""
+        status = "already written" if step.code is not None else "WRITE THIS"
+        listing.append(f"{i}. [{status}] {step.step}{data}")
+
+    sections = ["### SETUP", "### TEARDOWN"] if need_glue else []
+    sections += [f"### STEP {i}" for i, s in enumerate(steps, start=1) if s.code is None]
+
+    return f"""You write Python {script_type} test code that is assembled from per-step blocks.
+The assembler provides the structure:
+- SETUP runs first. It holds ALL imports and starts the browser, defining {handle_desc}.
+- Each STEP block runs inside a try/except that already prints the
+  'Running action' / 'Action completed' / 'Action ... failed' log lines.
+  Do NOT add imports, try/except or those log lines to STEP blocks. Use only `{handle}`
+  and the step's test data as literals. Steps share state through `{handle}` only.
+- TEARDOWN runs last inside a finally block and closes the browser.
+
+Test steps in order:
+{chr(10).join(listing)}
+
+Output ONLY these sections, each starting with its marker line exactly as shown,
+with code at column 0 and no markdown or explanations:
+{chr(10).join(sections)}
+"""
+
+
+def parse_sections(text: str) -> Dict[str, str]:
+    text = FENCE_LINE.sub("", text)
+    sections: Dict[str, str] = {}
+    matches = list(SECTION_MARKER.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        name = f"STEP {match.group(2)}" if match.group(2) else match.group(1)
+        sections[name] = textwrap.dedent(text[match.end():end]).strip("\n")
+    return sections
+
+
+def _check_block(name: str, code: str):
+    try:
+        compile(code or "pass", f"<{name}>", "exec")
+    except SyntaxError as e:
+        raise ValueError(f"{name} does not compile: {e.msg} (line {e.lineno})")
+
+
+def _render(setup: str, teardown: str, steps: List[PlanStep]) -> str:
+    lines = ["from datetime import datetime", "", setup, "", "try:"]
+    for i, step in enumerate(steps, start=1):
+        label = repr(step.step)
+        block = "\n".join([
+            f"# Step {i}: {step.step}",
+            f'print("Running action: %s at %s" % ({label}, datetime.now()))',
+            "try:",
+            textwrap.indent(step.code or "pass", "    "),
+            f'    print("Action completed: %s at %s" % ({label}, datetime.now()))',
+            "except Exception as e:",
+            f'    print("Action %s failed at %s due to: %s" % ({label}, datetime.now(), e))',
+            "    raise",
+            ""
+        ])
+        lines.append(textwrap.indent(block, "    "))
+    lines += ["finally:", textwrap.indent(teardown or "pass", "    "), ""]
+    return "\n".join(lines)
+
+
+async def assemble_script(conn, script_type: str, testplan: Dict[str, Any], use_cache: bool = True) -> AssembledScript:
+    """
+    Resolve every plan step to a snippet and assemble the script
+    (use_cache=False skips the LLM response cache for the missing ones). Raises
+    ValueError when the plan is empty or the LLM output cannot be used, so the
+    caller can fall back to whole-script generation.
+    """
+    script_type = script_type.lower()
+    if script_type not in BROWSER_HANDLES:
+        raise ValueError(f"Unsupported script type for assembly: {script_type}")
+    steps = plan_steps(testplan, script_type)
+    if not steps:
+        raise ValueError("Test plan has no steps to assemble")
+
+    scope = glue_scope(steps)
+    glue_keys = [step_key(script_type, SETUP_KEY, scope), step_key(script_type, TEARDOWN_KEY, scope)]
+    exact = await _load_exact(conn, [s.key for s in steps] + glue_keys)
+    for step in steps:
+        if step.key in exact:
+            step.code, step.source = exact[step.key], "exact"
+
+    if madl_module.is_ready:
+        missing = [s for s in steps if s.code is None]
+        matches = await asyncio.gather(*(_semantic_match(s, script_type) for s in missing))
+        for step, code in zip(missing, matches):
+            if code is not None:
+                step.code, step.source = code, "semantic"
+
+    setup, teardown = exact.get(glue_keys[0]), exact.get(glue_keys[1])
+    need_glue = setup is None or teardown is None
+    if need_glue or any(s.code is None for s in steps):
+        text = await call_openai_api(
+            prompt=_build_prompt(script_type, steps, need_glue),
+            max_tokens=4000,
+            system_message="You are a test automation expert. Output only the requested code sections.",
+            cache="assemble_script" if use_cache else None,
+            endpoint="assemble_script"
+        )
+        sections = parse_sections(text)
+        if need_glue:
+            if "SETUP" not in sections or "TEARDOWN" not in sections:
+                raise ValueError("AI output is missing the SETUP/TEARDOWN sections")
+            setup, teardown = sections["SETUP"], sections["TEARDOWN"]
+        for i, step in enumerate(steps, start=1):
+            if step.code is None:
+                if f"STEP {i}" not in sections:
+                    raise ValueError(f"AI output is missing STEP {i}")
+                step.code, step.source = sections[f"STEP {i}"], "llm"
+
+    _check_block("SETUP", setup)
+    _check_block("TEARDOWN", teardown)
+    for i, step in enumerate(steps, start=1):
+        if step.source != "exact":
+            _check_block(f"STEP {i}", step.code)
+
+    counts: Dict[str, int] = {}
+    for step in steps:
+        counts[step.source] = counts.get(step.source, 0) + 1
+    return AssembledScript(
+        script=_render(setup, teardown, steps),
+        script_type=script_type,
+        steps=steps,
+        setup=setup,
+        teardown=teardown,
+        glue_scope=scope,
+        glue_generated=need_glue,
+        counts=counts
+    )
+
+
+async def remember_snippets(conn, testcase_id: str, assembled: AssembledScript):
+    """
+    After a passing run: store new snippets (exact table + MADL step embeddings)
+    and count reuse of cached ones. Never raises.
+    """
+    try:
+        rows = [
+            (s.key, assembled.script_type, s.step, s.arg, s.code, s.testcase_id or testcase_id)
+            for s in assembled.steps
+        ]
+        if assembled.glue_generated:
+            rows += [
+                (step_key(assembled.script_type, SETUP_KEY, assembled.glue_scope), assembled.script_type, SETUP_KEY,
+                 assembled.glue_scope, assembled.setup, testcase_id),
+                (step_key(assembled.script_type, TEARDOWN_KEY, assembled.glue_scope), assembled.script_type, TEARDOWN_KEY,
+                 assembled.glue_scope, assembled.teardown, testcase_id),
+            ]
+        await conn.executemany(
+            """
+            INSERT INTO step_snippet (step_key, scripttype, step_text, arg, snippet_code, testcaseid)
+            VALUES ($1, $2, $3, $4, $5, $6)
+            ON CONFLICT (step_key) DO UPDATE
+            SET hits = step_snippet.hits + 1, updated_at = NOW()
+            """,
+            rows
+        )
+
+        generated = [s for s in assembled.steps if s.source == "llm"]
+        if generated and madl_module.is_ready:
+            await madl_module.store_step_embeddings(testcase_id, [
+                {"step_text": s.step, "snippet_code": s.code, "script_type": assembled.script_type}
+                for s in generated
+            ])
+    except Exception as e:
+        utils.logger.warning(f"[ASSEMBLY] Failed to remember step snippets for {testcase_id}: {str(e)}")
@@ -0,0 +1,455 @@
+"""
+Suite Runs
+POST /runs starts a run of explicit test cases and/or of every test case of a
+project carrying a tag, and returns at once. Runs are ordered over the
+prerequisite DAG by RunPlanner; one scheduler shared by all runs caps the
+test cases executing at the same time, globally and per project.
+Each run has a suite_run record that aggregates its case results, and a
+websocket (/runs/{run_id}/ws) multiplexing the progress of all its cases.
+A late subscriber first gets the run's status events so far; a subscriber
+that falls more than LOG_FRAME_MAX_PENDING events behind loses log lines (it
+gets a count of them instead), never status events. A run belongs to the API
+instance that started it, which renews its lease while it is live; a
+QUEUED/RUNNING run whose lease ran out (its instance crashed or restarted) is
+marked FAILED by any instance.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import uuid
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+
+import config
+import database as db
+import models
+import utils
+from routers.log_frames import LogFrames
+from routers.run_planner import RunPlanner, make_case_runner, topological_order
+from routers.users import get_current_any_user
+
+router = APIRouter()
+
+FINAL_CASE_EVENTS = ("CASE_COMPLETED", "CASE_SKIPPED")
+INSTANCE_ID = f"{socket.gethostname()}-{os.getpid()}"
+
+RENEW_SQL = """
+UPDATE suite_run SET lease_until = NOW() + make_interval(secs => $3)
+WHERE runid = ANY($1::text[]) AND owner = $2 AND status IN ('QUEUED', 'RUNNING')
+"""
+
+# Interrupted: lease expired, or (at start-up) left behind by an earlier process with our id
+RECLAIM_SQL = """
+UPDATE suite_run SET status = 'FAILED', finished_at = NOW()
+WHERE status IN ('QUEUED', 'RUNNING')
+  AND (lease_until IS NULL OR lease_until < NOW() OR ($1::text IS NOT NULL AND owner = $1))
+RETURNING runid
+"""
+
+
+class RunScheduler:
+    """Admission control shared by every run: global and per-project caps"""
+
+    def __init__(self, global_limit: int, project_limit: int):
+        self.global_limit = max(1, global_limit)
+        self.project_limit = max(1, project_limit)
+        self._global: Optional[asyncio.Semaphore] = None
+        self._projects: Dict[str, asyncio.Semaphore] = {}
+
+    @asynccontextmanager
+    async def slot(self, project_id: Optional[str]):
+        # Project first, so a case waiting on its project never holds a global slot
+        if self._global is None:
+            self._global = asyncio.Semaphore(self.global_limit)
+        project = self._projects.setdefault(project_id or "", asyncio.Semaphore(self.project_limit))
+        async with project:
+            async with self._global:
+                yield
+
+
+class RunProgress:
+    """Event fan-out of a live run; status events are kept for late subscribers"""
+
+    def __init__(self, run_id: str, max_pending: int = config.LOG_FRAME_MAX_PENDING):
+        self.run_id = run_id
+        self.max_pending = max(1, max_pending)
+        self.history: List[Dict[str, Any]] = []
+        # queue -> log lines dropped since the subscriber last had room
+        self.subscribers: Dict[asyncio.Queue, int] = {}
+
+    def publish(self, event: Dict[str, Any]):
+        event = {"run_id": self.run_id, **event}
+        is_line = event.get("status") == "RUNNING"
+        # Log lines are live-only; replaying them would keep every run's output in memory
+        if not is_line:
+            self.history.append(event)
+        for queue, dropped in self.subscribers.items():
+            if is_line and queue.qsize() >= self.max_pending:
+                self.subscribers[queue] = dropped + 1
+                continue
+            if dropped:
+                queue.put_nowait({
+                    "run_id": self.run_id, "status": "RUNNING", "testcase_id": None,
+                    "log": f"[{dropped} log lines dropped: connection too slow]"
+                })
+                self.subscribers[queue] = 0
+            queue.put_nowait(event)
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue()
+        for event in self.history:
+            queue.put_nowait(event)
+        self.subscribers[queue] = 0
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.pop(queue, None)
+
+    def close(self):
+        for queue in self.subscribers:
+            queue.put_nowait(None)
+
+
+scheduler = RunScheduler(config.RUNS_MAX_CONCURRENCY, config.RUNS_PROJECT_CONCURRENCY)
+ACTIVE_RUNS: Dict[str, RunProgress] = {}
+_run_tasks: Set[asyncio.Task] = set()
+
+
+async def reconcile_interrupted_runs(at_startup: bool = False):
+    """
+    Runs execute inside the API instance that started them, so a QUEUED or
+    RUNNING run whose lease ran out was cut off by a crash or restart. Mark it
+    FAILED and its unfinished cases SKIPPED, instead of leaving it running
+    forever. Live runs of other instances keep their leases and are left
+    alone; at start-up this instance's own leftovers go at once.
+    """
+    conn = await db.get_db_connection()
+    try:
+        async with conn.transaction():
+            rows = await conn.fetch(RECLAIM_SQL, INSTANCE_ID if at_startup else None)
+            run_ids = [row["runid"] for row in rows]
+            if run_ids:
+                await conn.execute(
+                    """
+                    UPDATE suite_run_case SET status = 'SKIPPED', message = 'Interrupted: the server running it stopped'
+                    WHERE runid = ANY($1::text[]) AND status IN ('PENDING', 'RUNNING')
+                    """,
+                    run_ids
+                )
+    finally:
+        await db.release_db_connection(conn)
+    if run_ids:
+        utils.logger.warning(f"[SUITE-RUN] Marked {len(run_ids)} interrupted runs as FAILED")
+
+
+async def run_lease_keeper():
+    """Background task of the API: renew the leases of live runs, reclaim expired ones"""
+    while True:
+        await asyncio.sleep(config.RUNS_LEASE_SECONDS / 3)
+        try:
+            if ACTIVE_RUNS:
+                conn = await db.get_db_connection()
+                try:
+                    await conn.execute(RENEW_SQL, list(ACTIVE_RUNS), INSTANCE_ID, float(config.RUNS_LEASE_SECONDS))
+                finally:
+                    await db.release_db_connection(conn)
+            await reconcile_interrupted_runs()
+        except Exception as e:
+            # Keep going; if the database stays away our leases expire like a crash
+            utils.logger.warning(f"[SUITE-RUN] Lease renewal failed: {str(e)}")
+
+
+async def _user_projects(conn, userid: str) -> Set[str]:
+    rows = await conn.fetch("SELECT projectid FROM projectuser WHERE userid = $1", userid)
+    return {project_id for row in rows for project_id in (row["projectid"] or [])}
+
+
+async def select_cases(
+    conn,
+    request: models.RunRequest,
+    user_projects: Set[str]
+) -> Dict[str, Tuple[Optional[str], str]]:
+    """testcase_id -> (pretestid, project the case is scheduled under)"""
+    cases: Dict[str, Tuple[Optional[str], str]] = {}
+
+    if request.tag:
+        if not request.project_id:
+            raise HTTPException(status_code=400, detail="project_id is required with tag")
+        if request.project_id not in user_projects:
+            raise HTTPException(status_code=403, detail="You are not assigned to this project")
+        rows = await conn.fetch(
+            "SELECT testcaseid, pretestid FROM testcase WHERE $1 = ANY(projectid) AND $2 = ANY(tag)",
+            request.project_id, request.tag
+        )
+        for row in rows:
+            cases[row["testcaseid"]] = ((row["pretestid"] or "").strip() or None, request.project_id)
+
+    if request.testcase_ids:
+        rows = await conn.fetch(
+            "SELECT testcaseid, pretestid, projectid FROM testcase WHERE testcaseid = ANY($1::text[])",
+            request.testcase_ids
+        )
+        found = {row["testcaseid"]: row for row in rows}
+        for testcase_id in request.testcase_ids:
+            row = found.get(testcase_id)
+            if not row:
+                raise HTTPException(status_code=404, detail=f"Test case {testcase_id} not found")
+            shared = set(row["projectid"] or []) & user_projects
+            if not shared:
+                raise HTTPException(status_code=403, detail=f"No access to test case {testcase_id}")
+            project_id = request.project_id if request.project_id in shared else sorted(shared)[0]
+            cases[testcase_id] = ((row["pretestid"] or "").strip() or None, project_id)
+
+    return cases
+
+
+async def _save_case(run_id: str, testcase_id: str, status: str, message: str):
+    conn = await db.get_db_connection()
+    try:
+        await conn.execute(
+            "UPDATE suite_run_case SET status = $3, message = $4 WHERE runid = $1 AND testcaseid = $2",
+            run_id, testcase_id, status, message
+        )
+    finally:
+        await db.release_db_connection(conn)
+
+
+async def _finish_run(run_id: str, status: str, summary: Optional[Dict[str, Any]]):
+    results = (summary or {}).get("results", [])
+    conn = await db.get_db_connection()
+    try:
+        if results:
+            await conn.executemany(
+                """
+                UPDATE suite_run_case SET status = $3, message = $4, exeid = $5, duration_ms = $6
+                WHERE runid = $1 AND testcaseid = $2
+                """,
+                [(run_id, r["testcase_id"], r["status"], r["message"], r["exeid"], r["duration_ms"]) for r in results]
+            )
+        await conn.execute(
+            """
+            UPDATE suite_run
+            SET status = $2, passed = $3, failed = $4, skipped = $5, summary = $6::jsonb, finished_at = NOW()
+            WHERE runid = $1
+            """,
+            run_id, status,
+            (summary or {}).get("passed", 0), (summary or {}).get("failed", 0), (summary or {}).get("skipped", 0),
+            json.dumps(summary) if summary else None
+        )
+    finally:
+        await db.release_db_connection(conn)
+
+
+async def execute_run(
+    run_id: str,
+    script_type: str,
+    cases: Dict[str, Tuple[Optional[str], str]],
+    progress: RunProgress
+):
+    """Background body of a run: plan, execute under the shared caps, aggregate"""
+    parents = {tc_id: parent for tc_id, (parent, _) in cases.items()}
+    projects = {tc_id: project_id for tc_id, (_, project_id) in cases.items()}
+
+    async def on_event(event: Dict[str, Any]):
+        progress.publish(event)
+        if event["status"] == "CASE_STARTED":
+            await _save_case(run_id, event["testcase_id"], "RUNNING", "")
+        elif event["status"] in FINAL_CASE_EVENTS:
+            await _save_case(run_id, event["testcase_id"], event.get("final_status", "SKIPPED"), event.get("log", ""))
+
+    async def stream_line(testcase_id: str, line: str):
+        progress.publish({"status": "RUNNING", "testcase_id": testcase_id, "log": line})
+
+    try:
+        conn = await db.get_db_connection()
+        try:
+            await conn.execute("UPDATE suite_run SET status = 'RUNNING', started_at = NOW() WHERE runid = $1", run_id)
+        finally:
+            await db.release_db_connection(conn)
+
+        with tempfile.TemporaryDirectory(prefix="suite_run_state_") as state_dir:
+            planner = RunPlanner(
+                parents=parents,
+                run_case=make_case_runner(script_type, state_dir, stream_line),
+                max_workers=len(parents),  # the shared scheduler is the real limit
+                on_event=on_event,
+                case_slot=lambda tc_id: scheduler.slot(projects[tc_id])
+            )
+            summary = await planner.run()
+
+        await _finish_run(run_id, "COMPLETED", summary)
+        progress.publish({
+            "status": "COMPLETED",
+            "summary": summary,
+            "log": f"{summary['passed']}/{summary['total']} test cases passed"
+        })
+    except Exception as e:
+        utils.logger.error(f"[SUITE-RUN] Run {run_id} failed: {str(e)}")
+        try:
+            await _finish_run(run_id, "FAILED", None)
+        except Exception:
+            pass
+        progress.publish({"status": "FAILED", "error": str(e)})
+    finally:
+        progress.close()
+        ACTIVE_RUNS.pop(run_id, None)
+
+
+@router.post("/runs")
+async def start_run(
+    request: models.RunRequest,
+    current_user: dict = Depends(get_current_any_user)
+):
+    """
+    Start a suite run and return its id; progress streams on /runs/{run_id}/ws
+    and the aggregated record is at GET /runs/{run_id}.
+    """
+    script_type = request.script_type.lower()
+    if script_type not in ["playwright", "selenium"]:
+        raise HTTPException(status_code=400, detail="Script type must be 'playwright' or 'selenium'")
+    if not request.testcase_ids and not request.tag:
+        raise HTTPException(status_code=400, detail="Provide testcase_ids or a tag")
+
+    run_id = f"RUN-{uuid.uuid4().hex[:12].upper()}"
+    conn = None
+    try:
+        conn = await db.get_db_connection()
+        cases = await select_cases(conn, request, await _user_projects(conn, current_user["userid"]))
+        if not cases:
+            raise HTTPException(status_code=404, detail="No test cases match this selection")
+
+        selector = {"testcase_ids": request.testcase_ids, "project_id": request.project_id, "tag": request.tag}
+        async with conn.transaction():
+            await conn.execute(
+                """
+                INSERT INTO suite_run (runid, userid, scripttype, selector, status, total, owner, lease_until)
+                VALUES ($1, $2, $3, $4::jsonb, 'QUEUED', $5, $6, NOW() + make_interval(secs => $7))
+                """,
+                run_id, current_user["userid"], script_type, json.dumps(selector), len(cases),
+                INSTANCE_ID, float(config.RUNS_LEASE_SECONDS)
+            )
+            await conn.executemany(
+                "INSERT INTO suite_run_case (runid, testcaseid, projectid, status) VALUES ($1, $2, $3, 'PENDING')",
+                [(run_id, tc_id, project_id) for tc_id, (_, project_id) in cases.items()]
+            )
+    finally:
+        if conn:
+            await db.release_db_connection(conn)
+
+    progress = RunProgress(run_id)
+    ACTIVE_RUNS[run_id] = progress
+    order, blocked = topological_order({tc_id: parent for tc_id, (parent, _) in cases.items()})
+    progress.publish({"status": "PLAN_READY", "order": order, "blocked": blocked, "log": f"Planned {len(cases)} test cases"})
+
+    task = asyncio.create_task(execute_run(run_id, script_type, cases, progress))
+    _run_tasks.add(task)
+    task.add_done_callback(_run_tasks.discard)
+
+    return {
+        "run_id": run_id,
+        "status": "QUEUED",
+        "total": len(cases),
+        "order": order,
+        "websocket": f"/runs/{run_id}/ws"
+    }
+
+
+async def _load_run(conn, run_id: str, userid: str):
+    """(run record, None), or (None, (http status, reason)) when missing or not visible to the user"""
+    run = await conn.fetchrow("SELECT * FROM suite_run WHERE runid = $1", run_id)
+    if not run:
+        return None, (404, "Run not found")
+    allowed = run["userid"] == userid or await conn.fetchval(
+        "SELECT 1 FROM suite_run_case WHERE runid = $1 AND projectid = ANY($2::text[]) LIMIT 1",
+        run_id, list(await _user_projects(conn, userid))
+    )
+    if not allowed:
+        return None, (403, "No access to this run")
+    return run, None
+
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str, current_user: dict = Depends(get_current_any_user)):
+    """Aggregated run record with the status of every test case"""
+    conn = None
+    try:
+        conn = await db.get_db_connection()
+        run, error = await _load_run(conn, run_id, current_user["userid"])
+        if error:
+            raise HTTPException(status_code=error[0], detail=error[1])
+        cases = await conn.fetch(
+            "SELECT testcaseid, projectid, status, message, exeid, duration_ms FROM suite_run_case WHERE runid = $1 ORDER BY testcaseid",
+            run_id
+        )
+        record = dict(run)
+        record["selector"] = json.loads(record["selector"]) if record["selector"] else None
+        record["summary"] = json.loads(record["summary"]) if record["summary"] else None
+        record["cases"] = [dict(case) for case in cases]
+        return record
+    finally:
+        if conn:
+            await db.release_db_connection(conn)
+
+
+@router.websocket("/runs/{run_id}/ws")
+async def run_progress_ws(websocket: WebSocket, run_id: str):
+    """
+    WebSocket endpoint: progress of every test case of a run on one socket
+    (PLAN_READY, CASE_STARTED, RUNNING log lines tagged with testcase_id,
+    CASE_COMPLETED/CASE_SKIPPED, then COMPLETED with the run summary).
+    """
+    await websocket.accept()
+    frames = LogFrames.for_websocket(websocket)
+    try:
+        current_user = await utils.get_websocket_user(websocket)
+        if not current_user:
+            await frames.send({"status": "FAILED", "error": "Invalid or missing token"})
+            return
+
+        conn = await db.get_db_connection()
+        try:
+            run, error = await _load_run(conn, run_id, current_user["userid"])
+        finally:
+            await db.release_db_connection(conn)
+        if error:
+            await frames.send({"status": "FAILED", "error": error[1]})
+            return
+
+        progress = ACTIVE_RUNS.get(run_id)
+        if not progress:
+            # Finished (or interrupted by a restart): send the stored outcome
+            await frames.send({
+                "run_id": run_id,
+                "status": run["status"],
+                "summary": json.loads(run["summary"]) if run["summary"] else None
+            })
+            return
+
+        queue = progress.subscribe()
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                if event["status"] == "RUNNING":
+                    fields = {k: v for k, v in event.items() if k not in ("status", "log")}
+                    await frames.line(event["log"], **fields)
+                else:
+                    await frames.send(event)
+        finally:
+            progress.unsubscribe(queue)
+
+    except WebSocketDisconnect:
+        utils.logger.debug(f"[SUITE-RUN] Progress client of {run_id} disconnected")
+    except Exception as e:
+        utils.logger.error(f"[SUITE-RUN] Progress websocket error: {str(e)}")
+    finally:
+        try:
+            await websocket.close()
+        except Exception:
+            pass
@@ -11,6 +11,7 @@ import models
 import utils
 import database as db
 from routers.users import get_current_any_user
+from routers import rule_normalizer
 
 from azure_openai_client import call_openai_api
 
@@ -488,14 +489,19 @@ async def normalize_uploaded(
         if not original_steps:
             raise HTTPException(status_code=400, detail="original_steps missing or empty")
 
+        # Rule-based fast path; only the steps it cannot handle go to the AI
+        rule_results = rule_normalizer.apply_rules(original_steps)
+
         # Prepare minimal view of steps for the AI
         steps_for_ai = [
             {
+                "Ref": str(i),
                 "Index": s.get("Index", i + 1),
                 "Step": s.get("Step", ""),
                 "TestDataText": s.get("TestDataText", "")
             }
             for i, s in enumerate(original_steps)
+            if rule_results[i] is None
         ]
 
         prompt = f"""
@@ -513,11 +519,13 @@ For EACH step:
    - If there is a URL, use: {{ "url": "https://..." }}
    - If only one value is present and no obvious key, use: {{ "value": "<that value>" }}
 4. If no test data is present, use an empty object: {{}}.
+5. Copy each step's "Ref" unchanged into every output step derived from it.
 
 RETURN ONLY a JSON ARRAY like this (no extra text):
 
 [
   {{
+    "Ref": "0",
     "Index": 1,
     "Step": "Given the user opens the login page",
     "TestDataText": "https://example.com/login",
@@ -528,28 +536,31 @@ RETURN ONLY a JSON ARRAY like this (no extra text):
   ...
 ]
 
-Here are the original steps (Index, Step, TestDataText):
+Here are the original steps (Ref, Index, Step, TestDataText):
 
 {json.dumps(steps_for_ai, indent=2)}
 """
 
-        text = call_openai_api(
-            prompt=prompt,
-            max_tokens=2000,
-            system_message="You are a QA automation expert. Return only valid JSON arrays."
-        )
+        raw_array = []
+        if steps_for_ai:
+            text = await call_openai_api(
+                prompt=prompt,
+                max_tokens=2000,
+                system_message="You are a QA automation expert. Return only valid JSON arrays.",
+                cache="normalize"
+            )
 
-        # Extract JSON array from response
-        start = text.find("[")
-        end = text.rfind("]") + 1
-        if start == -1 or end <= start:
-            raise HTTPException(status_code=500, detail="AI did not return a JSON array")
+            # Extract JSON array from response
+            start = text.find("[")
+            end = text.rfind("]") + 1
+            if start == -1 or end <= start:
+                raise HTTPException(status_code=500, detail="AI did not return a JSON array")
 
-        raw_array = json.loads(text[start:end])
+            raw_array = json.loads(text[start:end])
 
-        # Coerce AI output into strict schema
-        normalized_steps = []
-        for i, s in enumerate(raw_array):
+        # Coerce AI output into strict schema, grouped by source step
+        escalated: Dict[int, List[Dict[str, Any]]] = {}
+        for s in raw_array:
             step = s.get("Step", "") or ""
             tdt = s.get("TestDataText", "") or ""
             raw_td = s.get("TestData", {})
@@ -563,13 +574,19 @@ Here are the original steps (Index, Step, TestDataText):
                 # Gemini returned a string or something else → wrap it
                 testdata = {"value": str(raw_td)}
 
-            normalized_steps.append({
-                "Index": s.get("Index", i + 1),
+            ref = str(s.get("Ref", ""))
+            if not ref.isdigit():
+                if len(steps_for_ai) != 1:
+                    raise HTTPException(status_code=500, detail="AI did not return step references")
+                ref = steps_for_ai[0]["Ref"]
+            escalated.setdefault(int(ref), []).append({
                 "Step": step,
                 "TestDataText": tdt,
                 "TestData": testdata
             })
 
+        normalized_steps = rule_normalizer.merge_results(rule_results, escalated)
+
         # Also normalize original_steps into full objects for the response
         original_for_response = []
         for idx, s in enumerate(original_steps):
@@ -771,10 +788,11 @@ Return ONLY valid JSON array with: Index, Step, TestDataText, TestData.
 
 Steps: {json.dumps(normalized_steps, indent=2)}"""
 
-        text = call_openai_api(
+        text = await call_openai_api(
             prompt=prompt,
             max_tokens=2000,
-            system_message="You are a QA automation expert. Return only valid JSON arrays."
+            system_message="You are a QA automation expert. Return only valid JSON arrays.",
+            cache="normalize"
         )
 
         # Extract JSON array from response
@@ -0,0 +1,290 @@
+"""
+Warm Script Worker
+Long-lived child process of worker_pool. Imports Playwright/Selenium and
+launches a Chromium browser once, then runs scripts sent over stdin one at a
+time, each in its own browser context, streaming output back as JSON frames.
+
+Protocol (one JSON object per line):
+  parent -> worker: {"id": ..., "script": ..., "env": {...}, "cwd": <workdir or null>}
+  worker -> parent: {"ready": true, "browser": bool} once after start-up,
+                    {"id": ..., "stream": "stdout"|"stderr", "line": ...}
+                    {"id": ..., "exit": <code>, "recycle": bool} per script
+
+Scripts run as __main__ with `browser` (the warm browser) and, for scripts
+that do not start Playwright themselves, `page` (a fresh page in a fresh
+context) injected. Each script may use CPU_LIMIT_ENV seconds of CPU time
+(SIGXCPU ends the worker, which the pool replaces). sync_playwright() is patched so generated scripts that
+launch Chromium get the warm browser instead. Closing it only closes the
+contexts the script opened.
+
+Imports nothing from the app; run as `python warm_worker.py`.
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+import traceback
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+HEADLESS_ENV = "WARM_WORKER_HEADLESS"
+CPU_LIMIT_ENV = "WARM_WORKER_CPU_LIMIT"
+
+# Frames go to a private copy of the original stdout; anything writing to
+# fd 1 directly (child processes of a script) ends up on stderr instead
+_proto = os.fdopen(os.dup(1), "w", encoding="utf-8", buffering=1)
+os.dup2(2, 1)
+_proto_lock = threading.Lock()
+
+
+def send(frame: dict):
+    with _proto_lock:
+        _proto.write(json.dumps(frame) + "\n")
+        _proto.flush()
+
+
+class LineWriter:
+    """sys.stdout/sys.stderr replacement that sends complete lines as frames"""
+
+    def __init__(self, job_id, stream: str):
+        self.job_id = job_id
+        self.stream = stream
+        self.buffer = ""
+        self.lock = threading.Lock()
+
+    def write(self, text) -> int:
+        with self.lock:
+            self.buffer += str(text)
+            *lines, self.buffer = self.buffer.split("\n")
+        for line in lines:
+            send({"id": self.job_id, "stream": self.stream, "line": line.rstrip("\r")})
+        return len(text)
+
+    def flush(self):
+        with self.lock:
+            line, self.buffer = self.buffer, ""
+        if line:
+            send({"id": self.job_id, "stream": self.stream, "line": line})
+
+    def isatty(self) -> bool:
+        return False
+
+    @property
+    def encoding(self) -> str:
+        return "utf-8"
+
+
+# ==========================================================
+# Warm browser (Playwright sync API)
+# ==========================================================
+class WarmBrowser:
+    """Browser handle for one script: tracks its contexts, close() only closes those"""
+
+    def __init__(self, browser, job):
+        self._browser = browser
+        self._job = job
+
+    def new_context(self, **kwargs):
+        context = self._browser.new_context(**kwargs)
+        self._job.contexts.append(context)
+        return context
+
+    def new_page(self, **kwargs):
+        return self.new_context(**kwargs).new_page()
+
+    def close(self, **kwargs):
+        self._job.close_contexts()
+
+    def __getattr__(self, name):
+        return getattr(self._browser, name)
+
+
+class WarmBrowserType:
+    def __init__(self, browser_type, job, headless: bool):
+        self._browser_type = browser_type
+        self._job = job
+        self._headless = headless
+
+    def launch(self, **kwargs):
+        # Only a launch the warm browser is equivalent to may reuse it
+        if self._job.worker.browser and set(kwargs) <= {"headless"} and kwargs.get("headless", True) == self._headless:
+            return WarmBrowser(self._job.worker.browser, self._job)
+        browser = self._browser_type.launch(**kwargs)
+        self._job.browsers.append(browser)
+        return browser
+
+    def __getattr__(self, name):
+        return getattr(self._browser_type, name)
+
+
+class WarmPlaywright:
+    """Stands in for sync_playwright() and its started Playwright object"""
+
+    def __init__(self, playwright, job, headless: bool):
+        self._playwright = playwright
+        self.chromium = WarmBrowserType(playwright.chromium, job, headless)
+
+    def start(self):
+        return self
+
+    def stop(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def __getattr__(self, name):
+        return getattr(self._playwright, name)
+
+
+# ==========================================================
+# Worker
+# ==========================================================
+class Job:
+    def __init__(self, worker, job_id):
+        self.worker = worker
+        self.id = job_id
+        self.contexts = []
+        self.browsers = []
+
+    def close_contexts(self):
+        contexts, self.contexts = self.contexts, []
+        for context in contexts:
+            try:
+                context.close()
+            except Exception:
+                pass
+
+    def cleanup(self):
+        self.close_contexts()
+        for browser in self.browsers:
+            try:
+                browser.close()
+            except Exception:
+                pass
+
+
+class Worker:
+    def __init__(self):
+        self.headless = os.environ.get(HEADLESS_ENV, "true").lower() == "true"
+        self.playwright = None
+        self.browser = None
+        self.sync_api = None
+        self._real_sync_playwright = None
+        self.base_threads = 1
+
+    def warm_up(self):
+        try:
+            importlib.import_module("selenium.webdriver")  # import cost paid once
+        except Exception:
+            pass
+        try:
+            from playwright import sync_api
+            self.sync_api = sync_api
+            self._real_sync_playwright = sync_api.sync_playwright
+            self.playwright = self._real_sync_playwright().start()
+            self.browser = self.playwright.chromium.launch(headless=self.headless)
+        except Exception as e:
+            print(f"[WARM-WORKER] No warm browser: {e}", file=sys.stderr)
+            self.browser = None
+        self.base_threads = threading.active_count()
+
+    def run(self, request: dict) -> dict:
+        job = Job(self, request.get("id"))
+        _limit_cpu(int(os.environ.get(CPU_LIMIT_ENV, "0")))
+        script = request.get("script", "")
+        saved_env, saved_cwd = dict(os.environ), os.getcwd()
+        saved_streams = (sys.stdout, sys.stderr)
+        sys.stdout, sys.stderr = LineWriter(job.id, "stdout"), LineWriter(job.id, "stderr")
+        os.environ.update(request.get("env") or {})
+
+        namespace = {"__name__": "__main__", "__file__": "<generated script>", "__builtins__": __builtins__}
+        if self.playwright:
+            warm = WarmPlaywright(self.playwright, job, self.headless)
+            self.sync_api.sync_playwright = lambda: warm
+
+        exit_code = 0
+        try:
+            if request.get("cwd"):
+                os.chdir(request["cwd"])
+            if self.browser:
+                namespace["browser"] = WarmBrowser(self.browser, job)
+                if "sync_playwright" not in script:
+                    namespace["page"] = namespace["browser"].new_page()
+            exec(compile(script, "<generated script>", "exec"), namespace)
+        except SystemExit as e:
+            if e.code is None:
+                exit_code = 0
+            elif isinstance(e.code, int):
+                exit_code = e.code
+            else:
+                print(e.code, file=sys.stderr)
+                exit_code = 1
+        except BaseException:
+            traceback.print_exc()
+            exit_code = 1
+        finally:
+            _limit_cpu(0)
+            job.cleanup()
+            if self.playwright:
+                self.sync_api.sync_playwright = self._real_sync_playwright
+            sys.stdout.flush()
+            sys.stderr.flush()
+            sys.stdout, sys.stderr = saved_streams
+            os.environ.clear()
+            os.environ.update(saved_env)
+            try:
+                os.chdir(saved_cwd)
+            except OSError:
+                pass
+
+        # A script that took the browser down (or left threads behind) gets a fresh worker
+        recycle = bool(self.browser) and not self.browser.is_connected()
+        recycle = recycle or threading.active_count() > self.base_threads
+        return {"id": job.id, "exit": exit_code, "recycle": recycle}
+
+
+def _limit_cpu(seconds: int):
+    """
+    RLIMIT_CPU counts the worker's whole lifetime: allow `seconds` more from
+    now (0 lifts the soft limit again)
+    """
+    if resource is None:
+        return
+    hard = resource.getrlimit(resource.RLIMIT_CPU)[1]
+    soft = hard
+    if seconds > 0:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        soft = int(usage.ru_utime + usage.ru_stime) + 1 + seconds
+        if hard != resource.RLIM_INFINITY:
+            soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+
+
+def main():
+    worker = Worker()
+    worker.warm_up()
+    send({"ready": True, "browser": worker.browser is not None})
+    for raw in sys.stdin:
+        if not raw.strip():
+            continue
+        send(worker.run(json.loads(raw)))
+    if worker.playwright:
+        try:
+            if worker.browser:
+                worker.browser.close()
+            worker.playwright.stop()
+        except Exception:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,197 @@
+"""
+Warm Worker Pool
+Keeps WORKER_POOL_SIZE warm_worker processes running, each with Playwright
+imported and Chromium already launched, and hands them scripts over their
+stdin pipe. A run then costs a browser context instead of an interpreter
+start, the imports and a browser launch. Workers run in sessions of their own
+under the script memory limit; the CPU limit is applied per script by the
+worker itself, since its own CPU time adds up over all its scripts.
+script_runner.run_script uses the pool when it is started and a worker is
+idle; otherwise (pool busy or disabled, async Playwright scripts) the script
+runs in a fresh process as before.
+"""
+
+import asyncio
+import itertools
+import json
+import os
+import sys
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import config
+import utils
+from routers.script_runner import kill_process_tree, limited_args
+
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "warm_worker.py")
+WORKER_START_TIMEOUT = 60
+FRAME_LINE_LIMIT = 4 * 1024 * 1024
+
+
+@dataclass
+class PoolRunResult:
+    return_code: int
+    stdout: List[str]
+    stderr: List[str]
+    output: List[str]
+
+
+def _log_spawn_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        utils.logger.warning(f"[WORKER-POOL] Replacement worker failed: {str(task.exception())}")
+
+
+class WarmWorker:
+    """One warm_worker child process"""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.jobs = 0
+        self.has_browser = False
+        self._stderr_task = asyncio.create_task(self._drain_stderr())
+
+    async def _drain_stderr(self):
+        # Worker noise (Playwright driver output, fd-level prints of child processes)
+        while True:
+            raw = await self.process.stderr.readline()
+            if not raw:
+                break
+            utils.logger.debug(f"[WORKER {self.process.pid}] {raw.decode('utf-8', errors='replace').rstrip()}")
+
+    async def read_frame(self) -> Optional[dict]:
+        raw = await self.process.stdout.readline()
+        if not raw:
+            return None
+        return json.loads(raw)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def kill(self):
+        if self.alive:
+            # Scripts launch their own browsers too; take them down with the worker
+            kill_process_tree(self.process.pid)
+            await self.process.wait()
+        self._stderr_task.cancel()
+
+
+class WorkerPool:
+    def __init__(self):
+        self.size = 0
+        self.max_jobs = 0
+        self.is_ready = False
+        self._idle: "asyncio.Queue[WarmWorker]" = None
+        self._workers: List[WarmWorker] = []
+        self._job_ids = itertools.count(1)
+
+    async def start(self, size: int, max_jobs: int):
+        self.size, self.max_jobs = size, max_jobs
+        self._idle = asyncio.Queue()
+        results = await asyncio.gather(*(self._spawn() for _ in range(size)), return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                utils.logger.warning(f"[WORKER-POOL] Worker failed to start: {str(result)}")
+        self.is_ready = bool(self._workers)
+        utils.logger.info(f"[WORKER-POOL] {len(self._workers)}/{size} warm workers ready")
+
+    async def stop(self):
+        self.is_ready = False
+        workers, self._workers = self._workers, []
+        await asyncio.gather(*(w.kill() for w in workers), return_exceptions=True)
+
+    async def _spawn(self):
+        process = await asyncio.create_subprocess_exec(
+            *limited_args([sys.executable, WORKER_SCRIPT], cpu_seconds=0),
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env={
+                **os.environ,
+                "WARM_WORKER_HEADLESS": str(config.WORKER_HEADLESS).lower(),
+                "WARM_WORKER_CPU_LIMIT": str(config.EXECUTION_CPU_LIMIT_SECONDS),
+            },
+            limit=FRAME_LINE_LIMIT,
+            # Own process group: kill_process_tree takes the browsers along
+            start_new_session=os.name == "posix"
+        )
+        worker = WarmWorker(process)
+        try:
+            ready = await asyncio.wait_for(worker.read_frame(), timeout=WORKER_START_TIMEOUT)
+            if not ready or not ready.get("ready"):
+                raise RuntimeError("worker exited during warm-up")
+        except BaseException:
+            await worker.kill()
+            raise
+        worker.has_browser = ready.get("browser", False)
+        self._workers.append(worker)
+        self._idle.put_nowait(worker)
+
+    def _replace(self, worker: WarmWorker):
+        """Retire a worker and start a fresh one in the background"""
+        if worker in self._workers:
+            self._workers.remove(worker)
+        asyncio.create_task(worker.kill())
+        if self.is_ready:
+            asyncio.create_task(self._spawn()).add_done_callback(_log_spawn_failure)
+
+    def accepts(self, script_content: str) -> bool:
+        # The warm browser lives on the sync API; asyncio.run() cannot share its thread
+        return self.is_ready and "async_playwright" not in script_content
+
+    def try_acquire(self) -> Optional[WarmWorker]:
+        while self.is_ready and not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker.alive:
+                return worker
+            self._replace(worker)
+        return None
+
+    async def run(
+        self,
+        worker: WarmWorker,
+        script_content: str,
+        on_line: Optional[Callable[[str], Awaitable[None]]] = None,
+        env: Optional[Dict[str, str]] = None,
+        cwd: Optional[str] = None
+    ) -> PoolRunResult:
+        """Run one script on an acquired worker; the worker goes back to the pool or is replaced"""
+        job_id = next(self._job_ids)
+        result = PoolRunResult(return_code=1, stdout=[], stderr=[], output=[])
+        healthy = False
+        try:
+            worker.process.stdin.write(
+                (json.dumps({"id": job_id, "script": script_content, "env": env or {}, "cwd": cwd}) + "\n").encode("utf-8")
+            )
+            await worker.process.stdin.drain()
+            worker.jobs += 1
+
+            while True:
+                frame = await worker.read_frame()
+                if frame is None:
+                    # Script killed its interpreter (os._exit, crash)
+                    result.return_code = await worker.process.wait()
+                    break
+                if frame.get("id") != job_id:
+                    continue
+                if "exit" in frame:
+                    result.return_code = frame["exit"]
+                    healthy = not frame.get("recycle")
+                    break
+                line = frame.get("line", "")
+                if not line.strip():
+                    continue
+                result.output.append(line)
+                (result.stderr if frame.get("stream") == "stderr" else result.stdout).append(line)
+                if on_line:
+                    await on_line(line)
+        finally:
+            if healthy and worker.alive and worker.jobs < self.max_jobs:
+                self._idle.put_nowait(worker)
+            else:
+                # Also reached when cancelled mid-run: the script may still be driving the browser
+                self._replace(worker)
+        return result
+
+
+worker_pool = WorkerPool()
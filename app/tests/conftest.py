@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The app uses flat imports (import config, from routers import ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,20 @@
+from routers.keyword_executor import KeywordPlan, build_runner_script, runner_steps
+from routers.step_assembler import PlanStep
+
+
+def test_runner_steps_round_trip_and_rejects_edited_scripts():
+    plan = KeywordPlan(
+        steps=[
+            PlanStep("TC1", "Given I navigate to the login page", "https://example.com", "k1", source="action"),
+            PlanStep("TC1", "When I wiggle the mouse", "", "k2", code="await page.mouse.move(1, 1)", source="llm"),
+        ],
+        mapped=1,
+        generated=1,
+    )
+    script = build_runner_script(plan)
+    assert runner_steps(script) == [
+        {"step": "Given I navigate to the login page", "arg": "https://example.com"},
+        {"step": "When I wiggle the mouse", "arg": "", "code": "await page.mouse.move(1, 1)"},
+    ]
+    assert runner_steps(script.replace("sys.exit", "print")) is None
+    assert runner_steps("print('hello')") is None
@@ -0,0 +1,46 @@
+import asyncio
+import json
+
+import pytest
+
+from routers.log_frames import LogFrames
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.frames = []
+        self.query_params = {}
+
+    async def send_text(self, text):
+        self.frames.append(json.loads(text))
+
+
+def make_frames(max_lines=3, interval_ms=20):
+    websocket = FakeWebSocket()
+    frames = LogFrames(websocket)
+    frames.max_lines = max_lines
+    frames.max_pending = max(frames.max_pending, max_lines)
+    frames.interval = interval_ms / 1000
+    return websocket, frames
+
+
+@pytest.mark.asyncio
+async def test_lines_are_batched_up_to_max_lines():
+    websocket, frames = make_frames(max_lines=3)
+    for i in range(7):
+        await frames.line(f"line {i}")
+    await frames.send({"status": "COMPLETED"})
+
+    running = [frame for frame in websocket.frames if frame["status"] == "RUNNING"]
+    assert [frame["line_count"] for frame in running] == [3, 3, 1]
+    assert "\n".join(frame["log"] for frame in running) == "\n".join(f"line {i}" for i in range(7))
+    assert websocket.frames[-1] == {"status": "COMPLETED"}
+
+
+@pytest.mark.asyncio
+async def test_lines_with_different_fields_get_separate_frames():
+    websocket, frames = make_frames(max_lines=10)
+    await frames.line("a", testcase_id="TC1")
+    await frames.line("b", testcase_id="TC2")
+    await asyncio.sleep(0.05)
+    assert [(frame["testcase_id"], frame["log"]) for frame in websocket.frames] == [("TC1", "a"), ("TC2", "b")]
@@ -0,0 +1,38 @@
+import pytest
+
+from routers.rule_normalizer import _split_parts, apply_rules, merge_results
+
+
+@pytest.mark.parametrize("body, parts", [
+    ("enter username and password then click login", ["I enter username", "I enter password", "I click login"]),
+    ("I enter username and click login", ["I enter username", "I click login"]),
+    ('User enters "Tom and Jerry" and clicks Save', ['User enters "Tom and Jerry"', "User clicks Save"]),
+    ("click on the Help link", ["I click on the Help link"]),
+])
+def test_split_parts_splits_independent_actions(body, parts):
+    assert _split_parts(body) == parts
+
+
+@pytest.mark.parametrize("body", [
+    "Click on Terms and Conditions link",
+    "User clicks Save and Close",
+    "fill the form and submit",
+])
+def test_split_parts_leaves_labels_and_unclear_steps_to_the_llm(body):
+    assert _split_parts(body) is None
+
+
+def test_apply_rules_assigns_test_data_per_part():
+    [result] = apply_rules([{"Step": "enter username and password", "TestDataText": "username:alice, password:secret"}])
+    assert [step["Step"] for step in result] == ["When I enter username", "And I enter password"]
+    assert [step["TestData"] for step in result] == [{"username": "alice"}, {"password": "secret"}]
+
+
+def test_apply_rules_escalates_conditions():
+    assert apply_rules([{"Step": "click Save if the dialog is open"}]) == [None]
+
+
+def test_merge_results_renumbers_in_source_order():
+    rule_results = apply_rules([{"Step": "click login"}, {"Step": "click Save if shown"}])
+    merged = merge_results(rule_results, {1: [{"Index": 7, "Step": "Then the dialog closes"}]})
+    assert [(step["Index"], step["Step"]) for step in merged] == [(1, "When I click login"), (2, "Then the dialog closes")]
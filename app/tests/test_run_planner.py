@@ -0,0 +1,37 @@
+import pytest
+
+from routers.run_planner import CaseResult, RunPlanner, topological_order
+
+
+def test_topological_order_puts_prerequisites_first():
+    order, blocked = topological_order({"TC3": "TC2", "TC2": "TC1", "TC1": None, "TC4": None})
+    assert blocked == []
+    assert order.index("TC1") < order.index("TC2") < order.index("TC3")
+    assert set(order) == {"TC1", "TC2", "TC3", "TC4"}
+
+
+def test_topological_order_treats_unselected_prerequisite_as_root():
+    order, blocked = topological_order({"TC2": "TC1"})
+    assert order == ["TC2"]
+    assert blocked == []
+
+
+def test_topological_order_reports_cycles():
+    order, blocked = topological_order({"TC1": "TC2", "TC2": "TC1", "TC3": None})
+    assert order == ["TC3"]
+    assert sorted(blocked) == ["TC1", "TC2"]
+
+
+@pytest.mark.asyncio
+async def test_planner_skips_descendants_of_failed_prerequisite():
+    ran = []
+
+    async def run_case(tc_id, handoff, has_children):
+        ran.append(tc_id)
+        return CaseResult(tc_id, "FAILED" if tc_id == "TC1" else "SUCCESS", ""), None
+
+    summary = await RunPlanner({"TC1": None, "TC2": "TC1", "TC3": "TC2", "TC4": None}, run_case).run()
+    statuses = {r["testcase_id"]: r["status"] for r in summary["results"]}
+    assert sorted(ran) == ["TC1", "TC4"]
+    assert statuses == {"TC1": "FAILED", "TC2": "SKIPPED", "TC3": "SKIPPED", "TC4": "SUCCESS"}
+    assert (summary["passed"], summary["failed"], summary["skipped"]) == (1, 1, 2)
@@ -0,0 +1,65 @@
+import pytest
+from fastapi.responses import Response
+
+from routers import ai_healing
+from routers.script_preflight import preflight_script, preflight_snippet
+
+GOOD_SCRIPT = 'from datetime import datetime\nprint("Running action: open at %s" % datetime.now())\n'
+
+
+def test_preflight_passes_clean_script():
+    result = preflight_script(GOOD_SCRIPT)
+    assert result.ok, result.report()
+
+
+def test_preflight_strips_markdown_fences():
+    result = preflight_script("```python\n" + GOOD_SCRIPT + "```\n")
+    assert result.ok
+    assert "```" not in result.script
+    assert result.fixes == ["removed markdown code fences"]
+
+
+def test_preflight_reports_syntax_error_and_stops():
+    result = preflight_script("print('Running action'\n")
+    assert [issue.check for issue in result.issues] == ["syntax"]
+
+
+def test_preflight_reports_missing_module_forbidden_call_and_marker():
+    result = preflight_script("import not_a_real_module_xyz\ninput()\nself.page.pause()\n")
+    checks = [issue.check for issue in result.issues]
+    assert checks.count("forbidden_call") == 2
+    assert "import" in checks
+    assert "log_marker" in checks
+    assert "Pre-flight check failed" in result.report()
+
+
+def test_preflight_snippet_checks_calls_and_imports():
+    assert preflight_snippet("await page.click(arg)") == []
+    [issue] = preflight_snippet("import os\nos.system('ls')")
+    assert issue.check == "forbidden_call" and issue.line == 2
+    assert preflight_snippet("page.click(")[0].check == "syntax"
+
+
+@pytest.mark.asyncio
+async def test_ai_runner_does_not_launch_script_failing_preflight_after_healing(monkeypatch):
+    async def self_heal(**kwargs):
+        assert "Pre-flight check failed" in kwargs["execution_logs"]
+        return Response(content="print('still broken'\n", media_type="text/plain")
+
+    async def run_script_file(*args, **kwargs):
+        raise AssertionError("a script failing pre-flight must not be launched")
+
+    monkeypatch.setattr(ai_healing, "self_heal", self_heal)
+    monkeypatch.setattr(ai_healing, "run_script_file", run_script_file)
+    errors = []
+
+    async def on_line(line):
+        pass
+
+    async def on_stderr_line(line):
+        errors.append(line)
+
+    script, result, artifact_logs = await ai_healing._run_in_workdir("print('broken'\n", "{}", on_line, on_stderr_line)
+    assert script == "print('still broken'\n"
+    assert result.return_code == 1 and artifact_logs == []
+    assert sum("Pre-flight check failed" in line for line in errors) == 2
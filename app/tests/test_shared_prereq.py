@@ -0,0 +1,16 @@
+from routers.shared_prereq import build_prefix_tree
+
+
+def test_prefix_tree_merges_shared_prerequisites():
+    root = build_prefix_tree({
+        ("LOGIN",): ["TC1", "TC2"],
+        ("LOGIN", "CART"): ["TC3"],
+        ("SIGNUP",): ["TC4"],
+    })
+    assert set(root.children) == {"LOGIN", "SIGNUP"}
+    login = root.children["LOGIN"]
+    assert login.members == ["TC1", "TC2"]
+    assert login.children["CART"].prefix == ("LOGIN", "CART")
+    assert sorted(root.all_members()) == ["TC1", "TC2", "TC3", "TC4"]
+    # LOGIN runs once for both chains
+    assert root.count_prerequisites() == 3
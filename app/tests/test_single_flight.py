@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import azure_openai_client as aoc
+from azure_openai_client import SingleFlight, StreamFeed
+from llm_backends import LLMBackend
+
+LINES = [f"line{i}\n" for i in range(5)]
+
+
+class SlowStream(LLMBackend):
+    name = "slow-stream"
+
+    def __init__(self):
+        self.calls = 0
+
+    async def stream(self, model, messages, max_tokens, temperature=None):
+        self.calls += 1
+        for line in LINES:
+            await asyncio.sleep(0.01)
+            yield line
+
+
+@pytest.mark.asyncio
+async def test_single_flight_coalesces_identical_requests():
+    flight = SingleFlight()
+    calls = 0
+
+    async def request():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "done"
+
+    assert await asyncio.gather(flight.do("k", request), flight.do("k", request)) == ["done", "done"]
+    assert calls == 1
+    assert flight.metrics() == {"in_flight": 0, "started": 1, "coalesced": 1}
+
+
+@pytest.mark.asyncio
+async def test_stream_feed_replays_whole_lines_to_each_follower():
+    feed = StreamFeed()
+    first, second = [], []
+
+    async def produce():
+        for delta in ["a", "b\nc", "\n", "tail"]:
+            await feed.push(delta)
+            await asyncio.sleep(0)
+        await feed.close()
+
+    async def collect(into):
+        async def sink(chunk):
+            into.append(chunk)
+        await feed.follow(sink)
+
+    await asyncio.gather(produce(), collect(first), collect(second))
+    assert "".join(first) == "".join(second) == "ab\nc\ntail"
+    assert all(chunk.endswith("\n") for chunk in first[:-1])
+
+
+@pytest.mark.asyncio
+async def test_failing_leader_sink_does_not_break_followers(monkeypatch):
+    backend = SlowStream()
+    monkeypatch.setattr(aoc, "single_flight", SingleFlight())
+    monkeypatch.setattr(aoc.llm_ledger, "record_llm_call", lambda *a, **k: asyncio.sleep(0))
+    aoc.set_llm_backend(backend)
+    try:
+        follower_chunks = []
+
+        async def leader(chunk):
+            raise ConnectionError("client gone")
+
+        async def follower(chunk):
+            follower_chunks.append(chunk)
+
+        leader_result, follower_result = await asyncio.gather(
+            aoc.stream_openai_api("same prompt", leader),
+            aoc.stream_openai_api("same prompt", follower),
+            return_exceptions=True
+        )
+    finally:
+        aoc.set_llm_backend(None)
+
+    assert isinstance(leader_result, ConnectionError)
+    assert follower_result == "".join(LINES).strip()
+    assert "".join(follower_chunks) == "".join(LINES)
+    assert backend.calls == 1
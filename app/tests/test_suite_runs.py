@@ -0,0 +1,70 @@
+from contextlib import asynccontextmanager
+
+import pytest
+
+from routers import suite_runs
+from routers.suite_runs import RunProgress
+
+
+def drain(queue):
+    events = []
+    while not queue.empty():
+        events.append(queue.get_nowait())
+    return events
+
+
+def test_late_subscriber_gets_status_history_but_no_log_lines():
+    progress = RunProgress("RUN-1")
+    progress.publish({"status": "PLAN_READY"})
+    progress.publish({"status": "RUNNING", "testcase_id": "TC1", "log": "output"})
+    events = drain(progress.subscribe())
+    assert [event["status"] for event in events] == ["PLAN_READY"]
+    assert events[0]["run_id"] == "RUN-1"
+
+
+def test_slow_subscriber_loses_log_lines_not_status_events():
+    progress = RunProgress("RUN-1", max_pending=2)
+    queue = progress.subscribe()
+    for i in range(5):
+        progress.publish({"status": "RUNNING", "testcase_id": "TC1", "log": f"line {i}"})
+    progress.publish({"status": "CASE_COMPLETED", "testcase_id": "TC1"})
+
+    events = drain(queue)
+    assert [event.get("log") for event in events[:3]] == ["line 0", "line 1", "[3 log lines dropped: connection too slow]"]
+    assert events[-1]["status"] == "CASE_COMPLETED"
+
+
+class FakeConn:
+    def __init__(self, reclaimed):
+        self.reclaimed = reclaimed
+        self.calls = []
+
+    @asynccontextmanager
+    async def transaction(self):
+        yield
+
+    async def fetch(self, sql, *args):
+        self.calls.append(args)
+        return [{"runid": run_id} for run_id in self.reclaimed]
+
+    async def execute(self, sql, *args):
+        self.calls.append(args)
+
+
+@pytest.mark.asyncio
+async def test_reconcile_claims_own_runs_only_at_startup(monkeypatch):
+    conn = FakeConn(["RUN-1"])
+
+    async def get_db_connection():
+        return conn
+
+    async def release_db_connection(_):
+        pass
+
+    monkeypatch.setattr(suite_runs.db, "get_db_connection", get_db_connection)
+    monkeypatch.setattr(suite_runs.db, "release_db_connection", release_db_connection)
+
+    await suite_runs.reconcile_interrupted_runs(at_startup=True)
+    await suite_runs.reconcile_interrupted_runs()
+    # Start-up also takes this instance's leftovers; later sweeps only expired leases
+    assert conn.calls == [(suite_runs.INSTANCE_ID,), (["RUN-1"],), (None,), (["RUN-1"],)]
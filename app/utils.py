@@ -17,6 +17,7 @@ import traceback
 from selenium import webdriver
 from config import SECRET_KEY, ALGORITHM
 from database import get_db_connection
+import llm_ledger
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -205,4 +206,61 @@ async def get_prereq_chain(conn, testcase_id: str, visited: set = None):
     # Add current test case
     chain.append(testcase_id)
 
-    return chain
+    return chain
+
+# Serialises exeid allocation so concurrent runs in this process never collide
+_exeid_lock = asyncio.Lock()
+
+async def save_execution(
+    conn, testcase_id: str, script_type: str, message: str, output: str, status: str,
+    termination: Optional[str] = None, artifacts=()
+) -> str:
+    """Insert an execution row under a fresh exeid, link its artifacts and return that exeid."""
+    from routers.artifacts import link_artifacts
+
+    async with _exeid_lock:
+        exeid = await get_next_exeid(conn)
+        await conn.execute(
+            """
+            INSERT INTO execution (exeid, testcaseid, scripttype, datestamp, exetime, message, output, status, termination)
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+            """,
+            exeid, testcase_id, script_type, datetime.now().date(), datetime.now().time(),
+            message, output, status, termination
+        )
+    await link_artifacts(conn, exeid, artifacts)
+    await llm_ledger.save_llm_usage(conn, exeid, testcase_id)
+    return exeid
+
+async def get_websocket_user(websocket):
+    """Validate the Bearer token sent in the websocket handshake headers."""
+    token = None
+    if "headers" in websocket.scope:
+        headers = dict(websocket.scope["headers"])
+        auth_header = headers.get(b"authorization")
+        if auth_header and isinstance(auth_header, bytes) and auth_header.startswith(b"Bearer "):
+            token = auth_header.decode().split("Bearer ")[1].strip()
+    if not token:
+        return None
+    return await validate_token(token)
+
+async def get_steps_map(conn, testcase_id: str) -> dict:
+    """Return {step: arg} for a test case, or an empty dict if it has no steps."""
+    steps_row = await conn.fetchrow("SELECT steps, args FROM teststep WHERE testcaseid = $1", testcase_id)
+    if steps_row and steps_row["steps"]:
+        return dict(zip(steps_row["steps"], steps_row["args"]))
+    return {}
+
+async def build_testplan(conn, testcase_id: str) -> dict:
+    """Build the standard test plan (prerequisite steps + current BDD steps) for a test case."""
+    prereq_chain = await get_prereq_chain(conn, testcase_id)
+    testplan = {
+        "pretestid - steps": {},
+        "current testid": testcase_id,
+        "current - bdd steps": await get_steps_map(conn, testcase_id)
+    }
+    for tc_id in prereq_chain[:-1]:
+        steps = await get_steps_map(conn, tc_id)
+        if steps:
+            testplan["pretestid - steps"][tc_id] = steps
+    return testplan
@@ -0,0 +1,234 @@
+"""
+Execution Worker Node
+Claims script runs from the execution_job queue (routers/job_queue.py) and
+executes them with script_runner.run_local, i.e. on this node's context host,
+warm workers or fresh interpreters. Start as many as needed, on any machine
+that reaches the database and has the app and browsers installed at the same
+path as the API (keyword runner scripts import step_actions from there):
+
+    python -m app.worker    (from the repository root)
+    python worker.py        (from app/)
+
+WORKER_NODE_CONCURRENCY jobs run at once per node. Each running job's lease
+is renewed every third of EXECUTION_QUEUE_LEASE_SECONDS; a job that was
+cancelled by the API or taken over by another node is stopped. On SIGTERM
+running jobs are handed back to the queue.
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import asyncio
+import json
+import signal
+import socket
+import traceback
+from typing import List, Set
+
+import asyncpg
+
+import config
+import database
+import utils
+from routers import job_queue
+from routers.context_pool import context_pool
+from routers.script_runner import run_local
+from routers.worker_pool import worker_pool
+
+LOG_FLUSH_SECONDS = 0.2
+LOG_FLUSH_LINES = 100
+
+
+class LogForwarder:
+    """Batches a job's output lines into execution_job_log and notifies the API"""
+
+    def __init__(self, jobid: str):
+        self.jobid = jobid
+        self.lines: List[str] = []
+        self.lock = asyncio.Lock()
+
+    async def add(self, line: str):
+        self.lines.append(line)
+        if len(self.lines) >= LOG_FLUSH_LINES:
+            await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            if not self.lines:
+                return
+            batch, self.lines = self.lines, []
+            conn = await database.get_db_connection()
+            try:
+                await conn.executemany(
+                    "INSERT INTO execution_job_log (jobid, line) VALUES ($1, $2)",
+                    [(self.jobid, line) for line in batch]
+                )
+                await conn.execute("SELECT pg_notify($1, $2)", job_queue.LOG_CHANNEL, self.jobid)
+            finally:
+                await database.release_db_connection(conn)
+
+    async def flush_periodically(self):
+        while True:
+            await asyncio.sleep(LOG_FLUSH_SECONDS)
+            try:
+                await self.flush()
+            except Exception as e:
+                utils.logger.warning(f"[WORKER-NODE] Log forwarding for {self.jobid} failed: {str(e)}")
+
+
+class WorkerNode:
+    def __init__(self, worker_id: str, concurrency: int):
+        self.worker_id = worker_id
+        self.concurrency = max(1, concurrency)
+        self.lease_seconds = float(config.EXECUTION_QUEUE_LEASE_SECONDS)
+        self.wakeup = asyncio.Event()
+        self.lost: Set[str] = set()
+
+    def _on_queued(self, connection, pid, channel, payload):
+        self.wakeup.set()
+
+    async def claim(self):
+        conn = await database.get_db_connection()
+        try:
+            await conn.execute(job_queue.EXPIRE_SQL, config.EXECUTION_QUEUE_MAX_ATTEMPTS)
+            return await conn.fetchrow(
+                job_queue.CLAIM_SQL, self.worker_id, self.lease_seconds, config.EXECUTION_QUEUE_MAX_ATTEMPTS
+            )
+        finally:
+            await database.release_db_connection(conn)
+
+    async def heartbeat(self, jobid: str, run_task: asyncio.Task):
+        """Renew the lease; stop the run once the job is no longer ours"""
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                conn = await database.get_db_connection()
+                try:
+                    renewed = await conn.fetchval(job_queue.HEARTBEAT_SQL, jobid, self.worker_id, self.lease_seconds)
+                finally:
+                    await database.release_db_connection(conn)
+            except Exception as e:
+                # Keep running; if the database stays away the lease expires and the next renewal fails
+                utils.logger.warning(f"[WORKER-NODE] Heartbeat for {jobid} failed: {str(e)}")
+                continue
+            if not renewed:
+                utils.logger.warning(f"[WORKER-NODE] Job {jobid} was cancelled or taken over; stopping it")
+                self.lost.add(jobid)
+                run_task.cancel()
+                return
+
+    async def execute(self, job):
+        jobid = job["jobid"]
+        forwarder = LogForwarder(jobid)
+        if job["attempts"] > 1:
+            await forwarder.add(f"[QUEUE] Attempt {job['attempts']} on {self.worker_id}: the previous worker lost its lease")
+        utils.logger.info(f"[WORKER-NODE] Running job {jobid} (attempt {job['attempts']})")
+
+        run_task = asyncio.create_task(run_local(job["script"], on_line=forwarder.add))
+        helpers = [
+            asyncio.create_task(self.heartbeat(jobid, run_task)),
+            asyncio.create_task(forwarder.flush_periodically()),
+        ]
+        status, return_code, output, stdout, stderr, termination = "FAILED", 1, "", "", "", None
+        artifacts = []
+        try:
+            result = await run_task
+            status, return_code, termination = "COMPLETED", result.return_code, result.termination
+            output, stdout, stderr = result.output, result.stdout, result.stderr
+            artifacts = [ref.to_dict() for ref in result.artifacts]
+        except asyncio.CancelledError:
+            if jobid not in self.lost:
+                # Node shutting down
+                await self._release(jobid)
+                raise
+        except Exception:
+            output = stderr = traceback.format_exc()
+            await forwarder.add(output.rstrip())
+        finally:
+            for helper in helpers:
+                helper.cancel()
+
+        if jobid in self.lost:
+            self.lost.discard(jobid)
+            return
+        await forwarder.flush()
+        conn = await database.get_db_connection()
+        try:
+            await conn.execute(
+                job_queue.FINISH_SQL, jobid, self.worker_id, status, return_code, output, stdout, stderr, termination,
+                json.dumps(artifacts)
+            )
+            await conn.execute("SELECT pg_notify($1, $2)", job_queue.LOG_CHANNEL, jobid)
+        finally:
+            await database.release_db_connection(conn)
+        utils.logger.info(f"[WORKER-NODE] Job {jobid} finished with exit code {return_code}")
+
+    async def _release(self, jobid: str):
+        try:
+            conn = await database.get_db_connection()
+            try:
+                await conn.execute(job_queue.RELEASE_SQL, jobid, self.worker_id)
+            finally:
+                await database.release_db_connection(conn)
+        except Exception as e:
+            utils.logger.warning(f"[WORKER-NODE] Could not hand job {jobid} back: {str(e)}")
+
+    async def slot_loop(self):
+        while True:
+            try:
+                job = await self.claim()
+            except Exception as e:
+                utils.logger.warning(f"[WORKER-NODE] Claiming a job failed: {str(e)}")
+                job = None
+            if job is None:
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=config.EXECUTION_QUEUE_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self.execute(job)
+
+    async def serve(self, stop: asyncio.Event):
+        listener = await asyncpg.connect(config.DB_URL)
+        await listener.add_listener(job_queue.QUEUED_CHANNEL, self._on_queued)
+        slots = [asyncio.create_task(self.slot_loop()) for _ in range(self.concurrency)]
+        utils.logger.info(f"[WORKER-NODE] {self.worker_id} waiting for jobs ({self.concurrency} at a time)")
+        try:
+            await stop.wait()
+        finally:
+            for slot in slots:
+                slot.cancel()
+            await asyncio.gather(*slots, return_exceptions=True)
+            await listener.close()
+
+
+async def main():
+    await database.connect_db()
+    await database.ensure_schema()
+    if config.WORKER_POOL_SIZE > 0:
+        await worker_pool.start(config.WORKER_POOL_SIZE, config.WORKER_MAX_JOBS)
+    if config.CONTEXT_HOST_ENABLED:
+        await context_pool.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    node = WorkerNode(
+        config.WORKER_NODE_ID or f"{socket.gethostname()}-{os.getpid()}",
+        config.WORKER_NODE_CONCURRENCY
+    )
+    try:
+        await node.serve(stop)
+    finally:
+        await context_pool.stop()
+        await worker_pool.stop()
+        await database.disconnect_db()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,36 +1,76 @@
 # azure_openai_client.py
-from azure.identity import CertificateCredential, get_bearer_token_provider
-from openai import AzureOpenAI
+from azure.identity import CertificateCredential
+from openai import AsyncAzureOpenAI
+import asyncio
 import httpx
 import logging
+import time
 from config import Config
 
 logger = logging.getLogger(__name__)
 
-def get_azure_openai_client() -> AzureOpenAI:
-    # --- PROXY: Single URL (string) ---
-    http_client = None
+# Refresh the cached SPN token this many seconds before it expires
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+_client = None
+
+
+class CachedTokenProvider:
+    """
+    Async token provider that reuses the SPN token until it is close to expiry.
+    The credential is synchronous, so a refresh runs in a worker thread instead
+    of blocking the event loop.
+    """
+
+    def __init__(self, credential, scope: str):
+        self._credential = credential
+        self._scope = scope
+        self._token = None
+        self._lock = asyncio.Lock()
+
+    def _is_fresh(self) -> bool:
+        return self._token is not None and self._token.expires_on - TOKEN_REFRESH_MARGIN_SECONDS > time.time()
+
+    async def __call__(self) -> str:
+        if self._is_fresh():
+            return self._token.token
+        async with self._lock:
+            if not self._is_fresh():
+                self._token = await asyncio.to_thread(self._credential.get_token, self._scope)
+                logger.info("SPN token refreshed")
+            return self._token.token
+
+
+def get_azure_openai_client() -> AsyncAzureOpenAI:
+    """Return the process-wide client; built once, then reused for every request."""
+    global _client
+    if _client is not None:
+        return _client
+
+    # --- Shared connection pool (through the proxy when configured) ---
     proxy_url = Config.HTTPS_PROXY or Config.HTTP_PROXY
-    if proxy_url:
-        logger.info(f"Using proxy: {proxy_url}")
-        try:
-            transport = httpx.HTTPTransport(
+    try:
+        if proxy_url:
+            logger.info(f"Using proxy: {proxy_url}")
+            transport = httpx.AsyncHTTPTransport(
                 proxy=proxy_url,
                 verify=True,
-                # Increase connection timeout
                 limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
             )
-            http_client = httpx.Client(
-                transport=transport,
-                timeout=httpx.Timeout(60.0, connect=30.0),  # 60s read, 30s connect
-                verify=True
+        else:
+            logger.info("No proxy configured")
+            transport = httpx.AsyncHTTPTransport(
+                verify=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
             )
-            logger.info("Proxy client created with 60s timeout")
-        except Exception as e:
-            logger.error(f"Failed to create proxy client: {e}")
-            raise
-    else:
-        logger.info("No proxy configured")
+        http_client = httpx.AsyncClient(
+            transport=transport,
+            timeout=httpx.Timeout(60.0, connect=30.0),  # 60s read, 30s connect
+            verify=True
+        )
+    except Exception as e:
+        logger.error(f"Failed to create HTTP client: {e}")
+        raise
 
     # --- SPN Auth ---
     try:
@@ -39,16 +79,14 @@ def get_azure_openai_client() -> AzureOpenAI:
             client_id=Config.AZURE_CLIENT_ID,
             certificate_path=Config.CERTIFICATE_PATH
         )
-        token_provider = get_bearer_token_provider(
-            credential, "https://management.azure.com/.default"
-        )
+        token_provider = CachedTokenProvider(credential, "https://management.azure.com/.default")
         logger.info("SPN token provider ready")
     except Exception as e:
         logger.error(f"SPN auth failed: {e}")
         raise
 
     # --- Azure OpenAI Client with HIGH TIMEOUT ---
-    client = AzureOpenAI(
+    _client = AsyncAzureOpenAI(
         azure_endpoint=Config.AZURE_OPENAI_ENDPOINT,
         api_version="2024-08-01-preview",
         azure_ad_token_provider=token_provider,
@@ -58,4 +96,4 @@ def get_azure_openai_client() -> AzureOpenAI:
     )
 
     logger.info("Azure OpenAI client initialized with 300s timeout")
-    return client
+    return _client
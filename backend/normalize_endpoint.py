@@ -44,7 +44,7 @@ Output format:
 """
 
         client = get_azure_openai_client()
-        response = client.chat.completions.create(
+        response = await client.chat.completions.create(
             model=AZURE_OPENAI_DEPLOYMENT,
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,